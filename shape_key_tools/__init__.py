@@ -21,7 +21,7 @@ bl_info = {
 	"category": "Tools",
 }
 
-import sys, os, imp, types
+import sys, os, imp, types, io, time, tempfile, cProfile, pstats
 from types import SimpleNamespace
 
 import bpy, bpy.utils.previews
@@ -127,6 +127,106 @@ bpy.app.handlers.load_post.append(BlendFileOpenedWatcher)
 
 
 
+#
+#====================================================================================================
+#    Profiling
+#====================================================================================================
+#
+
+# Operator methods that are profiled when the "Profile Operators" addon preference is enabled
+ProfiledOpMethods = ("invoke", "execute", "modal")
+
+# The ProfileSession whose profiler is enabled right now. Only one profiler can be enabled at a time, so ops that run other ops are profiled as part of the outermost op.
+ActiveProfileSession = None
+
+### Gets this addon's preferences (an instance of ShapeKeyTools_AddonPreferences)
+def GetAddonPreferences():
+	return bpy.context.user_preferences.addons[__name__].preferences
+
+### cProfile stats of one run of an operator, accumulated across its invoke(), execute(), and all of its modal() events
+class ProfileSession():
+	def __init__(self, opIdName):
+		self.OpIdName = opIdName
+		self.Profiler = cProfile.Profile()
+		self.Calls = 0
+	
+	### Calls one of the operator's methods with the profiler enabled
+	def Run(self, method, op, args):
+		global ActiveProfileSession
+		
+		ActiveProfileSession = self
+		self.Profiler.enable()
+		try:
+			return method(op, *args)
+		finally:
+			self.Profiler.disable()
+			ActiveProfileSession = None
+			self.Calls += 1
+	
+	### Writes the stats to a .pstats file and prints the top functions to the console
+	# Params:
+	# - outputDir: Directory for the .pstats file. If empty, the system's temp directory is used.
+	# - topCount: Number of functions to print, both by own time and by cumulative time
+	# Returns the path of the .pstats file
+	def Finish(self, outputDir, topCount):
+		if (outputDir == ""):
+			outputDir = tempfile.gettempdir()
+		outputDir = bpy.path.abspath(outputDir)
+		if (not os.path.isdir(outputDir)):
+			os.makedirs(outputDir)
+		fileName = self.OpIdName.replace(".", "_") + "_" + time.strftime("%Y%m%d_%H%M%S")
+		path = os.path.join(outputDir, fileName + ".pstats")
+		copyNum = 1
+		while (os.path.exists(path)): # another run of the same operator finished in the same second
+			copyNum += 1
+			path = os.path.join(outputDir, fileName + "_" + str(copyNum) + ".pstats")
+		self.Profiler.dump_stats(path)
+		
+		summary = io.StringIO()
+		stats = pstats.Stats(self.Profiler, stream=summary)
+		stats.sort_stats("tottime").print_stats(topCount)
+		stats.sort_stats("cumulative").print_stats(topCount)
+		print("Shape Key Tools: profile of " + self.OpIdName + " (" + str(self.Calls) + " calls to invoke/execute/modal) written to " + path)
+		print(summary.getvalue())
+		return path
+
+def createProfiledMethod(opIdName, method):
+	def profiledMethod(self, context, *args):
+		session = getattr(self, "_ProfileSession", None)
+		if (session == None):
+			if (ActiveProfileSession != None or not GetAddonPreferences().opt_profile_ops):
+				return method(self, context, *args)
+			session = ProfileSession(opIdName)
+			self._ProfileSession = session
+		elif (session is ActiveProfileSession):
+			# Called by another profiled method of the same op (i.e. invoke() calling execute()), which is already being profiled
+			return method(self, context, *args)
+		
+		result = session.Run(method, self, (context,) + args)
+		
+		# The op is done once invoke(), execute(), or modal() returns anything but RUNNING_MODAL or PASS_THROUGH
+		# If invoke() opens a dialog (RUNNING_MODAL), the profile continues into the execute() that follows it
+		if ("FINISHED" in result or "CANCELLED" in result):
+			self._ProfileSession = None
+			prefs = GetAddonPreferences()
+			path = session.Finish(prefs.opt_profile_dir, prefs.opt_profile_top_count)
+			self.report({'INFO'}, "Profile written to " + path)
+		
+		return result
+	profiledMethod.__name__ = method.__name__
+	profiledMethod.__doc__ = method.__doc__
+	return profiledMethod
+
+### Wraps the invoke(), execute(), and modal() methods of an operator class (whichever it defines) so that they can be profiled
+# The wrappers only profile while the "Profile Operators" addon preference is enabled. Otherwise they just call the original methods.
+def ProfileOperatorClass(opCls):
+	for methodName in ProfiledOpMethods:
+		method = opCls.__dict__.get(methodName)
+		if (method != None):
+			setattr(opCls, methodName, createProfiledMethod(opCls.bl_idname, method))
+
+
+
 #
 #====================================================================================================
 #    Top level properties
@@ -332,6 +432,48 @@ class ShapeKeyTools_Properties(bpy.types.PropertyGroup):
 
 
 
+#
+#====================================================================================================
+#    Addon preferences
+#====================================================================================================
+#
+
+class ShapeKeyTools_AddonPreferences(bpy.types.AddonPreferences):
+	bl_idname = __name__
+	
+	opt_profile_ops = BoolProperty(
+		name = "Profile Operators",
+		description = "Run every Shape Key Tools operation under cProfile. When an operation finishes, its profile (including all of its modal steps) is saved as a .pstats file and a summary of the slowest functions is printed to the system console. Slows down all operations, so only enable this while gathering data for a bug report!",
+		default = False,
+	)
+	
+	opt_profile_dir = StringProperty(
+		name = "Profile Directory",
+		description = "Directory to save .pstats files in. Leave empty to use the system's temp directory",
+		default = "",
+		subtype = 'DIR_PATH',
+	)
+	
+	opt_profile_top_count = IntProperty(
+		name = "Summary Length",
+		description = "Number of functions to list in the console summary, both by their own time and by their cumulative time",
+		min = 1,
+		soft_max = 100,
+		default = 25,
+	)
+	
+	def draw(self, context):
+		layout = self.layout
+		
+		profiling = layout.box().column()
+		profiling.prop(self, "opt_profile_ops")
+		profilingOpts = profiling.column()
+		profilingOpts.prop(self, "opt_profile_dir")
+		profilingOpts.prop(self, "opt_profile_top_count")
+		profilingOpts.enabled = self.opt_profile_ops
+
+
+
 #
 #====================================================================================================
 #    Ops panel
@@ -562,11 +704,12 @@ class OBJECT_PT_ShapeKeyTools_Panel(bpy.types.Panel):
 					unmergedPairKeysL.label("Unmerged L+R Pairs")
 					unmergedPairCount = 0
 					seen = {}
+					nameIndex = common.ShapeKeyNameIndex(obj)
 					for keyBlock in obj.data.shape_keys.key_blocks:
 						if (not keyBlock.name in seen):
 							seen[keyBlock.name] = True
 							(firstName, expectedCompName, mergedName) = common.FindShapeKeyMergeNames(keyBlock.name)
-							if (not expectedCompName in seen and expectedCompName in obj.data.shape_keys.key_blocks.keys()):
+							if (not expectedCompName in seen and expectedCompName in nameIndex):
 								seen[expectedCompName] = True
 								unmergedPairCount += 1
 					unmergedPairKeysR.label(str(unmergedPairCount))
@@ -575,6 +718,26 @@ class OBJECT_PT_ShapeKeyTools_Panel(bpy.types.Panel):
 			except Exception as e:
 				g4Body.label(str(e), icon="CANCEL")
 				raise
+			# Timings of the most recent operations (on any object)
+			recentOps = g4Body.box().column()
+			recentOpsHeader = recentOps.row()
+			recentOpsHeaderL = recentOpsHeader.row()
+			recentOpsHeaderR = recentOpsHeader.row()
+			recentOpsHeaderL.alignment = "LEFT"
+			recentOpsHeaderR.alignment = "RIGHT"
+			recentOpsHeaderL.label("Recent Operations")
+			recentOpsHeaderR.operator("wm.shape_key_tools_copy_operation_metrics", text="", icon="COPYDOWN")
+			if (len(common.OperationMetricsHistory) > 0):
+				for metrics in reversed(common.OperationMetricsHistory):
+					recentOpRow = recentOps.row()
+					recentOpL = recentOpRow.row()
+					recentOpR = recentOpRow.row()
+					recentOpL.alignment = "LEFT"
+					recentOpR.alignment = "RIGHT"
+					recentOpL.label(metrics.OpName)
+					recentOpR.label(("%.2f" % metrics.Seconds) + " s, " + common.FormatCount(metrics.Throughput()) + " verts/s")
+			else:
+				recentOps.label("None yet")
 		
 
 
@@ -603,6 +766,8 @@ def register():
 		if (os.path.isfile(fullpath)): # dont import the pycache folder
 			script = imp.load_source("ops." + filename[:-3], fullpath)
 			operatorClass = script.register()
+			if (not filename.startswith("internal_")): # the internal background ops run until the addon is disabled, so they would never finish a profile
+				ProfileOperatorClass(operatorClass)
 			info = SimpleNamespace()
 			info.Script = script
 			info.OpClass = operatorClass
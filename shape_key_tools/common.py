@@ -5,9 +5,156 @@
 # //
 # ////////////////////////////////////////////////////////////////////////////////////////////////////
 
-import sys, os, math, mathutils
+import sys, os, math, time, json, array, shutil, zlib
 import bpy
 
+try:
+	import numpy as np
+except ImportError: # Blender has bundled numpy since 2.70, but custom builds may omit it
+	np = None
+
+# All of the shape key math and name logic lives in core, which works on plain arrays and does not need Blender. The functions here adapt it to Blender objects and shape keys.
+from . import core
+
+
+#
+#====================================================================================================
+#    Kernel engines
+#====================================================================================================
+#
+
+# Implementation used by the shape key kernels below
+# - "numpy": Reads and writes whole shape keys at once with foreach_get/foreach_set and does all the per-vertex math as array operations
+# - "legacy": The original per-vertex python loop. Much slower on dense meshes, but kept as a fallback and for comparing results against the numpy engine.
+#   The numpy engine intentionally differs from it in two places: pair splits start from the split shape key instead of the current shape key mix (from_mix=True),
+#   and the multiply and divide blend modes work per component instead of with mathutils' Vector * Vector (a dot product) and Vector / Vector (a TypeError in Blender 2.79).
+KernelEngine = ("numpy" if np else "legacy")
+
+### Determines which kernel engine to use for an operation
+# If engine = None, the module-wide KernelEngine is used
+def ResolveKernelEngine(engine=None):
+	if (engine == None):
+		engine = KernelEngine
+	if (engine == "numpy" and np == None):
+		engine = "legacy"
+	return engine
+
+
+
+#
+#====================================================================================================
+#    Tracing
+#====================================================================================================
+#
+
+# Environment variable with the directory that the batch operators write their trace files into. Tracing is off while it is unset or empty.
+# It is read whenever a batch operator starts, so it can be set before starting Blender or from Blender's python console.
+TraceDirectoryVariable = "SHAPE_KEY_TOOLS_TRACE_DIR"
+
+# The TraceRecorder that TraceSpan() records into, or None when no operator is being traced
+ActiveTrace = None
+
+### Collects timed spans in the Trace Event Format, for viewing in chrome://tracing or https://ui.perfetto.dev
+# Spans with the "modal" category are one modal event each. The time between two of them (the pacing idles, where Blender redraws the UI and waits for the next timer event) is recorded as an "idle" span.
+# Params:
+# - name: Name of the traced operator
+# - directory: Directory to write the trace file into
+class TraceRecorder():
+	def __init__(self, name, directory):
+		self.Name = name
+		self.Directory = directory
+		self.Events = []
+		self.Pid = os.getpid()
+		self.StartTime = time.perf_counter()
+		self.LastModalEnd = None
+	
+	### Microseconds since the trace began
+	def Now(self):
+		return (time.perf_counter() - self.StartTime) * 1e6
+	
+	def AddSpan(self, name, category, start, end, args=None):
+		event = {"name": name, "cat": category, "ph": "X", "ts": start, "dur": end - start, "pid": self.Pid, "tid": 0}
+		if (args != None):
+			event["args"] = args
+		self.Events.append(event)
+	
+	def Save(self, path):
+		with open(path, "w") as f:
+			json.dump({"traceEvents": self.Events, "displayTimeUnit": "ms", "otherData": {"operator": self.Name, "engine": ResolveKernelEngine()}}, f)
+
+class traceSpan():
+	def __init__(self, recorder, name, category, args):
+		self.Recorder = recorder
+		self.Name = name
+		self.Category = category
+		self.Args = args
+	
+	def __enter__(self):
+		recorder = self.Recorder
+		self.Start = recorder.Now()
+		if (self.Category == "modal" and recorder.LastModalEnd != None):
+			recorder.AddSpan("Waiting for modal event", "idle", recorder.LastModalEnd, self.Start)
+		return self
+	
+	def __exit__(self, excType, excValue, excTraceback):
+		end = self.Recorder.Now()
+		self.Recorder.AddSpan(self.Name, self.Category, self.Start, end, self.Args)
+		if (self.Category == "modal"):
+			self.Recorder.LastModalEnd = end
+		return False
+
+class nullTraceSpan():
+	def __enter__(self):
+		return self
+	
+	def __exit__(self, excType, excValue, excTraceback):
+		return False
+
+NullTraceSpan = nullTraceSpan()
+
+### Times a block of code into the active trace: "with TraceSpan(name, category):"
+# Does nothing (and costs next to nothing) when no trace is active
+# Params:
+# - name: Name of the span, shown on its bar in the trace viewer
+# - category: One of "modal" (a whole modal event), "kernel" (shape key math + reading/writing shape key data), "bpy.ops" (an operator call), or "bpy" (any other slow Blender API call)
+# - (optional) args: Dictionary of extra info to show with the span
+def TraceSpan(name, category, args=None):
+	if (ActiveTrace == None):
+		return NullTraceSpan
+	return traceSpan(ActiveTrace, name, category, args)
+
+### Starts tracing an operator if tracing is enabled and nothing else is being traced already
+# Returns the new TraceRecorder (to pass to EndTrace() later), or None if this operator is not being traced
+def BeginTrace(opName):
+	global ActiveTrace
+	
+	directory = (os.environ.get(TraceDirectoryVariable) or None)
+	if (directory == None or ActiveTrace != None):
+		return None
+	ActiveTrace = TraceRecorder(opName, directory)
+	return ActiveTrace
+
+### Stops a trace started by BeginTrace() and writes it to a new file in its directory
+# Returns the path of the trace file, or None if recorder is None
+def EndTrace(recorder):
+	global ActiveTrace
+	
+	if (recorder == None):
+		return None
+	if (ActiveTrace is recorder):
+		ActiveTrace = None
+	if (not os.path.isdir(recorder.Directory)):
+		os.makedirs(recorder.Directory)
+	fileName = "".join((c if c.isalnum() else "_") for c in recorder.Name) + "_" + time.strftime("%Y%m%d_%H%M%S") + ".json"
+	path = os.path.join(recorder.Directory, fileName)
+	copyNum = 1
+	while (os.path.exists(path)): # another trace of the same operator finished in the same second
+		copyNum += 1
+		path = os.path.join(recorder.Directory, fileName[:-5] + "_" + str(copyNum) + ".json")
+	recorder.Save(path)
+	return path
+
+
 
 #
 #====================================================================================================
@@ -15,9 +162,28 @@ import bpy
 #====================================================================================================
 #
 
-### Simple bezier interpolation for values in 0-1
-def InterpBezier(x):
-	return (3.0 * x * x) - (2.0 * x * x * x)
+InterpBezier = core.InterpBezier
+GetSplitAxis = core.GetSplitAxis
+
+### Reads the vertex positions of a shape key's data (or of mesh.vertices) into an (n, 3) float32 array with a single foreach_get()
+def ReadCoords(verts):
+	coords = np.empty(len(verts) * 3, dtype=np.float32)
+	verts.foreach_get("co", coords)
+	return coords.reshape(-1, 3)
+
+### Writes an (n, 3) array of vertex positions into a shape key's data (or into mesh.vertices) with a single foreach_set()
+def WriteCoords(verts, coords):
+	verts.foreach_set("co", np.ascontiguousarray(coords, dtype=np.float32).ravel())
+
+### Reads the vertex positions of a shape key's data (or of mesh.vertices) into a list of (x, y, z) tuples with a single foreach_get(). Does not need numpy.
+def ReadCoordsList(verts):
+	flatCoords = [0.0] * (len(verts) * 3)
+	verts.foreach_get("co", flatCoords)
+	return list(zip(flatCoords[0::3], flatCoords[1::3], flatCoords[2::3]))
+
+### Writes a list of (x, y, z) tuples into a shape key's data (or into mesh.vertices) with a single foreach_set(). Does not need numpy.
+def WriteCoordsList(verts, coords):
+	verts.foreach_set("co", [c for co in coords for c in co])
 
 
 
@@ -27,54 +193,517 @@ def InterpBezier(x):
 #====================================================================================================
 #
 
+### Map of the object's shape key names to their indices in the shape key list
+# Building one costs a single key_blocks.keys() call. After that, every name lookup and conflict check is O(1) for as long as all shape keys are added, removed, and moved through it.
+class ShapeKeyNameIndex():
+	def __init__(self, obj):
+		self.Obj = obj
+		self.Refresh()
+	
+	### Rereads the object's shape key list. Only needed if the shape keys were changed by something other than this index.
+	def Refresh(self):
+		self.Names = []
+		if (hasattr(self.Obj.data.shape_keys, "key_blocks")):
+			self.Names = self.Obj.data.shape_keys.key_blocks.keys()
+		self.Indices = {}
+		self.reindex(0)
+	
+	def reindex(self, start):
+		for i in range(start, len(self.Names)):
+			self.Indices[self.Names[i]] = i
+	
+	def __contains__(self, name):
+		return (name in self.Indices)
+	
+	def __len__(self):
+		return len(self.Names)
+	
+	### Gets the index of the named shape key
+	def IndexOf(self, name):
+		return self.Indices[name]
+	
+	### Makes the named shape key the active shape key
+	def Activate(self, name):
+		self.Obj.active_shape_key_index = self.Indices[name]
+	
+	### Adds a new shape key to the end of the shape key list (with obj.shape_key_add()) and returns it
+	def AddShapeKey(self, name, fromMix=False):
+		with TraceSpan("Object.shape_key_add", "bpy"):
+			keyBlock = self.Obj.shape_key_add(name=str(name), from_mix=fromMix)
+		self.Names.append(keyBlock.name)
+		self.Indices[keyBlock.name] = len(self.Names) - 1
+		return keyBlock
+	
+	### Removes the named shape key (with bpy.ops.object.shape_key_remove())
+	def RemoveShapeKey(self, name):
+		self.Activate(name)
+		with TraceSpan("object.shape_key_remove", "bpy.ops"):
+			bpy.ops.object.shape_key_remove()
+		index = self.Indices.pop(name)
+		del self.Names[index]
+		self.reindex(index)
+	
+	### Moves the named shape key (with bpy.ops.object.shape_key_move()). moveType is "TOP", "BOTTOM", "UP", or "DOWN".
+	def MoveShapeKey(self, name, moveType):
+		self.Activate(name)
+		with TraceSpan("object.shape_key_move", "bpy.ops", {"type": moveType}):
+			bpy.ops.object.shape_key_move(type=moveType)
+		# Same rules as shape_key_move_exec() in Blender's object_shapekey.c
+		index = self.Indices[name]
+		total = len(self.Names)
+		if (moveType == "TOP"):
+			newIndex = 1
+			if (index == 0 or index == 1):
+				newIndex = 0
+		elif (moveType == "BOTTOM"):
+			newIndex = total - 1
+		elif (moveType == "UP"):
+			newIndex = (total + index - 1) % total
+		else:
+			newIndex = (index + 1) % total
+		self.Names.insert(newIndex, self.Names.pop(index))
+		self.reindex(min(index, newIndex))
+
+
 ### Validates the provided shape key name as non-existent and modifies it with Blender's .001, .002, etc styling if it does exist
-def ValidateShapeKeyName(obj, name):		
-	if (not hasattr(obj.data.shape_keys, "key_blocks") or len(obj.data.shape_keys.key_blocks.keys()) == 0): # no shape keys
-		return name, 0
+# If nameIndex (a ShapeKeyNameIndex for obj) is provided, it will be used instead of reading the object's shape key list
+def ValidateShapeKeyName(obj, name, nameIndex=None):
+	if (nameIndex == None):
+		nameIndex = ShapeKeyNameIndex(obj)
+	
+	return core.ValidateName(name, nameIndex)
+
+
+
+#
+#====================================================================================================
+#    Shape Key Order
+#====================================================================================================
+#
+
+PlanShapeKeyReorder = core.PlanShapeKeyReorder
+
+### Rearranges the object's shape key list into the target order, using as few bpy.ops.object.shape_key_move() calls as possible
+# The active shape key is changed by this. Callers should set it afterwards as desired.
+# Params:
+# - obj: The object whose shape keys will be reordered
+# - targetOrder: List of the names of all of the object's shape keys, in the desired order
+# - (optional) nameIndex: ShapeKeyNameIndex for obj to use and keep in sync
+def ReorderShapeKeys(obj, targetOrder, nameIndex=None):
+	if (nameIndex == None):
+		nameIndex = ShapeKeyNameIndex(obj)
+	
+	with TraceSpan("Plan shape key reorder", "kernel"):
+		moves = PlanShapeKeyReorder(nameIndex.Names, targetOrder)
+	for (shapeKeyName, moveType) in moves:
+		if (moveType == "TOP" and nameIndex.IndexOf(shapeKeyName) == 1): # already where TOP would put it, and TOP on key 1 would make it the new basis
+			continue
+		nameIndex.MoveShapeKey(shapeKeyName, moveType)
+
+### Moves one or more shape keys to sit (in the given order) directly after another shape key
+# Params:
+# - obj: The object whose shape keys will be moved
+# - shapeKeyNames: List of the names of the shape keys to move
+# - afterShapeKeyName: Name of the shape key to move them after
+# - (optional) nameIndex: ShapeKeyNameIndex for obj to use and keep in sync
+def MoveShapeKeysAfter(obj, shapeKeyNames, afterShapeKeyName, nameIndex=None):
+	if (nameIndex == None):
+		nameIndex = ShapeKeyNameIndex(obj)
+	
+	targetOrder = [name for name in nameIndex.Names if not name in shapeKeyNames]
+	insertIndex = targetOrder.index(afterShapeKeyName) + 1
+	targetOrder[insertIndex:insertIndex] = shapeKeyNames
+	ReorderShapeKeys(obj, targetOrder, nameIndex)
+
+
+
+#
+#====================================================================================================
+#    Snapshots
+#====================================================================================================
+#
+
+### Copy of an object's shape keys for rolling back an operation that the user cancelled partway through
+# The shape key order, the active shape key, and the relative keys of all shape keys are always saved. Vertex positions and settings are only saved for the named shape keys (the ones the operation may change or delete), as one float32 array per shape key.
+# Params:
+# - obj: The object whose shape keys to save
+# - shapeKeyNames: Names of the shape keys whose vertex positions and settings to save
+class ShapeKeySnapshot():
+	# Shape key settings which are saved along with the vertex positions
+	SavedSettings = ("slider_min", "slider_max", "value", "interpolation", "vertex_group", "mute")
+	
+	def __init__(self, obj, shapeKeyNames):
+		self.Obj = obj
+		keyBlocks = obj.data.shape_keys.key_blocks
+		self.Names = keyBlocks.keys()
+		self.ActiveIndex = obj.active_shape_key_index
+		self.RelativeKeys = {}
+		for keyBlock in keyBlocks:
+			self.RelativeKeys[keyBlock.name] = keyBlock.relative_key.name
+		
+		self.Keys = {}
+		with TraceSpan("Snapshot shape keys", "kernel", {"count": len(shapeKeyNames)}):
+			for name in shapeKeyNames:
+				keyBlock = keyBlocks[name]
+				if (np != None):
+					coords = ReadCoords(keyBlock.data)
+				else:
+					coords = ReadCoordsList(keyBlock.data)
+				settings = {}
+				for attr in self.SavedSettings:
+					settings[attr] = getattr(keyBlock, attr)
+				self.Keys[name] = (coords, settings)
+	
+	### Puts the object's shape keys back the way they were when the snapshot was taken
+	# Shape keys that were added since are removed, saved shape keys that were deleted since are re-added, and then the saved vertex positions, settings, relative keys, order, and active shape key are restored.
+	def Restore(self):
+		obj = self.Obj
+		nameIndex = ShapeKeyNameIndex(obj)
+		
+		# Remove the new shape keys
+		for name in list(nameIndex.Names):
+			if (not name in self.RelativeKeys):
+				nameIndex.RemoveShapeKey(name)
+		
+		# Re-add the deleted shape keys and restore the saved vertex positions and settings
+		keyBlocks = obj.data.shape_keys.key_blocks
+		with TraceSpan("Restore shape keys", "kernel", {"count": len(self.Keys)}):
+			for (name, (coords, settings)) in self.Keys.items():
+				if (name in nameIndex):
+					keyBlock = keyBlocks[nameIndex.IndexOf(name)]
+				else:
+					keyBlock = nameIndex.AddShapeKey(name)
+				if (np != None):
+					WriteCoords(keyBlock.data, coords)
+				else:
+					WriteCoordsList(keyBlock.data, coords)
+				for (attr, value) in settings.items():
+					setattr(keyBlock, attr, value)
+		
+		# Removing shape keys resets the relative key of any shape keys that were relative to them, so all relative keys are restored
+		for keyBlock in keyBlocks:
+			relKeyName = self.RelativeKeys.get(keyBlock.name)
+			if (relKeyName in nameIndex):
+				keyBlock.relative_key = keyBlocks[nameIndex.IndexOf(relKeyName)]
+		
+		ReorderShapeKeys(obj, [name for name in self.Names if name in nameIndex], nameIndex)
+		obj.active_shape_key_index = self.ActiveIndex
+
+
+
+#
+#====================================================================================================
+#    Modifier evaluation
+#====================================================================================================
+#
+
+### Evaluates an object's modifiers on the given vertex positions, using the object as a reusable scratch object
+# The scratch object's mesh must not have any shape keys, and its vertex positions are overwritten. Only the modifiers which are enabled in the viewport are evaluated.
+# Params:
+# - scratchObj: The object whose modifiers to evaluate
+# - coords: Vertex positions to evaluate the modifiers on. An (n, 3) array for the numpy kernel engine, or a list of (x, y, z) tuples for the legacy engine.
+# - scene: The scene to evaluate the modifiers in
+# - (optional) engine: Kernel engine to use ("numpy" or "legacy"). Defaults to KernelEngine.
+# Returns the evaluated vertex positions, in the same form as coords
+def EvaluateModifiers(scratchObj, coords, scene, engine=None):
+	engine = ResolveKernelEngine(engine)
+	mesh = scratchObj.data
+	
+	if (engine == "numpy"):
+		WriteCoords(mesh.vertices, coords)
 	else:
-		newName = name
-		conflict = (newName in obj.data.shape_keys.key_blocks.keys())
-		numConflicts = 0
-		while (conflict):
-			numConflicts += 1
-			if (numConflicts <= 999):
-				newName = name + "." + "{:03d}".format(numConflicts)
+		WriteCoordsList(mesh.vertices, coords)
+	mesh.update() # recalculates the normals, which some modifiers (i.e. Displace along normals) use
+	
+	with TraceSpan("Object.to_mesh", "bpy"):
+		evaluatedMesh = scratchObj.to_mesh(scene, True, "PREVIEW", calc_tessface=False)
+	try:
+		if (len(evaluatedMesh.vertices) != len(mesh.vertices)):
+			raise RuntimeError("The modifiers on '" + scratchObj.name + "' changed its vertex count")
+		if (engine == "numpy"):
+			evaluatedCoords = ReadCoords(evaluatedMesh.vertices)
+		else:
+			evaluatedCoords = ReadCoordsList(evaluatedMesh.vertices)
+	finally:
+		bpy.data.meshes.remove(evaluatedMesh)
+	
+	return evaluatedCoords
+
+CreateLinearMapProbes = core.CreateLinearMapProbes
+FitPerVertexLinearMap = core.FitPerVertexLinearMap
+ApplyPerVertexLinearMap = core.ApplyPerVertexLinearMap
+BuildSkinningMatrices = core.BuildSkinningMatrices
+ComposeSkinningMatrices = core.ComposeSkinningMatrices
+FindAffectedVerts = core.FindAffectedVerts
+PackDisjointShapeKeys = core.PackDisjointShapeKeys
+
+# Gets the size (bounding box diagonal) of an (n, 3) array of vertex positions, or 1 if it has no size
+def measureMeshSize(coords):
+	if (len(coords) == 0):
+		return 1.0
+	return float(np.linalg.norm(coords.max(axis=0) - coords.min(axis=0))) or 1.0
+
+### A per-vertex linear map fit to the modifiers on a scratch object, which applies them to any number of shape keys at once without evaluating them again
+# This is only accurate for modifiers that act on each vert like an affine map (i.e. Armature, Hook, Lattice), so check it with Error() against a full evaluation of a few shape keys before trusting it. Needs numpy.
+# Params:
+# - scratchObj: The object whose modifiers to fit the map to, as for EvaluateModifiers()
+# - basisCoords: (n, 3) array of the basis shape key's vertex positions
+# - scene: The scene to evaluate the modifiers in
+# - probeStep: Step to probe the modifiers with, as a fraction of the size (bounding box diagonal) of the basis
+class ModifierLinearMap():
+	def __init__(self, scratchObj, basisCoords, scene, probeStep):
+		self.BasisCoords = basisCoords
+		self.Size = measureMeshSize(basisCoords)
+		
+		# 4 evaluations of the modifiers, no matter how many shape keys there are
+		probes = CreateLinearMapProbes(basisCoords, self.Size * probeStep)
+		deformedProbes = [EvaluateModifiers(scratchObj, probe, scene, "numpy") for probe in probes]
+		self.DeformedBasisCoords = deformedProbes[0]
+		self.Jacobians = FitPerVertexLinearMap(probes, deformedProbes)
+	
+	### Returns how far the verts of a shape key move from the basis, at most
+	def DeltaSize(self, coords):
+		if (len(coords) == 0):
+			return 0.0
+		return float(np.abs(coords - self.BasisCoords).max())
+	
+	### Returns the largest difference between the map's result for a shape key and the full evaluation of the modifiers on it, as a fraction of the size of the basis
+	def Error(self, coords, evaluatedCoords):
+		if (len(coords) == 0):
+			return 0.0
+		return float(np.abs(self.Apply(coords[None])[0] - evaluatedCoords).max()) / self.Size
+	
+	### Applies the modifiers to a (k, n, 3) array of shape keys' vertex positions. Returns a (k, n, 3) float32 array.
+	def Apply(self, keyCoords):
+		return ApplyPerVertexLinearMap(self.Jacobians, self.BasisCoords, self.DeformedBasisCoords, keyCoords)
+
+### Checks whether ArmatureLinearMap can reproduce the specified modifiers of an object
+# They must all be Armature modifiers that deform with vertex groups only: no bone envelopes, Preserve Volume (dual quaternions), Multi Modifier, or B-Bones with segments
+# Returns None if it can, or the reason why not
+def FindArmatureSkinningProblem(obj, modifierNames):
+	if (np == None):
+		return "numpy is not available"
+	
+	for modifierName in modifierNames:
+		modifier = obj.modifiers[modifierName]
+		if (modifier.type != "ARMATURE"):
+			return "'" + modifierName + "' is not an Armature modifier"
+		armatureObj = modifier.object
+		if (armatureObj == None or armatureObj.type != "ARMATURE"):
+			return "'" + modifierName + "' has no armature object"
+		if (modifier.use_bone_envelopes):
+			return "'" + modifierName + "' uses bone envelopes"
+		if (modifier.use_deform_preserve_volume):
+			return "'" + modifierName + "' uses Preserve Volume"
+		if (modifier.use_multi_modifier):
+			return "'" + modifierName + "' uses Multi Modifier"
+		if (modifier.use_vertex_groups):
+			for vertexGroup in obj.vertex_groups:
+				poseBone = armatureObj.pose.bones.get(vertexGroup.name)
+				if (poseBone != None and poseBone.bone.use_deform and poseBone.bone.bbone_segments > 1):
+					return "bone '" + poseBone.name + "' of '" + modifierName + "' is a B-Bone with segments"
+	
+	return None
+
+### A ModifierLinearMap for Armature modifiers, which is built from the bones' pose matrices and the mesh's vertex group weights instead of by evaluating the modifiers
+# The modifiers are reproduced exactly with linear blend skinning, so no shape keys need to be evaluated in full. Check it with Error() against Blender's result on the base mesh anyway, in case of differences from Blender that FindArmatureSkinningProblem() does not catch.
+# Params:
+# - obj: The object whose modifiers to build the map from. FindArmatureSkinningProblem() must return None for it first.
+# - modifierNames: Names of the Armature modifiers, in stack order
+# - basisCoords: (n, 3) array of the basis shape key's vertex positions
+class ArmatureLinearMap(ModifierLinearMap):
+	def __init__(self, obj, modifierNames, basisCoords):
+		self.BasisCoords = basisCoords
+		self.Size = measureMeshSize(basisCoords)
+		
+		# The bone weights are read once for all of the modifiers
+		groupIndex = VertexGroupIndex(obj)
+		
+		matrices = None
+		for modifierName in modifierNames:
+			modifier = obj.modifiers[modifierName]
+			armatureObj = modifier.object
+			
+			# The deform matrix of each bone that has a vertex group on the mesh
+			boneMatrices = {}
+			if (modifier.use_vertex_groups):
+				for vertexGroup in obj.vertex_groups:
+					poseBone = armatureObj.pose.bones.get(vertexGroup.name)
+					if (poseBone != None and poseBone.bone.use_deform):
+						boneMatrices[vertexGroup.index] = np.dot(np.array(poseBone.matrix), np.linalg.inv(np.array(poseBone.bone.matrix_local)))
+			
+			meshToArmature = np.dot(np.linalg.inv(np.array(armatureObj.matrix_world)), np.array(obj.matrix_world))
+			
+			maskWeights = None
+			if (modifier.vertex_group in obj.vertex_groups):
+				maskIndex = obj.vertex_groups[modifier.vertex_group].index
+				maskWeights = np.zeros(len(basisCoords), dtype=np.float64)
+				maskWeights[groupIndex.GetVertIndices(maskIndex)] = groupIndex.GetWeights(maskIndex)
+				if (modifier.invert_vertex_group):
+					maskWeights = 1.0 - maskWeights
+			
+			modifierMatrices = BuildSkinningMatrices(groupIndex, boneMatrices, meshToArmature, maskWeights)
+			if (matrices is None):
+				matrices = modifierMatrices
 			else:
-				newName = name + "." + str(numConflicts)
-			conflict = (newName in obj.data.shape_keys.key_blocks.keys())
-		return newName
+				matrices = ComposeSkinningMatrices(modifierMatrices, matrices)
+		
+		self.Jacobians = matrices[:, :, :3]
+		self.DeformedBasisCoords = (np.einsum("nij,nj->ni", self.Jacobians, basisCoords) + matrices[:, :, 3]).astype(np.float32)
 
 
 
 #
 #====================================================================================================
-#    Vertex Filtering
+#    Checkpoints
 #====================================================================================================
 #
 
-### Creates a vertex filtering kernel function per the provided parameters
-def CreateVertexFilterKernel(params):
-	deltaDistanceMin = 0
-	if ("DeltaDistanceMin" in params):
-		deltaDistanceMin = params["DeltaDistanceMin"]
+### Progress of a long-running operator, saved to a sidecar directory next to the .blend file as it goes, so that the operator can resume after a crash
+# The progress is a JSON-compatible state dict, plus the vertex positions of each finished shape key. Those are written as raw float32 files, which can be read and written with or without numpy.
+# Checkpoints are only possible once the .blend file has been saved, since there is nowhere to put them before then (Directory is None).
+# Params:
+# - name: Name of the operation, as part of the directory name
+# - obj: The object that the operator works on
+class ShapeKeyCheckpoint():
+	def __init__(self, name, obj):
+		self.Directory = None
+		if (bpy.data.filepath != ""):
+			cleanName = "".join((c if (c.isalnum() or c in "-_") else "_") for c in (name + "_" + obj.name))
+			self.Directory = bpy.data.filepath + "." + cleanName + ".checkpoint"
+	
+	def statePath(self):
+		return os.path.join(self.Directory, "state.json")
+	
+	def coordsPath(self, shapeKeyIndex):
+		return os.path.join(self.Directory, "shape_key_" + str(shapeKeyIndex) + ".f32")
 	
-	deltaDistanceMax = sys.float_info.max
-	if ("DeltaDistanceMax" in params):
-		deltaDistanceMax = params["DeltaDistanceMax"]
+	### Loads the saved state dict, or returns None if there is no checkpoint (or it can't be read)
+	def Load(self):
+		if (self.Directory == None or not os.path.isfile(self.statePath())):
+			return None
+		try:
+			with open(self.statePath(), "r") as f:
+				state = json.load(f)
+		except (OSError, ValueError):
+			return None
+		if (not isinstance(state, dict)):
+			return None
+		return state
 	
-	vertexGroupIndex = None
-	if ("VertexGroupIndex" in params):
-		vertexGroupIndex = int(params["VertexGroupIndex"], 10) # int() because blender requires a string identifier for EnumProperty value IDs (numbers cause silent errors)
+	### Saves the state dict, replacing the old one in a single step so that a crash can't leave a half-written state behind
+	def Save(self, state):
+		if (self.Directory == None):
+			return
+		if (not os.path.isdir(self.Directory)):
+			os.makedirs(self.Directory)
+		tempPath = self.statePath() + ".tmp"
+		with open(tempPath, "w") as f:
+			json.dump(state, f)
+		os.replace(tempPath, self.statePath())
 	
-	def filter(vertVGIndices, delta):
-		return (
-			(delta.length >= deltaDistanceMin and delta.length <= deltaDistanceMax)
-			and
-			(vertexGroupIndex == None or vertexGroupIndex in vertVGIndices)
-		)
+	### Saves the vertex positions of a finished shape key. Save them before the state that refers to them.
+	# Params:
+	# - shapeKeyIndex: Index of the shape key
+	# - coords: Vertex positions, as an (n, 3) array for the numpy kernel engine or a list of (x, y, z) tuples for the legacy engine
+	# - (optional) engine: Kernel engine to use ("numpy" or "legacy"). Defaults to KernelEngine.
+	def SaveCoords(self, shapeKeyIndex, coords, engine=None):
+		if (self.Directory == None):
+			return
+		if (not os.path.isdir(self.Directory)):
+			os.makedirs(self.Directory)
+		with open(self.coordsPath(shapeKeyIndex), "wb") as f:
+			if (ResolveKernelEngine(engine) == "numpy"):
+				np.ascontiguousarray(coords, dtype=np.float32).tofile(f)
+			else:
+				array.array("f", [c for co in coords for c in co]).tofile(f)
 	
-	return filter
+	### Loads the vertex positions saved by SaveCoords(), in the same form
+	def LoadCoords(self, shapeKeyIndex, engine=None):
+		path = self.coordsPath(shapeKeyIndex)
+		if (ResolveKernelEngine(engine) == "numpy"):
+			return np.fromfile(path, dtype=np.float32).reshape(-1, 3)
+		else:
+			flatCoords = array.array("f")
+			with open(path, "rb") as f:
+				flatCoords.frombytes(f.read())
+			return list(zip(flatCoords[0::3], flatCoords[1::3], flatCoords[2::3]))
 	
+	### Deletes the checkpoint, if there is one
+	def Delete(self):
+		if (self.Directory != None and os.path.isdir(self.Directory)):
+			shutil.rmtree(self.Directory, ignore_errors=True)
+
+### Computes a cheap fingerprint (CRC-32) of an object's shape keys and modifiers, to tell whether they were edited since a checkpoint was saved
+# Covers the vertex positions, relative key and pose parameters of every shape key, and every setting of the named modifiers. Pointer settings (i.e. an Armature modifier's object) are covered by the name of what they point to.
+# Params:
+# - obj: The object whose shape keys and modifiers are fingerprinted
+# - modifierNames: Names of the modifiers to include
+# - (optional) engine: Kernel engine to use ("numpy" or "legacy"). Defaults to KernelEngine.
+def ComputeCheckpointFingerprint(obj, modifierNames, engine=None):
+	engine = ResolveKernelEngine(engine)
+	crc = 0
+	for keyBlock in obj.data.shape_keys.key_blocks:
+		if (engine == "numpy"):
+			crc = zlib.crc32(ReadCoords(keyBlock.data).tobytes(), crc)
+		else:
+			flatCoords = [0.0] * (len(keyBlock.data) * 3)
+			keyBlock.data.foreach_get("co", flatCoords)
+			crc = zlib.crc32(array.array("f", flatCoords).tobytes(), crc) # same bytes as the numpy engine's float32 array
+		keySettings = (keyBlock.name, keyBlock.relative_key.name, keyBlock.value, keyBlock.slider_min, keyBlock.slider_max, keyBlock.mute, keyBlock.vertex_group, keyBlock.interpolation)
+		crc = zlib.crc32(repr(keySettings).encode("utf-8"), crc)
+	for modifierName in modifierNames:
+		modifier = obj.modifiers[modifierName]
+		for prop in modifier.bl_rna.properties:
+			if (prop.type == "COLLECTION" or prop.identifier == "rna_type"):
+				continue
+			value = getattr(modifier, prop.identifier)
+			if (prop.type == "POINTER"):
+				value = getattr(value, "name", None)
+			elif (getattr(prop, "is_array", False)):
+				value = tuple(value)
+			crc = zlib.crc32(repr((prop.identifier, value)).encode("utf-8"), crc)
+	return crc
+
+
+
+#
+#====================================================================================================
+#    Vertex Filtering
+#====================================================================================================
+#
+
+ParseVertexFilterParams = core.ParseVertexFilterParams
+CreateVertexFilterMaskKernel = core.CreateVertexFilterMaskKernel
+CreateVertexFilterKernel = core.CreateVertexFilterKernel
+
+### core.VertexGroupCSR of an object's vertex groups, built in a single pass over the object's verts
+# Build one whenever an operator runs, and share it between everything in that run that reads the object's vertex groups. Don't keep it across runs, since the user can assign verts and paint weights at any time.
+class VertexGroupIndex(core.VertexGroupCSR):
+	def __init__(self, obj):
+		groups = []
+		vertIndices = []
+		weights = []
+		for vert in obj.data.vertices:
+			for vg in vert.groups:
+				groups.append(vg.group)
+				vertIndices.append(vert.index)
+				weights.append(vg.weight)
+		
+		core.VertexGroupCSR.__init__(self, len(obj.data.vertices), len(obj.vertex_groups), groups, vertIndices, weights)
+
+
+### Filters all of the object's verts at once per the provided parameters
+# Returns a boolean array with True for RED verts and False for BLACK verts
+# Params:
+# - obj: The object whose verts are being filtered
+# - params: Dictionary of parameters for vertex filtering
+# - deltas: (n, 3) array of the shape key deltas to filter
+# - (optional) groupIndex: A VertexGroupIndex for obj to use. If None, one is built if the filter needs it.
+def ComputeVertexFilterMask(obj, params, deltas, groupIndex=None):
+	if (groupIndex == None and "VertexGroupIndex" in params):
+		groupIndex = VertexGroupIndex(obj)
+	return CreateVertexFilterMaskKernel(params)(deltas, groupIndex)
 
 
 #
@@ -86,94 +715,37 @@ def CreateVertexFilterKernel(params):
 ### Given an existing shape key, determines the new names if this shape key was to be split into L and R halves
 # If validateWith = any object, the new names will be validated (and adjusted) for conflicts with existing shape keys
 # If validateWith = None, the ideal new names will be returned without modification
-def FindShapeKeyPairSplitNames(originalShapeKeyName, validateWith=None):
-	newLeftName = None
-	newRightName = None
-	usesPairNameConvention = False
-	if ('+' in originalShapeKeyName):
-		nameCuts = originalShapeKeyName.split("+")
-		if (nameCuts[0].lower()[-1] == "l" and nameCuts[1].lower()[-1] == "r"):
-			newLeftName = nameCuts[0]
-			newRightName = nameCuts[1]
-			usesPairNameConvention = True
-		elif (nameCuts[1].lower()[-1] == "l" and nameCuts[0].lower()[-1] == "r"):
-			newLeftName = nameCuts[1]
-			newRightName = nameCuts[0]
-			usesPairNameConvention = True
-		else: # shape key name has a + in it, but the string halves on either side of that + do not end in L and R
-			newLeftName = originalShapeKeyName + "L"
-			newRightName = originalShapeKeyName + "R"
-			usesPairNameConvention = False
-	else:
-		newLeftName = originalShapeKeyName + "L"
-		newRightName = originalShapeKeyName + "R"
-		usesPairNameConvention = False
+# If nameIndex = a ShapeKeyNameIndex for validateWith, it will be used for the conflict checks
+def FindShapeKeyPairSplitNames(originalShapeKeyName, validateWith=None, nameIndex=None):
+	(newLeftName, newRightName, usesPairNameConvention) = core.PairSplitNames(originalShapeKeyName)
 	
 	if (validateWith):
-		newLeftName = ValidateShapeKeyName(validateWith, newLeftName)
-		newRightName = ValidateShapeKeyName(validateWith, newRightName)
+		newLeftName = ValidateShapeKeyName(validateWith, newLeftName, nameIndex)
+		newRightName = ValidateShapeKeyName(validateWith, newRightName, nameIndex)
 	
 	return (newLeftName, newRightName, usesPairNameConvention)
 
 
-### Splits the active shape key on the specified object into separate left and right halves
+ComputePairSplitWeights = core.ComputePairSplitWeights
+
+
+### The per-vertex pair split loop of the legacy kernel engine, run over the verts from start to end
+# The left and right shape keys must have been created with from_mix=True. This loop only overwrites the verts whose deltas it removes or crossfades.
 # Params:
-# - obj: The object who has the active shape key we are going to split
+# - basisShapeKeyVerts: Data of the basis shape key
+# - originalShapeKeyVerts: Data of the shape key being split
+# - leftShapeKeyVerts: Data of the new left side shape key
+# - rightShapeKeyVerts: Data of the new right side shape key
 # - optAxis: The world axis which determines which verts go into the "left" and "right" halves
-# - newLeftName: Name for the newly split-off left side shape key
-# - newRightName: Name for the newly split-off right side shape key
-# - (optional) deleteOriginal: If false, the original shape key will be kept instead of deleted
-# - (optional) smoothDistance: Distance in world space from the origin of the split axis to crossblend the split shape keys 
-# - (optional) asyncProgressReporting: An object provided by __init__ for asynchronous operation (i.e. in a modal)
-def SplitPairActiveShapeKey(obj, optAxis, newLeftName, newRightName, smoothDistance=0, deleteOriginal=True, asyncProgressReporting=None):
-	originalShapeKeyName = obj.active_shape_key.name
-	originalShapeKeyIndex = obj.data.shape_keys.key_blocks.keys().index(originalShapeKeyName)
-	
-	# Basis shape key cannot be split (assume this is key 0)
-	if (originalShapeKeyIndex == 0):
-		raise Exception("You cannot split the basis shape key")
-	
-	# Create the two copies
-	obj.shape_key_add(name=str(newLeftName), from_mix=True)
-	newLeftShapeKeyIndex = len(obj.data.shape_keys.key_blocks) - 1
-	obj.shape_key_add(name=str(newRightName), from_mix=True)
-	newRightShapeKeyIndex = len(obj.data.shape_keys.key_blocks) - 1
-	
+# - smoothDistance: Distance in world space from the origin of the split axis to crossblend the split shape keys
+# - start: Index of the first vert to split
+# - end: Index after the last vert to split
+def splitPairVertsLegacy(basisShapeKeyVerts, originalShapeKeyVerts, leftShapeKeyVerts, rightShapeKeyVerts, optAxis, smoothDistance, start, end):
 	# Split axis factor
-	axis = 0
-	if (optAxis == "+X" or optAxis == "-X"):
-		axis = 0
-	elif (optAxis == "+Y" or optAxis == "-Y"):
-		axis = 1
-	elif (optAxis == "+Z" or optAxis == "-Z"):
-		axis = 2
-	axisFlip = 1
-	if optAxis[0] == "-":
-		axisFlip = -1
-	
-	# Async progress reporting
-	reportAsyncProgress = False
-	wm = None
-	currentVert = 0
-	totalVerts = 0
-	if asyncProgressReporting:
-		reportAsyncProgress = True
-		wm = bpy.context.window_manager
-		currentVert = asyncProgressReporting["CurrentVert"]
-		totalVerts = asyncProgressReporting["TotalVerts"]
+	(axis, axisFlip) = GetSplitAxis(optAxis)
 	
-	basisShapeKeyVerts = obj.data.shape_keys.key_blocks[0].data
-	originalShapeKeyVerts = obj.data.shape_keys.key_blocks[originalShapeKeyIndex].data
-	leftShapeKeyVerts = obj.data.shape_keys.key_blocks[newLeftShapeKeyIndex].data
-	rightShapeKeyVerts = obj.data.shape_keys.key_blocks[newRightShapeKeyIndex].data
-	
-	for vert in obj.data.vertices:
-		if reportAsyncProgress:
-			currentVert += 1
-			if (currentVert % 100 == 0): # Only break for the UI thread every 100 verts. I'm not sure how much of a performance hit progress_update() incurs, but there's no need to call it faster than 60Hz.
-				wm.progress_update(currentVert)
-		
-		basisVertPos = basisShapeKeyVerts[vert.index].co
+	for vertIndex in range(start, end):
+		basisVertPos = basisShapeKeyVerts[vertIndex].co
 		
 		# The coordinate of the vert on the basis shape key determines whether it is a left (+aXis) or right (-aXis) vert
 		axisSplitCoord = 0
@@ -194,136 +766,190 @@ def SplitPairActiveShapeKey(obj, optAxis, newLeftName, newRightName, smoothDista
 		
 		if (axisSplitCoord < 0): # Vert is on the right side
 			if (axisSplitCoord < -smoothDistance or smoothDistance == 0): # Vert is outside of the smoothing radius or smoothing is disabled, so no crossfade
-				leftShapeKeyVerts[vert.index].co = basisVertPos * 1 # Remove this (right side) delta from the left shape key
+				leftShapeKeyVerts[vertIndex].co = basisVertPos * 1 # Remove this (right side) delta from the left shape key
 			else: # Vert is inside the smoothing radius, so factor the deltas for both the left and right shape keys to achieve the crossfade
-				leftShapeKeyVerts[vert.index].co = basisVertPos * 1 # Remove this (right side) delta from the left shape key
+				leftShapeKeyVerts[vertIndex].co = basisVertPos * 1 # Remove this (right side) delta from the left shape key
 				t = InterpBezier((smoothDistance - axisSplitCoord) / (2.0 * smoothDistance))
-				rightShapeKeyVerts[vert.index].co = basisVertPos.lerp(originalShapeKeyVerts[vert.index].co, t)
-				leftShapeKeyVerts[vert.index].co = basisVertPos.lerp(originalShapeKeyVerts[vert.index].co, 1.0 - t)
+				rightShapeKeyVerts[vertIndex].co = basisVertPos.lerp(originalShapeKeyVerts[vertIndex].co, t)
+				leftShapeKeyVerts[vertIndex].co = basisVertPos.lerp(originalShapeKeyVerts[vertIndex].co, 1.0 - t)
 		
 		elif (axisSplitCoord >= 0): # Vert is on the left side (or center)
 			if (axisSplitCoord > smoothDistance or smoothDistance == 0): # Vert is outside of the smoothing radius or smoothing is disabled, so no crossfade
-				rightShapeKeyVerts[vert.index].co = basisVertPos * 1 # Remove this (left side) delta from the right shape key
+				rightShapeKeyVerts[vertIndex].co = basisVertPos * 1 # Remove this (left side) delta from the right shape key
 			else: # Vert is inside the smoothing radius, so factor the deltas for both the left and right shape keys to achieve the crossfade
 				t = InterpBezier((smoothDistance - axisSplitCoord) / (2.0 * smoothDistance))
-				leftShapeKeyVerts[vert.index].co = basisVertPos.lerp(originalShapeKeyVerts[vert.index].co, 1.0 - t)
-				rightShapeKeyVerts[vert.index].co = basisVertPos.lerp(originalShapeKeyVerts[vert.index].co, t)
-			
-	# Move the two copies in the shape key list to sit after the original shape key
-	while (newLeftShapeKeyIndex > originalShapeKeyIndex + 1):
-		# Move left copy
-		obj.active_shape_key_index = newLeftShapeKeyIndex
-		bpy.ops.object.shape_key_move(type="UP")
-		# Move right copy (will always be on the tail of the left copy)
-		obj.active_shape_key_index = newRightShapeKeyIndex
-		bpy.ops.object.shape_key_move(type="UP")
-		newLeftShapeKeyIndex -= 1
-		newRightShapeKeyIndex -= 1
-	
-	# Delete original shape key
-	if (deleteOriginal):
-		obj.active_shape_key_index = originalShapeKeyIndex
-		bpy.ops.object.shape_key_remove()
-	
-	# Select the new L shape key
-	obj.active_shape_key_index = obj.data.shape_keys.key_blocks.keys().index(newLeftName)
-	
-	# Update async progress reporting for delta verts processed
-	if reportAsyncProgress:
-		asyncProgressReporting["CurrentVert"] = currentVert
+				leftShapeKeyVerts[vertIndex].co = basisVertPos.lerp(originalShapeKeyVerts[vertIndex].co, 1.0 - t)
+				rightShapeKeyVerts[vertIndex].co = basisVertPos.lerp(originalShapeKeyVerts[vertIndex].co, t)
+
+
+### Splits many shape keys on the same object into separate left and right halves, reading the basis shape key and computing the split weights only once for all of them
+# Params:
+# - obj: The object who has the shape keys we are going to split
+# - optAxis: The world axis which determines which verts go into the "left" and "right" halves
+# - (optional) smoothDistance: Distance in world space from the origin of the split axis to crossblend the split shape keys
+# - (optional) engine: Kernel engine to use ("numpy" or "legacy"). Defaults to KernelEngine.
+class PairSplitBatch():
+	def __init__(self, obj, optAxis, smoothDistance=0, engine=None):
+		self.Obj = obj
+		self.Engine = ResolveKernelEngine(engine)
+		self.OptAxis = optAxis
+		self.SmoothDistance = smoothDistance
+		self.VertCount = len(obj.data.vertices)
+		if (self.Engine == "numpy"):
+			self.BasisCoords = ReadCoords(obj.data.shape_keys.key_blocks[0].data)
+			self.RightWeights = ComputePairSplitWeights(self.BasisCoords, optAxis, smoothDistance)[:, None]
+		
+		# All shape keys must be added, removed, and moved through this until Finish() is called
+		self.NameIndex = ShapeKeyNameIndex(obj)
+		
+		# The new shape keys are all moved into place at once by Finish()
+		self.OriginalOrder = list(self.NameIndex.Names)
+		self.SplitNames = {}
+		self.LastLeftName = None
+	
+	### Splits one shape key into separate left and right halves. The new shape keys are left at the end of the shape key list until Finish() is called.
+	# Params:
+	# - shapeKeyName: Name of the shape key to split
+	# - newLeftName: Name for the newly split-off left side shape key
+	# - newRightName: Name for the newly split-off right side shape key
+	# - (optional) deleteOriginal: If false, the original shape key will be kept instead of deleted
+	# - (optional) progress: A ProgressReporter to advance by the number of verts processed
+	def SplitShapeKey(self, shapeKeyName, newLeftName, newRightName, deleteOriginal=True, progress=None):
+		for chunkVerts in self.SplitShapeKeyChunks(shapeKeyName, newLeftName, newRightName, deleteOriginal):
+			if (progress != None):
+				progress.Advance(chunkVerts)
+	
+	### Same as SplitShapeKey(), but as a generator that splits the shape key a chunk of verts at a time, for running with a ChunkedWorkScheduler
+	# Yields the number of verts split by each chunk. The two new shape keys are created along with the last chunk (numpy engine) or before the first chunk (legacy engine).
+	# Params:
+	# - shapeKeyName: Name of the shape key to split
+	# - newLeftName: Name for the newly split-off left side shape key
+	# - newRightName: Name for the newly split-off right side shape key
+	# - (optional) deleteOriginal: If false, the original shape key will be kept instead of deleted
+	# - (optional) scheduler: The ChunkedWorkScheduler running this generator, whose ChunkSize is the number of verts to split per chunk. If None, all verts are split in one chunk.
+	def SplitShapeKeyChunks(self, shapeKeyName, newLeftName, newRightName, deleteOriginal=True, scheduler=None):
+		obj = self.Obj
+		nameIndex = self.NameIndex
+		
+		originalShapeKeyIndex = nameIndex.IndexOf(shapeKeyName)
+		
+		# Basis shape key cannot be split (assume this is key 0)
+		if (originalShapeKeyIndex == 0):
+			raise Exception("You cannot split the basis shape key")
+		
+		if (self.Engine == "numpy"):
+			sourceCoords = ReadCoords(obj.data.shape_keys.key_blocks[originalShapeKeyIndex].data)
+			leftCoords = np.empty_like(sourceCoords)
+			rightCoords = np.empty_like(sourceCoords)
+		else:
+			# Create the two copies from the shape key mix, which the per-vertex loop then edits in place
+			nameIndex.Activate(shapeKeyName)
+			nameIndex.AddShapeKey(newLeftName, fromMix=True)
+			nameIndex.AddShapeKey(newRightName, fromMix=True)
+		
+		# Split every vert, one chunk at a time
+		vertCount = self.VertCount
+		start = 0
+		while (True):
+			end = vertCount
+			if (scheduler != None):
+				end = min(vertCount, start + scheduler.ChunkSize)
+			with TraceSpan("Split pair", "kernel", {"engine": self.Engine, "verts": end - start}):
+				if (self.Engine == "numpy"):
+					(leftCoords[start:end], rightCoords[start:end]) = core.SplitPairCoords(self.BasisCoords[start:end], sourceCoords[start:end], self.RightWeights[start:end])
+				else:
+					keyBlocks = obj.data.shape_keys.key_blocks
+					splitPairVertsLegacy(keyBlocks[0].data, keyBlocks[nameIndex.IndexOf(shapeKeyName)].data, keyBlocks[nameIndex.IndexOf(newLeftName)].data, keyBlocks[nameIndex.IndexOf(newRightName)].data, self.OptAxis, self.SmoothDistance, start, end)
+			if (end >= vertCount):
+				break
+			yield (end - start)
+			start = end
+		
+		if (self.Engine == "numpy"):
+			# Create the two copies
+			# Every vert of both copies is overwritten, so there is no need to have Blender evaluate the shape key mix for them
+			leftShapeKey = nameIndex.AddShapeKey(newLeftName)
+			rightShapeKey = nameIndex.AddShapeKey(newRightName)
+			with TraceSpan("Write split pair", "kernel"):
+				WriteCoords(leftShapeKey.data, leftCoords)
+				WriteCoords(rightShapeKey.data, rightCoords)
+		
+		# Delete original shape key
+		if (deleteOriginal):
+			nameIndex.RemoveShapeKey(shapeKeyName)
+		
+		self.SplitNames[shapeKeyName] = (newLeftName, newRightName)
+		self.LastLeftName = newLeftName
+		
+		yield (end - start)
+	
+	### Moves all of the new shape keys to sit after the shape keys they were split from, then makes the last new left shape key active
+	def Finish(self):
+		nameIndex = self.NameIndex
+		
+		targetOrder = []
+		for name in self.OriginalOrder:
+			if (name in nameIndex):
+				targetOrder.append(name)
+			if (name in self.SplitNames):
+				targetOrder.extend(self.SplitNames[name])
+		placed = set(targetOrder)
+		targetOrder.extend([name for name in nameIndex.Names if not name in placed])
+		ReorderShapeKeys(self.Obj, targetOrder, nameIndex)
+		
+		# Select the last new L shape key
+		if (self.LastLeftName != None):
+			nameIndex.Activate(self.LastLeftName)
+
+
+### Splits the active shape key on the specified object into separate left and right halves
+# Returns the names of the new left and right shape keys
+# Params:
+# - obj: The object who has the active shape key we are going to split
+# - optAxis: The world axis which determines which verts go into the "left" and "right" halves
+# - newLeftName: Name for the newly split-off left side shape key
+# - newRightName: Name for the newly split-off right side shape key
+# - (optional) deleteOriginal: If false, the original shape key will be kept instead of deleted
+# - (optional) smoothDistance: Distance in world space from the origin of the split axis to crossblend the split shape keys
+# - (optional) progress: A ProgressReporter to advance by the number of verts processed
+# - (optional) engine: Kernel engine to use ("numpy" or "legacy"). Defaults to KernelEngine.
+def SplitPairActiveShapeKey(obj, optAxis, newLeftName, newRightName, smoothDistance=0, deleteOriginal=True, progress=None, engine=None):
+	splitBatch = PairSplitBatch(obj, optAxis, smoothDistance, engine)
+	originalName = obj.active_shape_key.name
+	splitBatch.SplitShapeKey(originalName, newLeftName, newRightName, deleteOriginal, progress)
+	splitBatch.Finish()
+	return list(splitBatch.SplitNames[originalName])
 
 
 ### Given an existing shape key, determines the expected name of the complementary shape key (the L for the R, or the R for the L) and the name of the final shape key if they two were merged
 # If validateWith = any object, the to-be-merged name will be validated (and adjusted) for conflicts with existing shape keys
 # If validateWith = None, the ideal to-be-merged name will be returned without modification
-def FindShapeKeyMergeNames(shapeKeyName, validateWith=None):
-	expectedCompShapeKeyName = None
-	mergedShapeKeyName = None
-	if shapeKeyName[-1] == "L":
-		expectedCompShapeKeyName = shapeKeyName[:-1] + "R"
-		mergedShapeKeyName = shapeKeyName + "+" + expectedCompShapeKeyName
-	if shapeKeyName[-1] == "R":
-		expectedCompShapeKeyName = shapeKeyName[:-1] + "L"
-		mergedShapeKeyName = expectedCompShapeKeyName + "+" + shapeKeyName
+# If nameIndex = a ShapeKeyNameIndex for validateWith, it will be used for the conflict checks
+def FindShapeKeyMergeNames(shapeKeyName, validateWith=None, nameIndex=None):
+	(shapeKeyName, expectedCompShapeKeyName, mergedShapeKeyName) = core.PairMergeNames(shapeKeyName)
 	
 	if (validateWith):
-		mergedShapeKeyName = ValidateShapeKeyName(validateWith, mergedShapeKeyName)
+		mergedShapeKeyName = ValidateShapeKeyName(validateWith, mergedShapeKeyName, nameIndex)
 	
 	return (shapeKeyName, expectedCompShapeKeyName, mergedShapeKeyName)
 
 
-### Merges the specified shape key pair (two shape keys with names like "MyShapeKeyL" and "MyShapeKeyR") on the specified object into a single shape key
+### The per-vertex pair merge loop of the legacy kernel engine, run over the verts from start to end
 # Params:
-# - obj: The object who has the two specified shape keys to be merged
+# - basisShapeKeyVerts: Data of the basis shape key
+# - leftShapeKeyVerts: Data of the "left" side shape key
+# - rightShapeKeyVerts: Data of the "right" side shape key
+# - mergedShapeKeyVerts: Data of the new merged shape key
 # - optAxis: The world axis which determines which verts belong to the "left" and "right" halves of the combined shape key
-# - shapeKeyLeftName: Name of the "left" side shape key to be merged
-# - shapeKeyRightName: Name of the "right" side shape key to be merged
-# - mergedShapeKeyName: Name of the soon-to-be merged shape key
 # - mode: Name of the mode to use for merging the left and right deltas
-# - (optional) deleteInputShapeKeys: Defaults to delete the left and right shape keys creating the new merged key
-# - (optional) asyncProgressReporting: An object provided by __init__ for asynchronous operation (i.e. in a modal)
-def MergeShapeKeyPair(obj, optAxis, shapeKeyLeftName, shapeKeyRightName, mergedShapeKeyName, mode, deleteInputShapeKeys=True, asyncProgressReporting=None):
-	# Find the indices of the left and right shape keys
-	leftShapeKeyIndex = obj.data.shape_keys.key_blocks.keys().index(shapeKeyLeftName)
-	rightShapeKeyIndex = obj.data.shape_keys.key_blocks.keys().index(shapeKeyRightName)
-	
-	# Neither shape key can be the basis key (assume this is key 0)
-	if (leftShapeKeyIndex == 0 or rightShapeKeyIndex == 0):
-		raise Exception("The basis shape key cannot be merged.")
-	
-	key0 = obj.data.shape_keys.key_blocks[0]
-	leftShapeKey = obj.data.shape_keys.key_blocks[leftShapeKeyIndex]
-	rightShapeKey = obj.data.shape_keys.key_blocks[rightShapeKeyIndex]
-	
-	# If the two shape keys are relative to a key other than key 0 (should be the basis shape, assuming the user isn't being weird), change them now and restore the relative key at the end
-	leftOldBasisKey = leftShapeKey.relative_key
-	rightOldBasisKey = rightShapeKey.relative_key
-	if (leftOldBasisKey != key0):
-		leftShapeKey.relative_key = key0
-	if (rightOldBasisKey != key0):
-		rightShapeKey.relative_key = key0
-	
-	# Create a new shape key from the basis
-	obj.active_shape_key_index = 0
-	obj.shape_key_add(name=str(mergedShapeKeyName), from_mix=False)
-	newShapeKeyIndex = len(obj.data.shape_keys.key_blocks) - 1
-	newShapeKey = obj.data.shape_keys.key_blocks[newShapeKeyIndex]
-	
+# - start: Index of the first vert to merge
+# - end: Index after the last vert to merge
+def mergePairVertsLegacy(basisShapeKeyVerts, leftShapeKeyVerts, rightShapeKeyVerts, mergedShapeKeyVerts, optAxis, mode, start, end):
 	# Cherry pick which verts to bring into the new shape key from the -/+ sides of the left and right shape keys pair
-	axis = 0
-	if (optAxis == "+X" or optAxis == "-X"):
-		axis = 0
-	elif (optAxis == "+Y" or optAxis == "-Y"):
-		axis = 1
-	elif (optAxis == "+Z" or optAxis == "-Z"):
-		axis = 2
-	axisFlip = 1
-	if optAxis[0] == "-":
-		axisFlip = -1
-	
-	# Async progress reporting
-	reportAsyncProgress = False
-	wm = None
-	currentVert = 0
-	totalVerts = 0
-	if asyncProgressReporting:
-		reportAsyncProgress = True
-		wm = bpy.context.window_manager
-		currentVert = asyncProgressReporting["CurrentVert"]
-		totalVerts = asyncProgressReporting["TotalVerts"]
+	(axis, axisFlip) = GetSplitAxis(optAxis)
 	
-	basisShapeKeyVerts = key0.data
-	mergedShapeKeyVerts = newShapeKey.data
-	leftShapeKeyVerts = leftShapeKey.data
-	rightShapeKeyVerts = rightShapeKey.data
-	
-	for vert in obj.data.vertices:
-		if reportAsyncProgress:
-			currentVert += 1
-			if (currentVert % 100 == 0):
-				wm.progress_update(currentVert)
-		
-		baseVertPos = basisShapeKeyVerts[vert.index].co
+	for vertIndex in range(start, end):
+		baseVertPos = basisShapeKeyVerts[vertIndex].co
 		
 		axisSplitCoord = 0
 		if (axis == 0):
@@ -334,50 +960,193 @@ def MergeShapeKeyPair(obj, optAxis, shapeKeyLeftName, shapeKeyRightName, mergedS
 			axisSplitCoord = baseVertPos.z
 		axisSplitCoord *= axisFlip
 		
-		if (mode == "overwrite"):	
+		if (mode == "overwrite"):
 			# If the original vert is -aXis (right side), then we pick the flexed vert from the Right shape key
 			if (axisSplitCoord < 0):
-				mergedShapeKeyVerts[vert.index].co = rightShapeKeyVerts[vert.index].co * 1
+				mergedShapeKeyVerts[vertIndex].co = rightShapeKeyVerts[vertIndex].co * 1
 			# If the original vert is +aXis (left side), then we pick the flexed vert from the Left shape key
 			if (axisSplitCoord >= 0):
-				mergedShapeKeyVerts[vert.index].co = leftShapeKeyVerts[vert.index].co * 1
+				mergedShapeKeyVerts[vertIndex].co = leftShapeKeyVerts[vertIndex].co * 1
 		
 		elif (mode == "additive"):
 			# Add the deltas of both the left and right halves together
-			leftDelta = leftShapeKeyVerts[vert.index].co - baseVertPos
-			rightDelta = rightShapeKeyVerts[vert.index].co - baseVertPos
-			mergedShapeKeyVerts[vert.index].co = baseVertPos + leftDelta + rightDelta
-	
-	# Restore relative_key for the two input shape keys if necessary
-	if (leftOldBasisKey != key0):
-		leftShapeKey.relative_key = leftOldBasisKey
-	if (rightOldBasisKey != key0):
-		rightShapeKey.relative_key = rightOldBasisKey
-	
-	# Set the relative_key for the new merged shape key to whatever the relative key was for the left shape key
-	newShapeKey.relative_key = leftOldBasisKey
+			leftDelta = leftShapeKeyVerts[vertIndex].co - baseVertPos
+			rightDelta = rightShapeKeyVerts[vertIndex].co - baseVertPos
+			mergedShapeKeyVerts[vertIndex].co = baseVertPos + leftDelta + rightDelta
+
+
+### Merges many shape key pairs on the same object, reading the basis shape key and computing the left/right side of each vert only once for all of them
+# Params:
+# - obj: The object who has the shape key pairs we are going to merge
+# - optAxis: The world axis which determines which verts belong to the "left" and "right" halves of the combined shape keys
+# - mode: Name of the mode to use for merging the left and right deltas
+# - (optional) engine: Kernel engine to use ("numpy" or "legacy"). Defaults to KernelEngine.
+class PairMergeBatch():
+	def __init__(self, obj, optAxis, mode, engine=None):
+		if (mode != "overwrite" and mode != "additive"):
+			raise Exception("Unknown merge mode '" + str(mode) + "'")
+		
+		self.Obj = obj
+		self.Engine = ResolveKernelEngine(engine)
+		self.OptAxis = optAxis
+		self.Mode = mode
+		self.VertCount = len(obj.data.vertices)
+		if (self.Engine == "numpy"):
+			self.BasisCoords = ReadCoords(obj.data.shape_keys.key_blocks[0].data)
+			self.RightSideMask = core.ComputeRightSideMask(self.BasisCoords, optAxis)
+		
+		# All shape keys must be added, removed, and moved through this until Finish() is called
+		self.NameIndex = ShapeKeyNameIndex(obj)
+		
+		# The new shape keys are all moved into place at once by Finish()
+		self.OriginalOrder = list(self.NameIndex.Names)
+		self.MergedNames = {}
+		self.LastMergedName = None
 	
-	# Move the new merged shape key in the shape key list to sit after the firstmost shape key of the pair in the shape key list
-	originalShapeKeyIndex = min(leftShapeKeyIndex, rightShapeKeyIndex)
-	while (newShapeKeyIndex > originalShapeKeyIndex + 1):
-		# Move left copy
-		obj.active_shape_key_index = newShapeKeyIndex
-		bpy.ops.object.shape_key_move(type="UP")
-		newShapeKeyIndex -= 1
+	### Merges a list of shape key pairs, one pair at a time. Each merged shape key is written as soon as its pair is merged, so only one pair's vertex positions are held at once.
+	# The new shape keys are left at the end of the shape key list until Finish() is called.
+	# Params:
+	# - pairs: List of (shapeKeyLeftName, shapeKeyRightName, mergedShapeKeyName)
+	# - (optional) deleteInputShapeKeys: If false, the two input shape keys of each pair will be kept instead of deleted
+	# - (optional) progress: A ProgressReporter to advance by the number of verts processed
+	def MergePairs(self, pairs, deleteInputShapeKeys=True, progress=None):
+		for (shapeKeyLeftName, shapeKeyRightName, mergedShapeKeyName) in pairs:
+			for chunkVerts in self.MergePairChunks(shapeKeyLeftName, shapeKeyRightName, mergedShapeKeyName, deleteInputShapeKeys):
+				if (progress != None):
+					progress.Advance(chunkVerts)
 	
-	# Delete the left and right shape keys
-	if (deleteInputShapeKeys):
-		obj.active_shape_key_index = obj.data.shape_keys.key_blocks.keys().index(shapeKeyLeftName)
-		bpy.ops.object.shape_key_remove()
-		obj.active_shape_key_index = obj.data.shape_keys.key_blocks.keys().index(shapeKeyRightName)
-		bpy.ops.object.shape_key_remove()
+	### Merges one shape key pair as a generator that merges a chunk of verts at a time, for running with a ChunkedWorkScheduler
+	# Yields the number of verts merged by each chunk. The merged shape key is created along with the last chunk (numpy engine) or before the first chunk (legacy engine).
+	# Params:
+	# - shapeKeyLeftName: Name of the "left" side shape key to be merged
+	# - shapeKeyRightName: Name of the "right" side shape key to be merged
+	# - mergedShapeKeyName: Name of the soon-to-be merged shape key
+	# - (optional) deleteInputShapeKeys: If false, the two input shape keys will be kept instead of deleted
+	# - (optional) scheduler: The ChunkedWorkScheduler running this generator, whose ChunkSize is the number of verts to merge per chunk. If None, all verts are merged in one chunk.
+	def MergePairChunks(self, shapeKeyLeftName, shapeKeyRightName, mergedShapeKeyName, deleteInputShapeKeys=True, scheduler=None):
+		keyBlocks = self.Obj.data.shape_keys.key_blocks
+		nameIndex = self.NameIndex
+		
+		leftShapeKeyIndex = nameIndex.IndexOf(shapeKeyLeftName)
+		rightShapeKeyIndex = nameIndex.IndexOf(shapeKeyRightName)
+		
+		# Neither shape key can be the basis key (assume this is key 0)
+		if (leftShapeKeyIndex == 0 or rightShapeKeyIndex == 0):
+			raise Exception("The basis shape key cannot be merged.")
+		
+		mergedCoords = None
+		if (self.Engine == "numpy"):
+			leftCoords = ReadCoords(keyBlocks[leftShapeKeyIndex].data)
+			rightCoords = ReadCoords(keyBlocks[rightShapeKeyIndex].data)
+			mergedCoords = np.empty_like(leftCoords)
+		else:
+			# Create a new shape key from the basis, which the per-vertex loop then edits in place
+			nameIndex.AddShapeKey(mergedShapeKeyName)
+		
+		# Merge every vert, one chunk at a time
+		vertCount = self.VertCount
+		start = 0
+		while (True):
+			end = vertCount
+			if (scheduler != None):
+				end = min(vertCount, start + scheduler.ChunkSize)
+			with TraceSpan("Merge pair", "kernel", {"engine": self.Engine, "verts": end - start}):
+				if (self.Engine == "numpy"):
+					mergedCoords[start:end] = core.MergePairCoords(self.BasisCoords[start:end], leftCoords[start:end], rightCoords[start:end], self.RightSideMask[start:end], self.Mode)
+				else:
+					mergePairVertsLegacy(keyBlocks[0].data, keyBlocks[nameIndex.IndexOf(shapeKeyLeftName)].data, keyBlocks[nameIndex.IndexOf(shapeKeyRightName)].data, keyBlocks[nameIndex.IndexOf(mergedShapeKeyName)].data, self.OptAxis, self.Mode, start, end)
+			if (end >= vertCount):
+				break
+			yield (end - start)
+			start = end
+		
+		self.placeMergedPair(shapeKeyLeftName, shapeKeyRightName, mergedShapeKeyName, mergedCoords, deleteInputShapeKeys)
+		
+		yield (end - start)
 	
-	# Reselect merged shape key
-	obj.active_shape_key_index = obj.data.shape_keys.key_blocks.keys().index(mergedShapeKeyName)
+	# Creates the merged shape key of a pair, then deletes the pair (if desired)
+	# If coords is None, the merged shape key was already created and written by the legacy per-vertex loop
+	def placeMergedPair(self, shapeKeyLeftName, shapeKeyRightName, mergedShapeKeyName, coords, deleteInputShapeKeys):
+		keyBlocks = self.Obj.data.shape_keys.key_blocks
+		nameIndex = self.NameIndex
+		
+		leftShapeKeyIndex = nameIndex.IndexOf(shapeKeyLeftName)
+		rightShapeKeyIndex = nameIndex.IndexOf(shapeKeyRightName)
+		
+		if (coords is None):
+			newShapeKey = keyBlocks[nameIndex.IndexOf(mergedShapeKeyName)]
+		else:
+			newShapeKey = nameIndex.AddShapeKey(mergedShapeKeyName)
+			with TraceSpan("Write merged pair", "kernel"):
+				WriteCoords(newShapeKey.data, coords)
+		
+		# Set the relative_key for the new merged shape key to whatever the relative key was for the left shape key
+		newShapeKey.relative_key = keyBlocks[leftShapeKeyIndex].relative_key
+		
+		# The new merged shape key will sit after the firstmost shape key of the pair in the shape key list
+		firstShapeKeyName = shapeKeyLeftName
+		if (rightShapeKeyIndex < leftShapeKeyIndex):
+			firstShapeKeyName = shapeKeyRightName
+		self.MergedNames.setdefault(firstShapeKeyName, []).append(mergedShapeKeyName)
+		self.LastMergedName = mergedShapeKeyName
+		
+		# Delete the left and right shape keys
+		if (deleteInputShapeKeys):
+			nameIndex.RemoveShapeKey(shapeKeyLeftName)
+			nameIndex.RemoveShapeKey(shapeKeyRightName)
 	
-	# Update async progress reporting for delta verts processed
-	if reportAsyncProgress:
-		asyncProgressReporting["CurrentVert"] = currentVert
+	### Moves all of the new merged shape keys to sit after the firstmost shape key of the pairs they were merged from, then makes the last merged shape key active
+	def Finish(self):
+		nameIndex = self.NameIndex
+		
+		targetOrder = []
+		for name in self.OriginalOrder:
+			if (name in nameIndex):
+				targetOrder.append(name)
+			if (name in self.MergedNames):
+				targetOrder.extend(reversed(self.MergedNames[name])) # each merge places its shape key directly after the pair, ahead of any earlier merges
+		placed = set(targetOrder)
+		targetOrder.extend([name for name in nameIndex.Names if not name in placed])
+		ReorderShapeKeys(self.Obj, targetOrder, nameIndex)
+		
+		# Reselect the last merged shape key
+		if (self.LastMergedName != None):
+			nameIndex.Activate(self.LastMergedName)
+
+
+### Merges the specified shape key pair (two shape keys with names like "MyShapeKeyL" and "MyShapeKeyR") on the specified object into a single shape key
+# Params:
+# - obj: The object who has the two specified shape keys to be merged
+# - optAxis: The world axis which determines which verts belong to the "left" and "right" halves of the combined shape key
+# - shapeKeyLeftName: Name of the "left" side shape key to be merged
+# - shapeKeyRightName: Name of the "right" side shape key to be merged
+# - mergedShapeKeyName: Name of the soon-to-be merged shape key
+# - mode: Name of the mode to use for merging the left and right deltas
+# - (optional) deleteInputShapeKeys: Defaults to delete the left and right shape keys creating the new merged key
+# - (optional) progress: A ProgressReporter to advance by the number of verts processed
+# - (optional) engine: Kernel engine to use ("numpy" or "legacy"). Defaults to KernelEngine.
+def MergeShapeKeyPair(obj, optAxis, shapeKeyLeftName, shapeKeyRightName, mergedShapeKeyName, mode, deleteInputShapeKeys=True, progress=None, engine=None):
+	mergeBatch = PairMergeBatch(obj, optAxis, mode, engine)
+	mergeBatch.MergePairs([(shapeKeyLeftName, shapeKeyRightName, mergedShapeKeyName)], deleteInputShapeKeys, progress)
+	mergeBatch.Finish()
+	return [mergeBatch.LastMergedName]
+
+
+
+#
+#====================================================================================================
+#    Blend Modes
+#====================================================================================================
+#
+
+SafeDivide = core.SafeDivide
+BlendDeltasAdd = core.BlendDeltasAdd
+BlendDeltasSubtract = core.BlendDeltasSubtract
+BlendDeltasMultiply = core.BlendDeltasMultiply
+BlendDeltasDivide = core.BlendDeltasDivide
+BlendDeltasOver = core.BlendDeltasOver
+BlendDeltasLerp = core.BlendDeltasLerp
+BlendModeFunctions = core.BlendModeFunctions
 
 
 
@@ -388,6 +1157,7 @@ def MergeShapeKeyPair(obj, optAxis, shapeKeyLeftName, shapeKeyRightName, mergedS
 #
 
 ### Merges the two specified shape keys on the specified object into a single shape key, using various blend modes
+# Returns the names of the shape keys that were written (just the destination shape key)
 # Params:
 # - obj: The object who has the two specified shape keys to be merged
 # - shapeKey1Name: Name of the shape key to use as the lower layer in blending
@@ -398,18 +1168,26 @@ def MergeShapeKeyPair(obj, optAxis, shapeKeyLeftName, shapeKeyRightName, mergedS
 # - (optional) vertexFilterParams: Dictionary of parameters for vertex filtering. If None, vertex filtering is disabled.
 # - (optional) delete1OnFinish: If true, shape key 1 will be deleted after the merge is complete
 # - (optional) delete2OnFinish: If true, shape key 2 will be deleted after the merge is complete
-# - (optional) asyncProgressReporting: An object provided by __init__ for asynchronous operation (i.e. in a modal)
-def MergeAndBlendShapeKeys(obj, shapeKey1Name, shapeKey2Name, destination, blendMode, blendModeParams=None, vertexFilterParams=None, delete1OnFinish=False, delete2OnFinish=False, asyncProgressReporting=None):
+# - (optional) progress: A ProgressReporter to advance by the number of verts processed
+# - (optional) engine: Kernel engine to use ("numpy" or "legacy"). Defaults to KernelEngine.
+def MergeAndBlendShapeKeys(obj, shapeKey1Name, shapeKey2Name, destination, blendMode, blendModeParams=None, vertexFilterParams=None, delete1OnFinish=False, delete2OnFinish=False, progress=None, engine=None):
+	engine = ResolveKernelEngine(engine)
+	
+	if (not blendMode in BlendModeFunctions):
+		raise Exception("Unknown blend mode '" + str(blendMode) + "'")
+	
+	nameIndex = ShapeKeyNameIndex(obj)
+	
 	# New shape key from the basis (if we are outputting to a new shape key)
 	newShapeKeyIndex = None
 	if (isinstance(destination, str)):
 		obj.active_shape_key_index = 0
-		obj.shape_key_add(name=str(destination), from_mix=False)
-		newShapeKeyIndex = len(obj.data.shape_keys.key_blocks) - 1
+		nameIndex.AddShapeKey(destination)
+		newShapeKeyIndex = len(nameIndex) - 1
 	
 	# Find the indices of the source shape keys
-	lowerShapeKeyIndex = obj.data.shape_keys.key_blocks.keys().index(shapeKey1Name)
-	upperShapeKeyIndex = obj.data.shape_keys.key_blocks.keys().index(shapeKey2Name)
+	lowerShapeKeyIndex = nameIndex.IndexOf(shapeKey1Name)
+	upperShapeKeyIndex = nameIndex.IndexOf(shapeKey2Name)
 	
 	key0 = obj.data.shape_keys.key_blocks[0]
 	lowerShapeKey = obj.data.shape_keys.key_blocks[lowerShapeKeyIndex]
@@ -442,87 +1220,81 @@ def MergeAndBlendShapeKeys(obj, shapeKey1Name, shapeKey2Name, destination, blend
 		destinationShapeKeyName = destination
 		destinationShapeKeyVerts = newShapeKeyVerts
 	
-	
-	### Blend-mode-specific params
-	blendModeLerp_Factor = None
-	if (blendMode == "lerp"):
-		blendModeLerp_Factor = min(max(0, blendModeParams["Factor"]), 1)
-	
-	
-	### Vertex filter kernel
-	vertexFilterKernel = None
-	doVertexFiltering = False
-	if (vertexFilterParams != None):
-		doVertexFiltering = True
-		vertexFilterKernel = CreateVertexFilterKernel(vertexFilterParams)
-		
-	
-	# Async progress reporting
-	reportAsyncProgress = False
-	wm = None
-	currentVert = 0
-	totalVerts = 0
-	if asyncProgressReporting:
-		reportAsyncProgress = True
-		wm = bpy.context.window_manager
-		currentVert = asyncProgressReporting["CurrentVert"]
-		totalVerts = asyncProgressReporting["TotalVerts"]
-	
-	### Iterate all the verts and combine the deltas as per the blend mode
-	for vert in obj.data.vertices:
-		if reportAsyncProgress:
-			currentVert += 1
-			if (currentVert % 100 == 0):
-				wm.progress_update(currentVert)
-		
-		# Unfortunately, bpy does not expose relative position of each vert, so we have to calculate the deltas ourself
-		basePos = basisShapeKeyVerts[vert.index].co
-		lowerDelta = lowerShapeKeyVerts[vert.index].co - basePos
-		upperDelta = upperShapeKeyVerts[vert.index].co - basePos
-		
-		# Filter the upper vert if vertex filtering is enabled
-		vertPassesFilter = True # RED verts are True, BLACK verts are False.
-		if (doVertexFiltering):
-			vgIndices = [vg.group for vg in vert.groups]
-			vertPassesFilter = vertexFilterKernel(vgIndices, upperDelta)
-		
-		### Blend the upper shape key's delta with the lower shape key's delta
-		if (vertPassesFilter): # We only incorporate RED verts into combined shape key
-			newDelta = None
-			
-			# Additive
-			if (blendMode == "add"):
-				newDelta = lowerDelta + upperDelta
-			
-			# Subtractive
-			elif (blendMode == "subtract"):
-				newDelta = lowerDelta - upperDelta
+	### Combine the deltas of all the verts as per the blend mode
+	# We only incorporate RED verts into combined shape key. BLACK verts keep whatever the destination shape key already has.
+	with TraceSpan("Blend", "kernel", {"engine": engine, "mode": blendMode}):
+		if (engine == "numpy"):
+			basisCoords = ReadCoords(basisShapeKeyVerts)
+			lowerCoords = ReadCoords(lowerShapeKeyVerts)
+			upperCoords = ReadCoords(upperShapeKeyVerts)
+			vertsPassFilter = None
+			destinationCoords = None
+			if (vertexFilterParams != None):
+				vertsPassFilter = ComputeVertexFilterMask(obj, vertexFilterParams, upperCoords - basisCoords)
+				destinationCoords = ReadCoords(destinationShapeKeyVerts)
+			WriteCoords(destinationShapeKeyVerts, core.BlendCoords(basisCoords, lowerCoords, upperCoords, blendMode, blendModeParams, vertsPassFilter, destinationCoords))
+		
+		else:
+			### Blend-mode-specific params
+			blendModeLerp_Factor = None
+			if (blendMode == "lerp"):
+				blendModeLerp_Factor = min(max(0, blendModeParams["Factor"]), 1)
 			
-			# Multiply
-			elif (blendMode == "multiply"):
-				newDelta = lowerDelta * upperDelta
+			### Vertex filter kernel
+			vertexFilterKernel = None
+			doVertexFiltering = False
+			if (vertexFilterParams != None):
+				doVertexFiltering = True
+				vertexFilterKernel = CreateVertexFilterKernel(vertexFilterParams)
 			
-			# Divide
-			elif (blendMode == "divide"):
-				newDelta = lowerDelta / upperDelta
+			### Iterate all the verts and combine the deltas as per the blend mode
+			for vert in obj.data.vertices:
+				# Unfortunately, bpy does not expose relative position of each vert, so we have to calculate the deltas ourself
+				basePos = basisShapeKeyVerts[vert.index].co
+				lowerDelta = lowerShapeKeyVerts[vert.index].co - basePos
+				upperDelta = upperShapeKeyVerts[vert.index].co - basePos
 				
-			# Overwrite
-			elif (blendMode == "over"):
-				newDelta = upperDelta
+				# Filter the upper vert if vertex filtering is enabled
+				vertPassesFilter = True # RED verts are True, BLACK verts are False.
+				if (doVertexFiltering):
+					vgIndices = [vg.group for vg in vert.groups]
+					vertPassesFilter = vertexFilterKernel(vgIndices, upperDelta)
 				
-			# Lerp
-			elif (blendMode == "lerp"):
-				newDelta = lowerDelta.lerp(upperDelta, blendModeLerp_Factor)
-			
-			# Update the destination shape key
-			destinationShapeKeyVerts[vert.index].co = basePos + newDelta
-		
+				### Blend the upper shape key's delta with the lower shape key's delta
+				if (vertPassesFilter): # We only incorporate RED verts into combined shape key
+					newDelta = None
+					
+					# Additive
+					if (blendMode == "add"):
+						newDelta = lowerDelta + upperDelta
+					
+					# Subtractive
+					elif (blendMode == "subtract"):
+						newDelta = lowerDelta - upperDelta
+					
+					# Multiply
+					elif (blendMode == "multiply"):
+						newDelta = lowerDelta * upperDelta
+					
+					# Divide
+					elif (blendMode == "divide"):
+						newDelta = lowerDelta / upperDelta
+					
+					# Overwrite
+					elif (blendMode == "over"):
+						newDelta = upperDelta
+					
+					# Lerp
+					elif (blendMode == "lerp"):
+						newDelta = lowerDelta.lerp(upperDelta, blendModeLerp_Factor)
+					
+					# Update the destination shape key
+					destinationShapeKeyVerts[vert.index].co = basePos + newDelta
+	
 	# If outputting to a new shape key, move the new merged shape key in the shape key list to sit after the upper shape key
 	if (newShapeKeyIndex != None):
-		while (newShapeKeyIndex > upperShapeKeyIndex + 1):
-			obj.active_shape_key_index = newShapeKeyIndex
-			bpy.ops.object.shape_key_move(type="UP")
-			newShapeKeyIndex -= 1
+		MoveShapeKeysAfter(obj, [destination], shapeKey2Name, nameIndex)
+		nameIndex.Activate(destination)
 	
 	# Restore relative_key for the two input shape keys if necessary
 	if (lowerOldBasisKey != key0):
@@ -532,94 +1304,316 @@ def MergeAndBlendShapeKeys(obj, shapeKey1Name, shapeKey2Name, destination, blend
 	
 	# Delete the source shape keys if desired
 	if (delete1OnFinish):
-		obj.active_shape_key_index = obj.data.shape_keys.key_blocks.keys().index(shapeKey1Name)
-		bpy.ops.object.shape_key_remove()
+		nameIndex.RemoveShapeKey(shapeKey1Name)
 	if (delete2OnFinish):
-		obj.active_shape_key_index = obj.data.shape_keys.key_blocks.keys().index(shapeKey2Name)
-		bpy.ops.object.shape_key_remove()
+		nameIndex.RemoveShapeKey(shapeKey2Name)
 	
 	# Make the destination shape key active
-	obj.active_shape_key_index = obj.data.shape_keys.key_blocks.keys().index(destinationShapeKeyName)
+	nameIndex.Activate(destinationShapeKeyName)
 	
-	# Update async progress reporting for delta verts processed
-	if reportAsyncProgress:
-		asyncProgressReporting["CurrentVert"] = currentVert
+	if (progress != None):
+		progress.Advance(len(obj.data.vertices))
+	
+	return [destinationShapeKeyName]
 
 
 ### Splits off a new shape key from the active shape key, using the Vertex Filter to determine which deltas go to which shape key
+# Returns the names of the shape keys that were written (the new shape key, and the active shape key too if its deltas were moved)
 # Params:
 # - obj: The object who has the two specified shape keys to be merged
 # - newShapeKeyName: Name of to-be-created new shape key
 # - mode: Name of the split mode to use
 # - vertexFilterParams: Dictionary of parameters for vertex filtering
-# - (optional) asyncProgressReporting: An object provided by __init__ for asynchronous operation (i.e. in a modal)
-def SplitFilterActiveShapeKey(obj, newShapeKeyName, mode, vertexFilterParams, asyncProgressReporting=None):
+# - (optional) progress: A ProgressReporter to advance by the number of verts processed
+# - (optional) engine: Kernel engine to use ("numpy" or "legacy"). Defaults to KernelEngine.
+def SplitFilterActiveShapeKey(obj, newShapeKeyName, mode, vertexFilterParams, progress=None, engine=None):
+	engine = ResolveKernelEngine(engine)
+	
 	if (vertexFilterParams == None):
 		raise Exception("Vertex filter parameters must be specified.")
 	
-	sourceShapeKeyIndex = obj.data.shape_keys.key_blocks.keys().index(obj.active_shape_key.name)
+	nameIndex = ShapeKeyNameIndex(obj)
+	sourceShapeKeyName = obj.active_shape_key.name
+	sourceShapeKeyIndex = nameIndex.IndexOf(sourceShapeKeyName)
 	
 	# New shape key from the basis
 	obj.active_shape_key_index = 0
-	obj.shape_key_add(name=str(newShapeKeyName), from_mix=False)
-	newShapeKeyIndex = len(obj.data.shape_keys.key_blocks) - 1
+	nameIndex.AddShapeKey(newShapeKeyName)
+	newShapeKeyIndex = len(nameIndex) - 1
 	
 	basisShapeKeyVerts = obj.data.shape_keys.key_blocks[0].data
 	sourceShapeKeyVerts = obj.data.shape_keys.key_blocks[sourceShapeKeyIndex].data
 	newShapeKeyVerts = obj.data.shape_keys.key_blocks[newShapeKeyIndex].data
 	
-	# Vertex filter kernel
-	vertexFilterKernel = CreateVertexFilterKernel(vertexFilterParams)
+	### Update the verts of all the involved shape keys
+	# RED verts are True, BLACK verts are False
+	with TraceSpan("Filter split", "kernel", {"engine": engine, "mode": mode}):
+		if (engine == "numpy"):
+			basisCoords = ReadCoords(basisShapeKeyVerts)
+			sourceCoords = ReadCoords(sourceShapeKeyVerts)
+			vertsPassFilter = ComputeVertexFilterMask(obj, vertexFilterParams, sourceCoords - basisCoords)
+			(newCoords, newSourceCoords) = core.FilterSplitCoords(basisCoords, sourceCoords, vertsPassFilter, mode)
+			WriteCoords(newShapeKeyVerts, newCoords)
+			if (newSourceCoords is not None):
+				WriteCoords(sourceShapeKeyVerts, newSourceCoords)
+		
+		else:
+			# Vertex filter kernel
+			vertexFilterKernel = CreateVertexFilterKernel(vertexFilterParams)
+			
+			for vert in obj.data.vertices:
+				# Unfortunately, bpy does not expose relative position of each vert, so we have to calculate the deltas ourself
+				basePos = basisShapeKeyVerts[vert.index].co
+				sourcePos = sourceShapeKeyVerts[vert.index].co
+				sourceDelta = sourcePos - basePos
+				
+				# Filter the vertex
+				vgIndices = [vg.group for vg in vert.groups]
+				vertPassesFilter = vertexFilterKernel(vgIndices, sourceDelta) # RED verts are True, BLACK verts are False.
+				
+				### Change shape key verts depending on the operation mode
+				# RED deltas make it into the new shape key. BLACK deltas do not (those verts revert to their basis pos defined in the basis shape key).
+				if (vertPassesFilter):
+					if (mode == "copy"):
+						# Copy delta to new shape key and leave the original shape key unchanged
+						newShapeKeyVerts[vert.index].co = sourcePos * 1
+					
+					elif (mode == "move"):
+						# Copy delta to new shape key and neutralize the delta in the original shape key
+						newShapeKeyVerts[vert.index].co = sourcePos * 1
+						sourceShapeKeyVerts[vert.index].co = basePos * 1
 	
-	# Async progress reporting
-	reportAsyncProgress = False
-	wm = None
-	currentVert = 0
-	totalVerts = 0
-	if asyncProgressReporting:
-		reportAsyncProgress = True
-		wm = bpy.context.window_manager
-		currentVert = asyncProgressReporting["CurrentVert"]
-		totalVerts = asyncProgressReporting["TotalVerts"]
+	# Move the newly created shape key to sit after original shape key
+	MoveShapeKeysAfter(obj, [newShapeKeyName], sourceShapeKeyName, nameIndex)
+	# And make it active
+	nameIndex.Activate(newShapeKeyName)
 	
-	### Update the verts of all the involved shape keys
-	for vert in obj.data.vertices:
-		if reportAsyncProgress:
-			currentVert += 1
-			if (currentVert % 100 == 0):
-				wm.progress_update(currentVert)
-		
-		# Unfortunately, bpy does not expose relative position of each vert, so we have to calculate the deltas ourself
-		basePos = basisShapeKeyVerts[vert.index].co
-		sourcePos = sourceShapeKeyVerts[vert.index].co
-		sourceDelta = sourcePos - basePos
-		
-		# Filter the vertex
-		vgIndices = [vg.group for vg in vert.groups]
-		vertPassesFilter = vertexFilterKernel(vgIndices, sourceDelta) # RED verts are True, BLACK verts are False.
-		
-		### Change shape key verts depending on the operation mode
-		# RED deltas make it into the new shape key. BLACK deltas do not (those verts revert to their basis pos defined in the basis shape key).
-		if (vertPassesFilter):
-			if (mode == "copy"):
-				# Copy delta to new shape key and leave the original shape key unchanged
-				newShapeKeyVerts[vert.index].co = sourcePos * 1
+	if (progress != None):
+		progress.Advance(len(obj.data.vertices))
+	
+	if (mode == "move"):
+		return [newShapeKeyName, sourceShapeKeyName]
+	return [newShapeKeyName]
+
+
+
+#
+#====================================================================================================
+#    Operation metrics
+#====================================================================================================
+#
+
+# Number of recent operations kept in OperationMetricsHistory
+OperationMetricsHistorySize = 10
+
+# The most recently finished operations, newest last. Shown in the Info panel so that artists can copy them into bug reports.
+OperationMetricsHistory = []
+
+### Formats a large count compactly, e.g. 1234567 -> "1.23M"
+def FormatCount(count):
+	for (threshold, suffix) in ((1e9, "G"), (1e6, "M"), (1e3, "k")):
+		if (count >= threshold):
+			return ("%.3g" % (count / threshold)) + suffix
+	return ("%.3g" % count)
+
+### Wall time, size, and throughput of one run of an operator
+# Create one when the operator starts doing work, then call Finish() when it is done. Modal operators hold onto theirs across modal events, so their wall time includes the modal pacing (which is what the user actually waits for).
+# Params:
+# - opName: Name of the operation to show to the user (e.g. the operator's bl_label)
+# - obj: The object being operated on
+class OperationMetrics():
+	def __init__(self, opName, obj):
+		self.OpName = opName
+		self.ObjectName = obj.name
+		self.VertCount = len(obj.data.vertices)
+		self.KeyCount = 0
+		self.StartTime = time.perf_counter()
+		self.Seconds = None
+	
+	### Records the end of the operation and adds it to OperationMetricsHistory
+	# Params:
+	# - keyCount: Number of shape keys the operation wrote (created or changed). Each one is counted as processing every vert of the mesh.
+	def Finish(self, keyCount):
+		global OperationMetricsHistory
+		
+		self.KeyCount = keyCount
+		self.Seconds = time.perf_counter() - self.StartTime
+		OperationMetricsHistory.append(self)
+		del OperationMetricsHistory[:-OperationMetricsHistorySize]
+	
+	### Total number of shape key verts processed
+	def VertsProcessed(self):
+		return self.VertCount * self.KeyCount
+	
+	### Shape key verts processed per second
+	def Throughput(self):
+		if (self.Seconds == None or self.Seconds <= 0):
+			return 0
+		return self.VertsProcessed() / self.Seconds
+	
+	def __str__(self):
+		return self.OpName + " on '" + self.ObjectName + "': " + ("%.3f" % self.Seconds) + " s, " + str(self.KeyCount) + " shape keys x " + str(self.VertCount) + " verts, " + FormatCount(self.Throughput()) + " verts/s"
+
+### Gets the metrics of the recent operations as text, one operation per line, newest first
+def FormatOperationMetricsHistory():
+	lines = ["Blender " + bpy.app.version_string + ", kernel engine: " + ResolveKernelEngine()]
+	for metrics in reversed(OperationMetricsHistory):
+		lines.append(str(metrics))
+	return "\n".join(lines)
+
+
+
+#
+#====================================================================================================
+#    Modal work scheduling
+#====================================================================================================
+#
+
+# Seconds of work that a modal operator should do per timer event. Blender only redraws the UI between events, so this keeps the UI responsive no matter how big the mesh is.
+ModalWorkBudget = 0.012
+
+# Fraction of ModalWorkBudget that each chunk should take. Smaller chunks make it less likely for a step to overshoot the budget, but cost more per-chunk overhead.
+ModalWorkChunkFraction = 0.25
+
+### Runs chunked work in time-budgeted steps, for modal operators
+# The work is a generator that does one chunk of work per next() and yields the number of verts that it processed (0 for work that does not scale with the vert count).
+# Chunked kernels (like PairSplitBatch.SplitShapeKeyChunks()) read ChunkSize to decide how many verts to process in their next chunk, which the scheduler adapts to the measured throughput.
+# Params:
+# - work: The generator to run
+# - (optional) budget: Seconds of work per Step(). Defaults to ModalWorkBudget.
+# - (optional) initialChunkSize: ChunkSize to start with, before there is any throughput to measure
+# - (optional) minChunkSize: ChunkSize never drops below this, so that slow chunks still make reasonable progress
+class ChunkedWorkScheduler():
+	def __init__(self, work, budget=None, initialChunkSize=4096, minChunkSize=256):
+		self.Work = work
+		self.Budget = budget
+		if (self.Budget == None):
+			self.Budget = ModalWorkBudget
+		self.ChunkSize = initialChunkSize
+		self.MinChunkSize = minChunkSize
+		self.Throughput = None # verts per second, averaged over the recent chunks
+		self.VertsDone = 0
+		self.Steps = 0
+		self.Done = False
+	
+	### Runs chunks of work until the time budget is used up (or would be by the next chunk)
+	# Always runs at least one chunk. Returns True once all work is done.
+	def Step(self):
+		stepStart = time.perf_counter()
+		chunkStart = stepStart
+		while (True):
+			try:
+				verts = next(self.Work)
+			except StopIteration:
+				self.Done = True
+				break
+			
+			now = time.perf_counter()
+			self.measure(verts, now - chunkStart)
+			chunkStart = now
 			
-			elif (mode == "move"):
-				# Copy delta to new shape key and neutralize the delta in the original shape key
-				newShapeKeyVerts[vert.index].co = sourcePos * 1
-				sourceShapeKeyVerts[vert.index].co = basePos * 1
-	
-	# Make the newly created shape key active
-	obj.active_shape_key_index = newShapeKeyIndex
-	# And move it to sit after original shape key
-	while (newShapeKeyIndex > sourceShapeKeyIndex + 1):
-		# Move left copy
-		obj.active_shape_key_index = newShapeKeyIndex
-		bpy.ops.object.shape_key_move(type="UP")
-		newShapeKeyIndex -= 1
-	
-	# Update async progress reporting for delta verts processed
-	if reportAsyncProgress:
-		asyncProgressReporting["CurrentVert"] = currentVert
+			# Stop if the next chunk is expected to go over the budget
+			nextChunkSeconds = 0
+			if (self.Throughput != None):
+				nextChunkSeconds = self.ChunkSize / self.Throughput
+			if ((now - stepStart) + nextChunkSeconds > self.Budget):
+				break
+		
+		self.Steps += 1
+		return self.Done
+	
+	# Updates the throughput estimate and the chunk size with one finished chunk
+	def measure(self, verts, seconds):
+		self.VertsDone += verts
+		if (verts <= 0 or seconds <= 0):
+			return
+		
+		throughput = verts / seconds
+		if (self.Throughput == None):
+			self.Throughput = throughput
+		else:
+			self.Throughput = (0.7 * self.Throughput) + (0.3 * throughput)
+		self.ChunkSize = max(self.MinChunkSize, int(self.Throughput * self.Budget * ModalWorkChunkFraction))
+
+
+
+#
+#====================================================================================================
+#    Progress reporting
+#====================================================================================================
+#
 
+# Minimum seconds between two progress updates to the UI. Updating the progress cursor and the status report every chunk would spend more time redrawing than working.
+ProgressUpdateInterval = 0.25
+
+### Formats a duration in seconds for the status report (e.g. "0:42" or "1:05:42")
+def FormatDuration(seconds):
+	seconds = int(math.ceil(seconds))
+	(minutes, seconds) = divmod(seconds, 60)
+	(hours, minutes) = divmod(minutes, 60)
+	if (hours > 0):
+		return "%d:%02d:%02d" % (hours, minutes, seconds)
+	return "%d:%02d" % (minutes, seconds)
+
+### Tracks the progress of a long operation, shows it on the window manager's progress cursor, and estimates the time remaining
+# Work is counted in any unit (usually verts). Kernels advance the progress once per chunk of work, never per vert, and the UI is only updated once per ProgressUpdateInterval.
+# Params:
+# - total: Total amount of work for the whole operation
+# - (optional) unit: Name of the unit of work, for StatusText()
+# - (optional) interval: Minimum seconds between UI updates. Defaults to ProgressUpdateInterval.
+class ProgressReporter():
+	def __init__(self, total, unit="verts", interval=None):
+		self.Total = total
+		self.Unit = unit
+		self.Interval = interval
+		if (self.Interval == None):
+			self.Interval = ProgressUpdateInterval
+		self.Done = 0
+		self.StartTime = time.perf_counter()
+		self.LastUpdateTime = None
+		bpy.context.window_manager.progress_begin(0, max(total, 1))
+	
+	### Sets the amount of work done so far. Returns True if the UI was updated, which happens at most once per interval (so the caller knows when to refresh its status report too).
+	# Params:
+	# - done: Total amount of work done since the start of the operation
+	# - (optional) force: If true, the UI is updated even if the last update was less than an interval ago
+	def Update(self, done, force=False):
+		self.Done = done
+		now = time.perf_counter()
+		if (not force and self.LastUpdateTime != None and (now - self.LastUpdateTime) < self.Interval):
+			return False
+		self.LastUpdateTime = now
+		bpy.context.window_manager.progress_update(done)
+		return True
+	
+	### Adds to the amount of work done so far. Returns True if the UI was updated.
+	def Advance(self, amount, force=False):
+		return self.Update(self.Done + amount, force)
+	
+	### Work done per second since the start of the operation, or None if nothing has been done yet
+	def Throughput(self):
+		seconds = time.perf_counter() - self.StartTime
+		if (self.Done <= 0 or seconds <= 0):
+			return None
+		return self.Done / seconds
+	
+	### Estimated seconds until all work is done, or None if there is no estimate yet
+	def ETA(self):
+		throughput = self.Throughput()
+		if (throughput == None):
+			return None
+		return max(0, self.Total - self.Done) / throughput
+	
+	### Short summary of the progress for the status report (e.g. "37% (1.2M verts/s, 0:04 left)")
+	def StatusText(self):
+		percent = 100
+		if (self.Total > 0):
+			percent = min(100, int(100 * self.Done / self.Total))
+		throughput = self.Throughput()
+		if (throughput == None):
+			return str(percent) + "%"
+		return str(percent) + "% (" + FormatCount(throughput) + " " + self.Unit + "/s, " + FormatDuration(self.ETA()) + " left)"
+	
+	### Removes the progress cursor
+	def Finish(self):
+		bpy.context.window_manager.progress_end()
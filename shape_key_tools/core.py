@@ -0,0 +1,528 @@
+# ////////////////////////////////////////////////////////////////////////////////////////////////////
+# //
+# //    Core Methods
+# //    - The shape key math and name logic, working on plain arrays and lists instead of Blender data
+# //    - Must not import bpy, mathutils, or anything else from this addon, so it can be loaded outside of Blender
+# //    - Outside of Blender, load it by file path: importing the shape_key_tools package imports bpy
+# //
+# ////////////////////////////////////////////////////////////////////////////////////////////////////
+
+import sys, math
+
+try:
+	import numpy as np
+except ImportError: # only the name logic and the per-vertex filter kernel are available without numpy
+	np = None
+
+
+#
+#====================================================================================================
+#    Helpers
+#====================================================================================================
+#
+
+### Simple bezier interpolation for values in 0-1
+# Works on both single numbers and numpy arrays
+def InterpBezier(x):
+	return (3.0 * x * x) - (2.0 * x * x * x)
+
+### Converts a split axis option (e.g. "+X" or "-Z") into the index of the vertex coordinate component and the sign used to determine the "left" side
+def GetSplitAxis(optAxis):
+	axis = 0
+	if (optAxis == "+X" or optAxis == "-X"):
+		axis = 0
+	elif (optAxis == "+Y" or optAxis == "-Y"):
+		axis = 1
+	elif (optAxis == "+Z" or optAxis == "-Z"):
+		axis = 2
+	axisFlip = 1
+	if optAxis[0] == "-":
+		axisFlip = -1
+	return (axis, axisFlip)
+
+### Linear interpolation between two 3 item sequences, like mathutils.Vector.lerp()
+def Lerp(a, b, t):
+	return ((a[0] + ((b[0] - a[0]) * t)), (a[1] + ((b[1] - a[1]) * t)), (a[2] + ((b[2] - a[2]) * t)))
+
+
+
+#
+#====================================================================================================
+#    Names
+#====================================================================================================
+#
+
+### Validates the provided shape key name as non-existent and modifies it with Blender's .001, .002, etc styling if it does exist
+# existingNames can be anything that supports "in" (a set, a dict, a ShapeKeyNameIndex, etc)
+def ValidateName(name, existingNames):
+	newName = name
+	conflict = (newName in existingNames)
+	numConflicts = 0
+	while (conflict):
+		numConflicts += 1
+		if (numConflicts <= 999):
+			newName = name + "." + "{:03d}".format(numConflicts)
+		else:
+			newName = name + "." + str(numConflicts)
+		conflict = (newName in existingNames)
+	return newName
+
+### Given a shape key name, determines the new names if this shape key was to be split into L and R halves
+# Returns (newLeftName, newRightName, usesPairNameConvention)
+def PairSplitNames(originalShapeKeyName):
+	if ('+' in originalShapeKeyName):
+		nameCuts = originalShapeKeyName.split("+")
+		if (nameCuts[0].lower()[-1] == "l" and nameCuts[1].lower()[-1] == "r"):
+			return (nameCuts[0], nameCuts[1], True)
+		elif (nameCuts[1].lower()[-1] == "l" and nameCuts[0].lower()[-1] == "r"):
+			return (nameCuts[1], nameCuts[0], True)
+		# else: shape key name has a + in it, but the string halves on either side of that + do not end in L and R
+	
+	return (originalShapeKeyName + "L", originalShapeKeyName + "R", False)
+
+### Given a shape key name, determines the expected name of the complementary shape key (the L for the R, or the R for the L) and the name of the final shape key if they two were merged
+# Returns (shapeKeyName, expectedCompShapeKeyName, mergedShapeKeyName). The last two are None if shapeKeyName does not end in L or R.
+def PairMergeNames(shapeKeyName):
+	expectedCompShapeKeyName = None
+	mergedShapeKeyName = None
+	if shapeKeyName[-1] == "L":
+		expectedCompShapeKeyName = shapeKeyName[:-1] + "R"
+		mergedShapeKeyName = shapeKeyName + "+" + expectedCompShapeKeyName
+	if shapeKeyName[-1] == "R":
+		expectedCompShapeKeyName = shapeKeyName[:-1] + "L"
+		mergedShapeKeyName = expectedCompShapeKeyName + "+" + shapeKeyName
+	return (shapeKeyName, expectedCompShapeKeyName, mergedShapeKeyName)
+
+
+
+#
+#====================================================================================================
+#    Shape Key Order
+#====================================================================================================
+#
+
+### Plans how to rearrange a shape key list into the target order using as few TOP/BOTTOM shape key moves as possible
+# Keeps the longest run of consecutive target order keys that are already in the right order relative to each other, then moves every key before that run to the TOP (in reverse order) and every key after that run to the BOTTOM (in order)
+# Returns a list of (shapeKeyName, moveType) where moveType is "TOP" or "BOTTOM"
+# Params:
+# - currentOrder: List of the names of all shape keys, in their current order
+# - targetOrder: List of the same names, in the desired order. The basis shape key (key 0) cannot be moved.
+def PlanShapeKeyReorder(currentOrder, targetOrder):
+	currentOrder = list(currentOrder)
+	targetOrder = list(targetOrder)
+	if (sorted(currentOrder) != sorted(targetOrder)):
+		raise Exception("The target shape key order must contain exactly the same shape keys as the current order")
+	if (len(currentOrder) == 0):
+		return []
+	if (currentOrder[0] != targetOrder[0]):
+		raise Exception("The basis shape key cannot be reordered")
+	
+	currentIndices = {}
+	for (index, name) in enumerate(currentOrder):
+		currentIndices[name] = index
+	
+	# Find the longest run of the target order (excluding the basis) whose keys are already in increasing order in the current order
+	movableKeys = targetOrder[1:]
+	runStart = 0
+	bestRunStart = 0
+	bestRunLength = 0
+	for i in range(len(movableKeys)):
+		if (i > 0 and currentIndices[movableKeys[i]] < currentIndices[movableKeys[i - 1]]):
+			runStart = i
+		if (i - runStart + 1 > bestRunLength):
+			bestRunStart = runStart
+			bestRunLength = i - runStart + 1
+	
+	moves = []
+	for name in reversed(movableKeys[:bestRunStart]):
+		moves.append((name, "TOP"))
+	for name in movableKeys[(bestRunStart + bestRunLength):]:
+		moves.append((name, "BOTTOM"))
+	return moves
+
+
+
+#
+#====================================================================================================
+#    Vertex Filtering
+#====================================================================================================
+#
+
+### Reads the vertex filter parameters dictionary, filling in defaults for the conditions that are not enabled
+def ParseVertexFilterParams(params):
+	deltaDistanceMin = 0
+	if ("DeltaDistanceMin" in params):
+		deltaDistanceMin = params["DeltaDistanceMin"]
+	
+	deltaDistanceMax = sys.float_info.max
+	if ("DeltaDistanceMax" in params):
+		deltaDistanceMax = params["DeltaDistanceMax"]
+	
+	vertexGroupIndex = None
+	if ("VertexGroupIndex" in params):
+		vertexGroupIndex = int(params["VertexGroupIndex"], 10) # int() because blender requires a string identifier for EnumProperty value IDs (numbers cause silent errors)
+	
+	return (deltaDistanceMin, deltaDistanceMax, vertexGroupIndex)
+
+### Index of which verts belong to which vertex groups, with their weights
+# Uses a CSR layout: the verts of vertex group g are VertIndices[GroupStarts[g]:GroupStarts[g + 1]] (sorted ascending) and their weights are the same slice of Weights
+# Params:
+# - vertCount: Number of verts in the mesh
+# - numGroups: Number of vertex groups
+# - groups, vertIndices, weights: One entry per (vert, vertex group) membership, in ascending vert order
+class VertexGroupCSR():
+	def __init__(self, vertCount, numGroups, groups, vertIndices, weights):
+		self.VertCount = vertCount
+		groups = np.asarray(groups, dtype=np.int32)
+		
+		order = np.argsort(groups, kind="mergesort") # stable sort, so each group's verts stay in ascending order
+		self.VertIndices = np.asarray(vertIndices, dtype=np.int32)[order]
+		self.Weights = np.asarray(weights, dtype=np.float32)[order]
+		self.GroupStarts = np.zeros(numGroups + 1, dtype=np.int64)
+		if (len(groups) > 0):
+			np.cumsum(np.bincount(groups, minlength=numGroups)[:numGroups], out=self.GroupStarts[1:])
+		
+		self.Masks = {}
+	
+	### Gets the sorted array of the indices of the verts that belong to the specified vertex group
+	def GetVertIndices(self, vertexGroupIndex):
+		if (vertexGroupIndex < 0 or vertexGroupIndex >= len(self.GroupStarts) - 1):
+			return self.VertIndices[0:0]
+		return self.VertIndices[self.GroupStarts[vertexGroupIndex]:self.GroupStarts[vertexGroupIndex + 1]]
+	
+	### Gets the weights of the verts returned by GetVertIndices()
+	def GetWeights(self, vertexGroupIndex):
+		if (vertexGroupIndex < 0 or vertexGroupIndex >= len(self.GroupStarts) - 1):
+			return self.Weights[0:0]
+		return self.Weights[self.GroupStarts[vertexGroupIndex]:self.GroupStarts[vertexGroupIndex + 1]]
+	
+	### Gets a boolean array with True for every vert that belongs to the specified vertex group
+	def GetMask(self, vertexGroupIndex):
+		if (not vertexGroupIndex in self.Masks):
+			mask = np.zeros(self.VertCount, dtype=bool)
+			mask[self.GetVertIndices(vertexGroupIndex)] = True
+			self.Masks[vertexGroupIndex] = mask
+		return self.Masks[vertexGroupIndex]
+
+### Creates a vertex filtering mask kernel function per the provided parameters
+# The kernel filters all verts at once. It takes an (n, 3) array of deltas and a VertexGroupCSR, and returns a boolean array with True for RED verts and False for BLACK verts.
+def CreateVertexFilterMaskKernel(params):
+	(deltaDistanceMin, deltaDistanceMax, vertexGroupIndex) = ParseVertexFilterParams(params)
+	filterDeltaDistance = ("DeltaDistanceMin" in params or "DeltaDistanceMax" in params)
+	
+	def filterMask(deltas, groupIndex):
+		mask = np.ones(len(deltas), dtype=bool)
+		
+		if (filterDeltaDistance):
+			deltaLengths = np.sqrt(np.einsum("ij,ij->i", deltas, deltas, dtype=np.float64)) # each vert's delta length is computed exactly once
+			mask &= (deltaLengths >= deltaDistanceMin)
+			mask &= (deltaLengths <= deltaDistanceMax)
+		
+		if (vertexGroupIndex != None):
+			mask &= groupIndex.GetMask(vertexGroupIndex)
+		
+		return mask
+	
+	return filterMask
+
+### Creates a per-vertex filtering kernel function per the provided parameters
+# Same filter conditions as CreateVertexFilterMaskKernel, for code that works one vert at a time. The kernel takes the vert's vertex group indices and its delta (any 3 item sequence).
+def CreateVertexFilterKernel(params):
+	(deltaDistanceMin, deltaDistanceMax, vertexGroupIndex) = ParseVertexFilterParams(params)
+	
+	def filter(vertVGIndices, delta):
+		deltaLength = math.sqrt((delta[0] * delta[0]) + (delta[1] * delta[1]) + (delta[2] * delta[2]))
+		return (
+			(deltaLength >= deltaDistanceMin and deltaLength <= deltaDistanceMax)
+			and
+			(vertexGroupIndex == None or vertexGroupIndex in vertVGIndices)
+		)
+	
+	return filter
+
+
+
+#
+#====================================================================================================
+#    Pair Split/Merge
+#====================================================================================================
+#
+
+### Computes, for every vert, how much of a to-be-split shape key's delta goes into the right side shape key (the left side gets 1 minus this)
+# Follows the same rules as the legacy per-vertex split loop: verts exactly on the split axis belong to the left side, and verts within smoothDistance of the split axis are crossfaded with InterpBezier
+# Params:
+# - basisCoords: (n, 3) array of the basis shape key's vertex positions
+# - optAxis: The world axis which determines which verts go into the "left" and "right" halves
+# - smoothDistance: Distance in world space from the origin of the split axis to crossblend the split shape keys. 0 disables smoothing.
+def ComputePairSplitWeights(basisCoords, optAxis, smoothDistance):
+	(axis, axisFlip) = GetSplitAxis(optAxis)
+	axisSplitCoords = basisCoords[:, axis].astype(np.float64) * axisFlip
+	
+	if (smoothDistance == 0):
+		# Sharp split
+		return (axisSplitCoords < 0).astype(np.float32)
+	else:
+		# Verts beyond the smoothing region are clamped to 0 (left side) or 1 (right side)
+		t = np.clip((smoothDistance - axisSplitCoords) / (2.0 * smoothDistance), 0.0, 1.0)
+		return InterpBezier(t).astype(np.float32)
+
+### Splits a shape key's vertex positions into left and right halves
+# Returns the (n, 3) arrays (leftCoords, rightCoords)
+# Params:
+# - basisCoords: (n, 3) array of the basis shape key's vertex positions
+# - sourceCoords: (n, 3) array of the to-be-split shape key's vertex positions
+# - rightWeights: (n, 1) array of weights from ComputePairSplitWeights()
+def SplitPairCoords(basisCoords, sourceCoords, rightWeights):
+	# Each side gets its weighted share of the original deltas. The weights are 0 or 1 outside of the smoothing region and crossfaded inside of it.
+	deltas = sourceCoords - basisCoords
+	return (basisCoords + (deltas * (1.0 - rightWeights)), basisCoords + (deltas * rightWeights))
+
+### Computes, for every vert, whether it is on the right (-aXis) side of the split axis. Verts exactly on the split axis belong to the left side.
+# Returns an (n, 1) boolean array
+def ComputeRightSideMask(basisCoords, optAxis):
+	(axis, axisFlip) = GetSplitAxis(optAxis)
+	return ((basisCoords[:, axis] * axisFlip) < 0)[:, None]
+
+### Merges a left and right shape key's vertex positions into one (n, 3) array
+# Params:
+# - basisCoords: (n, 3) array of the basis shape key's vertex positions
+# - leftCoords: (n, 3) array of the "left" side shape key's vertex positions
+# - rightCoords: (n, 3) array of the "right" side shape key's vertex positions
+# - rightSideMask: (n, 1) array from ComputeRightSideMask()
+# - mode: Name of the mode to use for merging the left and right deltas ("overwrite" or "additive")
+def MergePairCoords(basisCoords, leftCoords, rightCoords, rightSideMask, mode):
+	if (mode == "overwrite"):
+		# Verts on the -aXis (right) side come from the right shape key. Verts on the +aXis (left) side and in the center come from the left shape key.
+		return np.where(rightSideMask, rightCoords, leftCoords)
+	elif (mode == "additive"):
+		# Add the deltas of both the left and right halves together
+		return leftCoords + (rightCoords - basisCoords)
+	else:
+		raise Exception("Unknown merge mode '" + str(mode) + "'")
+
+
+
+#
+#====================================================================================================
+#    Blend Modes
+#====================================================================================================
+#
+
+### Division which leaves the dividend unchanged where the divisor is zero
+# This is the divide blend mode's policy for zero components in Shape Key 2's deltas, which would otherwise produce inf/nan positions or a ZeroDivisionError
+def SafeDivide(dividend, divisor):
+	if (divisor == 0):
+		return dividend
+	return dividend / divisor
+
+# Vectorized blend mode functions
+# Each one takes the (n, 3) arrays of lower (Shape Key 1) and upper (Shape Key 2) deltas plus the blend mode params dictionary, and returns the (n, 3) array of blended deltas
+def BlendDeltasAdd(lowerDeltas, upperDeltas, params):
+	return lowerDeltas + upperDeltas
+
+def BlendDeltasSubtract(lowerDeltas, upperDeltas, params):
+	return lowerDeltas - upperDeltas
+
+def BlendDeltasMultiply(lowerDeltas, upperDeltas, params):
+	return lowerDeltas * upperDeltas
+
+def BlendDeltasDivide(lowerDeltas, upperDeltas, params):
+	zeroDivisor = (upperDeltas == 0)
+	return np.where(zeroDivisor, lowerDeltas, lowerDeltas / np.where(zeroDivisor, 1, upperDeltas))
+
+def BlendDeltasOver(lowerDeltas, upperDeltas, params):
+	return upperDeltas
+
+def BlendDeltasLerp(lowerDeltas, upperDeltas, params):
+	factor = min(max(0, params["Factor"]), 1)
+	return lowerDeltas + ((upperDeltas - lowerDeltas) * factor)
+
+# Blend mode name (as used by the Combine Two Shape Keys op) -> vectorized blend function
+BlendModeFunctions = {
+	"add": BlendDeltasAdd,
+	"subtract": BlendDeltasSubtract,
+	"multiply": BlendDeltasMultiply,
+	"divide": BlendDeltasDivide,
+	"over": BlendDeltasOver,
+	"lerp": BlendDeltasLerp,
+}
+
+### Blends two shape keys' vertex positions
+# Returns the (n, 3) array of the new destination shape key vertex positions
+# Params:
+# - basisCoords, lowerCoords, upperCoords: (n, 3) arrays of the basis, lower (Shape Key 1), and upper (Shape Key 2) shape key vertex positions
+# - blendMode: Name of the blend mode
+# - blendModeParams: Dictionary of parameters specific to the chosen blend mode
+# - (optional) vertsPassFilter: (n,) boolean array of RED (True) and BLACK (False) verts. Only RED verts are blended. If None, all verts are blended.
+# - (optional) destinationCoords: (n, 3) array of the destination shape key's current vertex positions, which BLACK verts keep. Required if vertsPassFilter is used.
+def BlendCoords(basisCoords, lowerCoords, upperCoords, blendMode, blendModeParams, vertsPassFilter=None, destinationCoords=None):
+	newCoords = basisCoords + BlendModeFunctions[blendMode](lowerCoords - basisCoords, upperCoords - basisCoords, blendModeParams)
+	if (vertsPassFilter is not None):
+		newCoords = np.where(vertsPassFilter[:, None], newCoords, destinationCoords)
+	return newCoords
+
+
+
+#
+#====================================================================================================
+#    Filter Split
+#====================================================================================================
+#
+
+### Splits filtered deltas off from a shape key's vertex positions
+# Returns (newCoords, newSourceCoords). newSourceCoords is None in "copy" mode, since the source shape key is left unchanged.
+# Params:
+# - basisCoords: (n, 3) array of the basis shape key's vertex positions
+# - sourceCoords: (n, 3) array of the source shape key's vertex positions
+# - vertsPassFilter: (n,) boolean array of RED (True) and BLACK (False) verts
+# - mode: Name of the split mode to use ("copy" or "move")
+def FilterSplitCoords(basisCoords, sourceCoords, vertsPassFilter, mode):
+	vertsPassFilter = vertsPassFilter[:, None]
+	
+	# RED deltas make it into the new shape key. BLACK deltas do not (those verts stay at their basis pos defined in the basis shape key).
+	newCoords = np.where(vertsPassFilter, sourceCoords, basisCoords)
+	newSourceCoords = None
+	if (mode == "move"):
+		# Neutralize the RED deltas in the original shape key
+		newSourceCoords = np.where(vertsPassFilter, basisCoords, sourceCoords)
+	return (newCoords, newSourceCoords)
+
+
+
+#
+#====================================================================================================
+#    Linear Deformers
+#====================================================================================================
+#
+
+# Many deform modifiers (Armature at a fixed pose, Hook, Lattice, Mesh Deform, Simple Deform, etc.) act on each vert like an affine map, at least locally
+# For those, a shape key's deformed vertex positions are the deformed basis plus each vert's deltas transformed by that vert's 3x3 Jacobian
+# The Jacobians are fit by evaluating the deformer on the basis and on the basis nudged a small step along each axis. That is only 4 evaluations, no matter how many shape keys there are.
+
+### Creates the 4 sets of vertex positions to evaluate a deformer on for FitPerVertexLinearMap(): the basis, and the basis moved a small step along +X, +Y, and +Z
+# Returns a list of 4 (n, 3) float32 arrays
+# Params:
+# - basisCoords: (n, 3) array of the basis shape key's vertex positions
+# - step: Distance to move the verts along each axis. It should be small compared to the mesh, but large enough that float32 rounding doesn't swamp it.
+def CreateLinearMapProbes(basisCoords, step):
+	basisCoords = np.asarray(basisCoords, dtype=np.float32)
+	probes = [basisCoords]
+	for axis in range(3):
+		probe = basisCoords.copy()
+		probe[:, axis] += step
+		probes.append(probe)
+	return probes
+
+### Fits a per-vertex linear map to a deformer from its results on the probes from CreateLinearMapProbes()
+# Returns an (n, 3, 3) float64 array of each vert's Jacobian, which maps a delta from the basis to a delta from the deformed basis
+# Params:
+# - probes: The 4 (n, 3) arrays from CreateLinearMapProbes()
+# - deformedProbes: The 4 (n, 3) arrays of the deformer's results on the probes, in the same order
+def FitPerVertexLinearMap(probes, deformedProbes):
+	basisCoords = np.asarray(probes[0], dtype=np.float64)
+	deformedBasisCoords = np.asarray(deformedProbes[0], dtype=np.float64)
+	jacobians = np.empty((len(basisCoords), 3, 3), dtype=np.float64)
+	for axis in range(3):
+		# The step that each vert actually moved, after float32 rounding
+		steps = np.asarray(probes[axis + 1][:, axis], dtype=np.float64) - basisCoords[:, axis]
+		jacobians[:, :, axis] = (np.asarray(deformedProbes[axis + 1], dtype=np.float64) - deformedBasisCoords) / steps[:, None]
+	return jacobians
+
+### Deforms any number of shape keys at once with the per-vertex linear maps from FitPerVertexLinearMap()
+# Returns a (k, n, 3) float32 array of the deformed vertex positions
+# Params:
+# - jacobians: (n, 3, 3) array from FitPerVertexLinearMap()
+# - basisCoords: (n, 3) array of the basis shape key's vertex positions, before deforming
+# - deformedBasisCoords: (n, 3) array of the basis shape key's vertex positions, after deforming
+# - keyCoords: (k, n, 3) array of the shape keys' vertex positions, before deforming
+def ApplyPerVertexLinearMap(jacobians, basisCoords, deformedBasisCoords, keyCoords):
+	deltas = np.asarray(keyCoords, dtype=np.float64) - np.asarray(basisCoords, dtype=np.float64)
+	newCoords = np.einsum("nij,knj->kni", jacobians, deltas)
+	newCoords += deformedBasisCoords
+	return newCoords.astype(np.float32)
+
+### Builds each vert's blended linear blend skinning matrix, the same way that Blender's Armature modifier deforms verts with vertex groups
+# Each vert is moved by the weighted average of its bones' deform matrices, in the armature object's space. Verts without any (nonzero) bone weights are not moved.
+# Returns an (n, 3, 4) float64 array of affine matrices, which map the mesh object's space to itself
+# Params:
+# - groupIndex: VertexGroupCSR of the mesh's vertex groups
+# - boneMatrices: Dict of {vertex group index: 4x4 deform matrix} for each deforming bone with a vertex group. A bone's deform matrix is its pose matrix times its inverted rest matrix.
+# - meshToArmature: 4x4 matrix from the mesh object's space to the armature object's space
+# - (optional) maskWeights: (n,) array of the modifier's vertex group mask weights, or None to deform all verts fully
+def BuildSkinningMatrices(groupIndex, boneMatrices, meshToArmature, maskWeights=None):
+	vertCount = groupIndex.VertCount
+	identity = np.identity(4)
+	
+	# Only the verts in each bone's vertex group are touched, so this scales with the number of weights rather than verts * bones
+	blended = np.zeros((vertCount, 4, 4), dtype=np.float64)
+	totalWeights = np.zeros(vertCount, dtype=np.float64)
+	for (vertexGroupIndex, boneMatrix) in boneMatrices.items():
+		vertIndices = groupIndex.GetVertIndices(vertexGroupIndex)
+		weights = groupIndex.GetWeights(vertexGroupIndex).astype(np.float64)
+		blended[vertIndices] += weights[:, None, None] * (np.asarray(boneMatrix, dtype=np.float64) - identity)
+		totalWeights[vertIndices] += weights
+	
+	# Blender ignores a vert's bones if their weights are (nearly) all zero
+	deformed = (totalWeights > 0.0001)
+	blended[deformed] /= totalWeights[deformed, None, None]
+	blended[~deformed] = 0.0
+	blended += identity
+	
+	# Into the armature's space, deform, and back out again
+	meshToArmature = np.asarray(meshToArmature, dtype=np.float64)
+	matrices = np.matmul(np.matmul(np.linalg.inv(meshToArmature), blended), meshToArmature)
+	
+	# The mask vertex group blends between the deformed and the original vertex positions
+	if (maskWeights is not None):
+		maskWeights = np.asarray(maskWeights, dtype=np.float64)[:, None, None]
+		matrices = identity + (matrices - identity) * maskWeights
+	
+	return matrices[:, :3, :]
+
+### Combines two sets of per-vertex affine matrices from BuildSkinningMatrices() into one set, which applies inner first and then outer
+def ComposeSkinningMatrices(outer, inner):
+	matrices = np.matmul(outer[:, :, :3], inner)
+	matrices[:, :, 3] += outer[:, :, 3]
+	return matrices
+
+
+
+#
+#====================================================================================================
+#    Sparse Shape Keys
+#====================================================================================================
+#
+
+### Finds the verts that a shape key moves away from the basis at all
+# Returns a sorted array of the indices of the verts whose positions are not exactly the same as in the basis
+# Params:
+# - basisCoords: (n, 3) array of the basis shape key's vertex positions
+# - coords: (n, 3) array of the shape key's vertex positions
+def FindAffectedVerts(basisCoords, coords):
+	return np.flatnonzero(np.any(coords != basisCoords, axis=1))
+
+### Packs shape keys into groups where no two shape keys in a group move the same vert
+# For modifiers that act on each vert by itself, all of the shape keys in a group can share a single evaluation of the modifiers
+# Returns a list of lists of the indices (into affectedVerts) of the shape keys in each group, in order
+# Params:
+# - vertCount: Number of verts in the mesh
+# - affectedVerts: List of the arrays from FindAffectedVerts() of each shape key
+# - (optional) maxOpenGroups: How many of the most recently started groups a shape key tries to join before it starts a new group. Bounds the time and memory used on meshes with many shape keys.
+def PackDisjointShapeKeys(vertCount, affectedVerts, maxOpenGroups=8):
+	groups = []
+	openGroups = [] # (group, mask of the verts the group moves)
+	for (i, vertIndices) in enumerate(affectedVerts):
+		for (group, mask) in openGroups:
+			if (not mask[vertIndices].any()):
+				mask[vertIndices] = True
+				group.append(i)
+				break
+		else:
+			mask = np.zeros(vertCount, dtype=bool)
+			mask[vertIndices] = True
+			group = [i]
+			groups.append(group)
+			openGroups.append((group, mask))
+			if (len(openGroups) > maxOpenGroups):
+				openGroups.pop(0)
+	return groups
@@ -1,4 +1,4 @@
-import sys, os
+import sys, os, time
 
 import bpy
 from bpy.props import *
@@ -6,6 +6,35 @@ from bpy.props import *
 from shape_key_tools import common
 
 
+# Names of the modal events of each (work stage, work substage), for tracing
+ModalStepTraceNames = {
+	(0, 0): "Apply modifiers to base mesh",
+	(1, 0): "Apply modifiers to shape keys",
+	(2, 0): "Restore dependencies and clean up",
+}
+
+# Settings of the linear fast path (opt_linear_fast_path)
+# Step to probe the modifiers with, as a fraction of the size of the mesh
+LinearMapProbeStep = 0.01
+# How many shape keys are evaluated in full to check the linear map against. The ones that move the farthest from the basis are chosen, since they are the most likely to expose a nonlinear modifier.
+LinearMapCheckKeys = 3
+# Largest difference from the full evaluation that the linear map may have, as a fraction of the size of the mesh
+# Also used to check native armature skinning (opt_native_armature) against Blender's result on the base mesh
+LinearMapTolerance = 1e-4
+
+# Settings of skipping unchanged verts (opt_skip_unchanged)
+# Modifier types that move each vert based on nothing but its own position, so shape keys that move different verts can share one evaluation of them
+# Modifiers that look at the rest of the mesh (normals, bounds, neighbors) are left out, as are Displace and Wave when they move verts along normals
+LocalModifierTypes = {"ARMATURE", "HOOK", "LATTICE", "WARP", "DISPLACE", "WAVE", "UV_PROJECT", "UV_WARP", "VERTEX_WEIGHT_EDIT", "VERTEX_WEIGHT_MIX", "VERTEX_WEIGHT_PROXIMITY"}
+# Shape keys that move more than this fraction of the verts are always evaluated by themselves
+SparseShapeKeyFraction = 0.5
+
+# Name of this operation's checkpoints (common.ShapeKeyCheckpoint), which let a crashed or cancelled run be resumed
+CheckpointName = "apply_modifiers"
+# Seconds between checkpoint saves. Each save writes the shape keys finished since the last one, so a crash loses at most this much work.
+CheckpointInterval = 5.0
+
+
 class ShapeKeyTools_ApplyModifiersToShapeKeys_OptListItem(bpy.types.PropertyGroup):
 	type = StringProperty()
 	is_compatible = BoolProperty()
@@ -94,6 +123,30 @@ class WM_OT_ShapeKeyTools_ApplyModifiersToShapeKeys(bpy.types.Operator):
 		description = "Choose which modifiers to apply to the base mesh and its shape keys."
 	)
 	
+	opt_resume = BoolProperty(
+		name = "Resume Previous Run",
+		description = "Continue the previous run of this operation on the active object, which stopped before it finished (i.e. Blender crashed or it was cancelled). The modifiers chosen for that run are applied, and the shape keys it already finished are loaded from its checkpoint next to the .blend file instead of being done again.",
+		default = False,
+	)
+	
+	opt_native_armature = BoolProperty(
+		name = "Native Armature Skinning",
+		description = "If all of the chosen modifiers are Armature modifiers, skin every shape key with the bones' pose matrices and the vertex group weights directly, instead of evaluating the modifiers once per shape key. The result is checked against Blender's on the base mesh, and the other methods are used if it does not match. Not possible with bone envelopes, Preserve Volume, Multi Modifier, or B-Bones with segments. Needs numpy.",
+		default = True,
+	)
+	
+	opt_skip_unchanged = BoolProperty(
+		name = "Skip Unchanged Verts",
+		description = "Copy the modified base mesh to shape keys that do not move any verts, instead of evaluating the modifiers on them. If the modifiers act on each vert by itself (i.e. Armature, Hook, Lattice), shape keys that move different verts also share one evaluation of the modifiers.",
+		default = True,
+	)
+	
+	opt_linear_fast_path = BoolProperty(
+		name = "Linear Fast Path",
+		description = "Fit a per-vertex linear map to the modifiers and use it to apply them to all shape keys at once, instead of evaluating the modifiers once per shape key. Much faster for modifiers like Armature, Hook, Lattice, and Mesh Deform. The map is checked against a full evaluation of a few shape keys first, and every shape key is evaluated in full if it is not accurate enough. Needs numpy.",
+		default = False,
+	)
+	
 	
 	# report() doesnt print to console when running inside modal() for some weird reason
 	# So we have to do that manually
@@ -112,6 +165,17 @@ class WM_OT_ShapeKeyTools_ApplyModifiersToShapeKeys(bpy.types.Operator):
 		### Usage info
 		topBody.label("Apply modifiers (in stack order) to the base mesh and all of its shape keys.")
 		topBody.label("This operation may take a very long time, especially for detailed meshes with many shape keys.")
+		
+		### Resuming a previous run
+		resumeState = None
+		if (self._Resumable != None):
+			(checkpoint, resumeState) = self._Resumable
+		if (resumeState != None):
+			gResume = topBody.box().column()
+			gResume.label("A previous run on this object stopped after " + str(resumeState["curShapeKeyIndex"] - 1) + " of " + str(len(resumeState["shapeKeyNames"]) - 1) + " shape keys.", icon="RECOVER_LAST")
+			gResume.prop(self, "opt_resume")
+			if (self.opt_resume):
+				gResume.label("The modifiers of the previous run will be applied: " + ", ".join(resumeState["modifierApplyOrder"]))
 		for optListItem in self.opt_modifiers:
 			if (optListItem.is_compatible == False):
 				topBody.box().label("Modifiers that change vertex count cannot be applied.", icon="ERROR")
@@ -136,6 +200,11 @@ class WM_OT_ShapeKeyTools_ApplyModifiersToShapeKeys(bpy.types.Operator):
 				applyWrapper.prop(optListItem, "do_apply", text="Incompatible", icon="ERROR", emboss=False)
 			else:
 				applyWrapper.prop(optListItem, "do_apply", text="Apply Modifier", emboss=True)
+		
+		### Options
+		topBody.prop(self, "opt_native_armature")
+		topBody.prop(self, "opt_skip_unchanged")
+		topBody.prop(self, "opt_linear_fast_path")
 	
 	
 	def validate(self, context):
@@ -183,21 +252,76 @@ class WM_OT_ShapeKeyTools_ApplyModifiersToShapeKeys(bpy.types.Operator):
 		self.deselectAll()
 		self.activeSelect(context, obj)
 	
+	# Deletes one of the _DELETE_ME__ objects, and (if deleteMesh) its mesh too so it does not linger in the blend file until it is reloaded
+	def deleteHelperObject(self, context, obj, deleteMesh):
+		mesh = obj.data
+		self.singleSelect(context, obj)
+		with common.TraceSpan("object.delete", "bpy.ops"):
+			bpy.ops.object.delete()
+		if (deleteMesh):
+			bpy.data.meshes.remove(mesh)
+	
+	# Deletes the _DELETE_ME__ objects that a previous run on the object left behind, if it crashed before it could delete them itself
+	def deleteLeftoverHelperObjects(self, context, obj):
+		for suffix in ("__SCRATCH", "__RESULT"):
+			helperObj = context.scene.objects.get("_DELETE_ME__" + obj.name + suffix)
+			if (helperObj != None):
+				self.deleteHelperObject(context, helperObj, helperObj.data.users == 1)
+		self.singleSelect(context, obj)
+	
+	# Gets the object's checkpoint, and the state saved in it if it is from a previous run that can be resumed (else None)
+	# This fingerprints every shape key, so it is only done once per invoke (see _Resumable)
+	def findResumableCheckpoint(self, obj):
+		checkpoint = common.ShapeKeyCheckpoint(CheckpointName, obj)
+		state = checkpoint.Load()
+		if (state == None):
+			return (checkpoint, None)
+		
+		# The object must be the same as when the checkpoint was saved
+		try:
+			if (state["vertCount"] != len(obj.data.vertices)):
+				return (checkpoint, None)
+			if (state["shapeKeyNames"] != [keyBlock.name for keyBlock in obj.data.shape_keys.key_blocks]):
+				return (checkpoint, None)
+			for modifierName in state["modifierApplyOrder"]:
+				if (not modifierName in obj.modifiers):
+					return (checkpoint, None)
+			if (state["curShapeKeyIndex"] <= 1):
+				return (checkpoint, None)
+			# Nothing else may have been edited either (vertex positions, shape key settings, modifier settings)
+			if (state["fingerprint"] != common.ComputeCheckpointFingerprint(obj, state["modifierApplyOrder"])):
+				return (checkpoint, None)
+		except (KeyError, TypeError):
+			return (checkpoint, None)
+		
+		return (checkpoint, state)
+	
 	
 	### Persistent op data
 	_Timer = None
 	
+	_Resumable = None # (checkpoint, resumeState) from findResumableCheckpoint(), found by invoke() for draw() and execute()
+	
 	_Obj = None
 	_ModifierApplyOrder = []
 	_InvalidModifiers = {}
 	_ShapeKeyDependencies = {}
-	_ShapeKeyObj = None
-	_CurWorkspaceObj = None
+	_ScratchObj = None
+	_ResultObj = None
+	_Scheduler = None
 	_WorkStage = -1
 	_WorkSubstage = -1
 	_CurShapeKeyIndex = 0
 	_TotalShapeKeys = 0
 	_AnyWarnings = False
+	_Metrics = None
+	_Trace = None
+	_Progress = None
+	_Checkpoint = None
+	_CheckpointState = None
+	_CheckpointEnabled = False
+	_LastCheckpointTime = 0
+	_ResumeState = None
 	
 	
 	def execute(self, context):
@@ -213,18 +337,35 @@ class WM_OT_ShapeKeyTools_ApplyModifiersToShapeKeys(bpy.types.Operator):
 		# Many bpy.ops require a full UI update cycle when run in modal() but not when run in execute(). Both execute and modal are synchronous, so I don't see why this is the case... Blender is inconsistent and weird. What else is new?
 		# Ultimately, it means we have to juggle and spread out the work over an excessive amount of modal events
 		
-		# The chosen modifiers will be applied in stack order
-		chosenModifiers = []
-		for optListItem in self.opt_modifiers:
-			if (optListItem.do_apply):
-				chosenModifiers.append(optListItem.name)
-		self._ModifierApplyOrder = []
-		for modifier in obj.modifiers:
-			if (modifier.name in chosenModifiers):
-				self._ModifierApplyOrder.append(modifier.name)
+		if (self._Resumable != None):
+			(checkpoint, resumeState) = self._Resumable
+			self._Resumable = None
+		else:
+			(checkpoint, resumeState) = self.findResumableCheckpoint(obj)
+		if (self.opt_resume and resumeState != None):
+			# The previous run's modifiers will be applied again, and the shape keys that it finished will be loaded from its checkpoint
+			self._ModifierApplyOrder = list(resumeState["modifierApplyOrder"])
+		else:
+			if (self.opt_resume):
+				self.report({'WARNING'}, "There is no previous run on this object to resume. Starting over.")
+			resumeState = None
+			
+			# The chosen modifiers will be applied in stack order
+			chosenModifiers = []
+			for optListItem in self.opt_modifiers:
+				if (optListItem.do_apply):
+					chosenModifiers.append(optListItem.name)
+			self._ModifierApplyOrder = []
+			for modifier in obj.modifiers:
+				if (modifier.name in chosenModifiers):
+					self._ModifierApplyOrder.append(modifier.name)
 		
 		if (len(self._ModifierApplyOrder) > 0):
-			self._ModalWorkPacing = 0
+			# Clean up after a previous run that crashed
+			self.deleteLeftoverHelperObjects(context, obj)
+			if (resumeState == None):
+				checkpoint.Delete()
+			
 			self._WorkStage = 0
 			self._WorkSubstage = 0
 			self._Obj = obj
@@ -232,32 +373,48 @@ class WM_OT_ShapeKeyTools_ApplyModifiersToShapeKeys(bpy.types.Operator):
 			self._CurShapeKeyIndex = 0
 			self._InvalidModifiers = {}
 			self._AnyWarnings = False
+			self._ScratchObj = None
+			self._ResultObj = None
+			self._Metrics = common.OperationMetrics(self.bl_label, obj) # before the modifiers change the vert count
+			self._Trace = common.BeginTrace(self.bl_label)
 			
-			# Flatten the shape key dependency tree by making all shape keys relative to the first shape key (which *should* be the basis, but Blender does not enforce this... nothing we can do, sadly)
+			# Keep track of the shape key dependency tree so we can restore it on the new shape keys later
 			self._ShapeKeyDependencies = {}
 			for keyBlock in obj.data.shape_keys.key_blocks:
-				self._ShapeKeyDependencies[keyBlock.name] = keyBlock.relative_key.name # keep track of the dependencies so we can restore them later
-				keyIndex = obj.data.shape_keys.key_blocks.keys().index(keyBlock.name)
-				if (keyIndex > 0):
-					keyBlock.relative_key = obj.data.shape_keys.key_blocks[0] # "it just works" because setting relative_key makes blender recalculate the shape key deltas to be relative to the new local basis shape key
+				self._ShapeKeyDependencies[keyBlock.name] = keyBlock.relative_key.name
+			if (resumeState != None):
+				self._ShapeKeyDependencies = dict(resumeState["shapeKeyDependencies"])
 			
-			# Duplicate the active object so we can separate its shape keys from its base mesh and work on them independently
-			self.singleSelect(context, obj)
-			bpy.ops.object.duplicate()
-			self._ShapeKeyObj = context.scene.objects.active
-			self._ShapeKeyObj.name = "_DELETE_ME__ " + obj.name + "__SKALL" # bold name in case the op fails and this doesnt get deleted and the user sees it
-			
-			# Set the active object's active shape key to what we need for the next modal event
-			obj.active_shape_key_index = self._TotalShapeKeys - 1
+			# Everything needed to resume this run, which is saved to the checkpoint every CheckpointInterval seconds
+			self._Checkpoint = checkpoint
+			self._ResumeState = resumeState
+			self._CheckpointState = {
+				"object": obj.name,
+				"vertCount": len(obj.data.vertices),
+				"shapeKeyNames": [keyBlock.name for keyBlock in obj.data.shape_keys.key_blocks],
+				"modifierApplyOrder": self._ModifierApplyOrder,
+				"shapeKeyDependencies": self._ShapeKeyDependencies,
+				"curShapeKeyIndex": 1,
+				"fingerprint": None,
+			}
+			self._CheckpointEnabled = (checkpoint.Directory != None)
+			if (resumeState != None):
+				self._CheckpointState["fingerprint"] = resumeState["fingerprint"]
+			elif (self._CheckpointEnabled):
+				# The original object is not changed until the very last modal event, so this stays valid for the whole run
+				self._CheckpointState["fingerprint"] = common.ComputeCheckpointFingerprint(obj, self._ModifierApplyOrder)
+			self._LastCheckpointTime = time.perf_counter()
+			if (checkpoint.Directory == None):
+				self.report({'INFO'}, "The .blend file has not been saved, so this run cannot be resumed if it is interrupted")
 			
 			# Preemptively report what will happen in the next modal stage so we can save a modal event right off the bat
 			self.report({'INFO'}, "Applying modifiers to base mesh")
 			
 			# Begin the next stage of work in the modal events
 			context.window_manager.modal_handler_add(self)
-			self._Timer = context.window_manager.event_timer_add(0.1, context.window)
-			context.window_manager.progress_begin(0, self._TotalShapeKeys + 0.1)
-			context.window_manager.progress_update(0.1)
+			self._Timer = context.window_manager.event_timer_add(0.01, context.window)
+			self._Progress = common.ProgressReporter(self._TotalShapeKeys, "shape keys")
+			self._Progress.Update(0.1)
 			
 			self.report({'INFO'}, "Preparing to apply " + str(len(self._ModifierApplyOrder)) + " modifiers to the base mesh + all " + str(self._TotalShapeKeys - 1) + " shape keys")
 			return {"RUNNING_MODAL"}
@@ -267,21 +424,45 @@ class WM_OT_ShapeKeyTools_ApplyModifiersToShapeKeys(bpy.types.Operator):
 	
 	# Work on one shape key per modal event
 	def modal(self, context, event):
+		if (event.type == "ESC"):
+			self.rollback(context)
+			return {"CANCELLED"}
+		
+		if (event.type != "TIMER"):
+			return {"PASS_THROUGH"}
+		
+		with common.TraceSpan(ModalStepTraceNames.get((self._WorkStage, self._WorkSubstage), "Modal step"), "modal"):
+			result = self.modalStep(context, event)
+		if (result == {"CANCELLED"}): # modalStep only returns CANCELLED when all work is done
+			self.endTrace()
+		return result
+	
+	def modalStep(self, context, event):
 		if event.type == "TIMER":
 			obj = self._Obj
-			skObj = self._ShapeKeyObj
-			workspaceObj = self._CurWorkspaceObj
+			scratchObj = self._ScratchObj
+			resultObj = self._ResultObj
 			
 			# This operation is complex and procedes through several work stages that carefully distributes the work in order to appease modal()'s weird behavior oddities
 			if (self._WorkStage == 0):
 				### Very first modal event
+				# All of the work is done on duplicates and the active object is left untouched until the very last modal event, so cancelling only needs to delete the duplicates
+				# Duplicate the active object without its shape keys, as a scratch object for evaluating the modifiers on each shape key
 				self.singleSelect(context, obj)
+				with common.TraceSpan("object.duplicate", "bpy.ops"):
+					bpy.ops.object.duplicate()
+				scratchObj = context.scene.objects.active
+				scratchObj.name = "_DELETE_ME__" + obj.name + "__SCRATCH" # bold name in case the op fails and this doesnt get deleted and the user sees it
+				self._ScratchObj = scratchObj
+				with common.TraceSpan("object.shape_key_remove", "bpy.ops", {"all": True}):
+					bpy.ops.object.shape_key_remove(all=True)
 				
-				# Remove all shape keys
-				basisShapeKeyName = obj.data.shape_keys.key_blocks[0].name
-				self.singleSelect(context, obj)
-				for i in range(self._TotalShapeKeys):
-					bpy.ops.object.shape_key_remove()
+				# Duplicate the scratch object again, for the base mesh with the modifiers applied. The new shape keys are added to it as they are finished.
+				with common.TraceSpan("object.duplicate", "bpy.ops"):
+					bpy.ops.object.duplicate()
+				resultObj = context.scene.objects.active
+				resultObj.name = "_DELETE_ME__" + obj.name + "__RESULT"
+				self._ResultObj = resultObj
 				
 				# Apply the user's chosen modifiers to the base mesh
 				for modifierName in self._ModifierApplyOrder:
@@ -291,126 +472,96 @@ class WM_OT_ShapeKeyTools_ApplyModifiersToShapeKeys(bpy.types.Operator):
 					# All we can really do is ignore it if it fails to apply and just keep going
 					if (not modifierName in self._InvalidModifiers):
 						try:
-							bpy.ops.object.modifier_apply(apply_as="DATA", modifier=modifierName)
+							with common.TraceSpan("object.modifier_apply", "bpy.ops", {"modifier": modifierName}):
+								bpy.ops.object.modifier_apply(apply_as="DATA", modifier=modifierName)
 						except RuntimeError as e:
 							self._InvalidModifiers[modifierName] = True
 							self._AnyWarnings = True
 							self.preport("[!!!!!] WARNING: Modifier '" + modifierName + "' failed to apply! Modifier will be skipped on shape keys. Modifier configuration is likely invalid. [!!!!!]", "WARNING")
 				
 				# Create the new basis shape key
-				bpy.ops.object.shape_key_add()
-				obj.data.shape_keys.key_blocks[0].name = basisShapeKeyName
+				with common.TraceSpan("object.shape_key_add", "bpy.ops"):
+					bpy.ops.object.shape_key_add()
+				resultObj.data.shape_keys.key_blocks[0].name = obj.data.shape_keys.key_blocks[0].name
+				
+				# The scratch object only evaluates the modifiers which were applied to the base mesh
+				for modifier in scratchObj.modifiers:
+					modifier.show_viewport = (modifier.name in self._ModifierApplyOrder and not modifier.name in self._InvalidModifiers)
 				
 				# On to the per-shape key work
 				self._CurShapeKeyIndex = 1 # start the per-shape key work with the first "real" shape key (skip the basis shape key)
+				self._Scheduler = common.ChunkedWorkScheduler(self.applyChunks(context))
 				self._WorkStage = 1
 				self._WorkSubstage = 0
-				context.window_manager.progress_update(1)
+				self._Progress.Update(1)
 			
 			elif (self._WorkStage == 1):
-				### Process each shape key in turn
-				# Substages here allow for UI update cycles to appease the Blender deities and rid us of the voodoo that happens in modal()
-				curShapeKeyName = skObj.data.shape_keys.key_blocks[self._CurShapeKeyIndex].name
-				
-				if (self._WorkSubstage == 0):
-					# Notify for the shape key we are about to process
-					self.preport("Applying modifiers to shape key " + str(self._CurShapeKeyIndex) + "/" + str(self._TotalShapeKeys - 1) + " '" + curShapeKeyName + "'")
-					
-					# Set the active shape key index to that shape key
-					skObj.active_shape_key_index = skObj.data.shape_keys.key_blocks.keys().index(curShapeKeyName)
-					
-					self._WorkSubstage = 1
-					
-				elif (self._WorkSubstage == 1):
-					# Idle to improve the odds that Blender will actually show the previous report()
-					self._WorkSubstage = 2
-				
-				elif (self._WorkSubstage == 2):
-					# Duplicate the shape key object
-					self.singleSelect(context, skObj)
-					bpy.ops.object.duplicate()
-					workspaceObj = context.scene.objects.active
-					workspaceObj.name = "_DELETE_ME__" + obj.name + "__SK_" + curShapeKeyName
-					self._CurWorkspaceObj = workspaceObj
-					
-					# Move the shape key we are interested in to the end of the list
-					self.singleSelect(context, workspaceObj)
-					bpy.ops.object.shape_key_move(type="BOTTOM")
-					
-					# Set the active shape key in preparation for the next substage
-					workspaceObj.active_shape_key_index = len(workspaceObj.data.shape_keys.key_blocks.keys()) - 2
-					
-					self._WorkSubstage = 3
-				
-				elif (self._WorkSubstage == 3):
-					# Apply the active shape key to the base mesh
-					self.singleSelect(context, workspaceObj)
-					for i in range(len(workspaceObj.data.shape_keys.key_blocks.keys())):
-						bpy.ops.object.shape_key_remove()
-					
-					# Apply the user's chosen modifiers to the base mesh
-					for modifierName in self._ModifierApplyOrder:
-						if (not modifierName in self._InvalidModifiers):
-							try:
-								bpy.ops.object.modifier_apply(apply_as="DATA", modifier=modifierName)
-							except RuntimeError as e:
-								self._InvalidModifiers[modifierName] = True
-								self._AnyWarnings = True
-								self.preport("[!!!!!] WARNING: Modifier '" + modifierName + "' failed to apply! Modifier configuration is likely invalid. [!!!!!]", "WARNING")
-					
-					# Add the workspace obj back to the source object as a new shape key
-					self.singleSelect(context, workspaceObj)
-					self.activeSelect(context, obj)
-					bpy.ops.object.join_shapes() # always puts the new shape key at the end of the list
-					newShapeKey = obj.data.shape_keys.key_blocks[len(obj.data.shape_keys.key_blocks.keys()) - 1]
-					newShapeKey.name = curShapeKeyName
-					
-					# Copy the original shape key's pose parameters to the new shape key
-					origShapeKey = skObj.data.shape_keys.key_blocks[skObj.data.shape_keys.key_blocks.keys().index(curShapeKeyName)]
-					newShapeKey.slider_min = origShapeKey.slider_min
-					newShapeKey.slider_max = origShapeKey.slider_max
-					newShapeKey.value = origShapeKey.value
-					newShapeKey.interpolation = origShapeKey.interpolation
-					newShapeKey.vertex_group = origShapeKey.vertex_group # this is a string, not a VertexGroup
-					newShapeKey.mute = origShapeKey.mute
-					# relative_key will be set in the final work segment
-					
-					# Delete the workspace object
-					self.singleSelect(context, workspaceObj)
-					bpy.ops.object.delete()
-					
-					# On to the next shape key
-					self._CurShapeKeyIndex += 1
+				### Process as many shape keys per modal event as fit in the scheduler's time budget
+				if (self._Scheduler.Step()): # all shape keys done
+					self._Scheduler = None
+					self._WorkStage = 2
 					self._WorkSubstage = 0
-					context.window_manager.progress_update(self._CurShapeKeyIndex)
-					
-					if (self._CurShapeKeyIndex > self._TotalShapeKeys - 1):
-						self._WorkStage = 2
-						self._WorkSubstage = 0
-					#else: # Still have more shape keys to go
+				else:
+					self.saveCheckpoint()
+				
+				# The progress cursor and status report are only updated a few times per second
+				if (self._Progress.Update(self._CurShapeKeyIndex)):
+					self.report({'INFO'}, "Applied modifiers to " + str(self._CurShapeKeyIndex - 1) + "/" + str(self._TotalShapeKeys - 1) + " shape keys: " + self._Progress.StatusText() + " - Esc to cancel")
 			
 			elif (self._WorkStage == 2):
 				### Final things and tidying up
-				self.singleSelect(context, obj)
-				
 				# Restore the blend shape dependencies
-				for keyBlock in obj.data.shape_keys.key_blocks:
+				nameIndex = common.ShapeKeyNameIndex(resultObj)
+				for keyBlock in resultObj.data.shape_keys.key_blocks:
 					relKey = None
 					relKeyName = self._ShapeKeyDependencies[keyBlock.name]
-					if (relKeyName in obj.data.shape_keys.key_blocks):
-						relKeyIndex = obj.data.shape_keys.key_blocks.keys().index(relKeyName)
-						keyBlock.relative_key = obj.data.shape_keys.key_blocks[relKeyIndex]
+					if (relKeyName in nameIndex):
+						relKeyIndex = nameIndex.IndexOf(relKeyName)
+						keyBlock.relative_key = resultObj.data.shape_keys.key_blocks[relKeyIndex]
 				# In my testing, the blend file must be saved and Blender restarted in order to later change the relative keys using the shape key panel
 				
-				# Delete the shape key object
-				self.singleSelect(context, skObj)
-				bpy.ops.object.delete()
+				# Swap the finished mesh into the original object and remove the modifiers that were applied to it
+				oldMesh = obj.data
+				meshName = oldMesh.name
+				sharedMesh = (oldMesh.users > 1)
+				if (sharedMesh):
+					# Linked duplicates use the same mesh and must keep using it, so the results are written into it instead
+					self.writeResultIntoMesh(resultObj.data, oldMesh)
+				else:
+					obj.data = resultObj.data
+				for modifierName in self._ModifierApplyOrder:
+					if (not modifierName in self._InvalidModifiers):
+						obj.modifiers.remove(obj.modifiers[modifierName])
+				
+				# Some modifiers (i.e. Data Transfer) can create new vertex groups when applied, which belong to the object instead of the mesh
+				for vertexGroup in resultObj.vertex_groups:
+					if (not vertexGroup.name in obj.vertex_groups):
+						obj.vertex_groups.new(name=vertexGroup.name)
+				
+				# Delete the scratch and result objects
+				self.deleteHelperObject(context, scratchObj, True)
+				self.deleteHelperObject(context, resultObj, sharedMesh) # unless its mesh now belongs to the original object
+				self._ScratchObj = None
+				self._ResultObj = None
+				
+				# Remove the original mesh if nothing uses it anymore
+				if (not sharedMesh):
+					if (oldMesh.users == 0):
+						bpy.data.meshes.remove(oldMesh)
+					obj.data.name = meshName
 				
 				# Reselect the original object
 				self.singleSelect(context, obj)
 				
+				# The run can't be resumed anymore once the original object has the result
+				self._Checkpoint.Delete()
+				self._Checkpoint = None
+				self._ResumeState = None
+				
 				# Done
-				bpy.context.window_manager.progress_end()
+				self._Progress.Finish()
+				self._Progress = None
+				self._Metrics.Finish(self._TotalShapeKeys) # the base mesh + every non-basis shape key
 				self.cancel(context)
 				if (self._AnyWarnings):
 					self.preport("Some modifiers failed to apply. Check console for details.", "ERROR")
@@ -423,6 +574,334 @@ class WM_OT_ShapeKeyTools_ApplyModifiersToShapeKeys(bpy.types.Operator):
 		
 		return {"PASS_THROUGH"}
 	
+	# Generator of the per-shape key work for the scheduler
+	# With native armature skinning or the linear fast path, a batch of shape keys is done per chunk. Otherwise (or if their checks fail), the modifiers are evaluated on one shape key per chunk.
+	def applyChunks(self, context):
+		obj = self._Obj
+		keyBlocks = obj.data.shape_keys.key_blocks
+		engine = common.ResolveKernelEngine()
+		
+		# Load the shape keys that the previous run finished, instead of applying the modifiers to them again
+		if (self._ResumeState != None):
+			yield from self.resumeChunks(engine)
+		
+		# The fast paths are quick enough to just run again, so they are not checkpointed
+		if (self.opt_native_armature and engine == "numpy"):
+			armatureMap = yield from self.buildArmatureMap(context)
+			if (armatureMap != None):
+				self._CheckpointEnabled = False
+				yield from self.applyLinearMapChunks(armatureMap)
+				return
+		
+		if (self.opt_linear_fast_path):
+			if (engine == "numpy"):
+				linearMap = yield from self.fitLinearMap(context)
+				if (linearMap != None):
+					self._CheckpointEnabled = False
+					yield from self.applyLinearMapChunks(linearMap)
+					return
+			else:
+				self.preport("The linear fast path needs numpy. The modifiers will be evaluated on every shape key.")
+		
+		unchangedShapeKeys = set()
+		shapeKeyGroups = {}
+		groupResults = {}
+		if (self.opt_skip_unchanged):
+			(unchangedShapeKeys, shapeKeyGroups) = yield from self.scanShapeKeys(context, engine)
+			# The result object's basis is the base mesh with the modifiers applied
+			resultBasis = self._ResultObj.data.shape_keys.key_blocks[0]
+			if (engine == "numpy"):
+				deformedBasisCoords = common.ReadCoords(resultBasis.data)
+			else:
+				deformedBasisCoords = common.ReadCoordsList(resultBasis.data)
+		
+		while (self._CurShapeKeyIndex < self._TotalShapeKeys):
+			origShapeKey = keyBlocks[self._CurShapeKeyIndex]
+			
+			if (self._CurShapeKeyIndex in unchangedShapeKeys):
+				# The modifiers' result is the same as on the base mesh
+				self.preport("Copying the modified base mesh to shape key " + str(self._CurShapeKeyIndex) + "/" + str(self._TotalShapeKeys - 1) + " '" + origShapeKey.name + "', which does not move any verts")
+				coords = deformedBasisCoords
+			
+			elif (self._CurShapeKeyIndex in shapeKeyGroups):
+				# Evaluate the modifiers once for the whole group, the first time one of its shape keys comes up
+				if (not self._CurShapeKeyIndex in groupResults):
+					group = shapeKeyGroups[self._CurShapeKeyIndex]
+					self.preport("Applying modifiers to shape key " + str(self._CurShapeKeyIndex) + "/" + str(self._TotalShapeKeys - 1) + " '" + origShapeKey.name + "' and " + str(len(group) - 1) + " more shape keys at once, since they move different verts")
+					groupCoords = common.ReadCoords(keyBlocks[0].data)
+					for (i, vertIndices) in group:
+						groupCoords[vertIndices] = common.ReadCoords(keyBlocks[i].data)[vertIndices]
+					evaluatedCoords = common.EvaluateModifiers(self._ScratchObj, groupCoords, context.scene, engine)
+					for (i, vertIndices) in group:
+						groupResults[i] = (vertIndices, evaluatedCoords[vertIndices])
+				
+				# Every other vert is the same as in the modified base mesh
+				(vertIndices, affectedCoords) = groupResults.pop(self._CurShapeKeyIndex)
+				coords = deformedBasisCoords.copy()
+				coords[vertIndices] = affectedCoords
+			
+			else:
+				self.preport("Applying modifiers to shape key " + str(self._CurShapeKeyIndex) + "/" + str(self._TotalShapeKeys - 1) + " '" + origShapeKey.name + "'")
+				
+				# Put the shape key's vertex positions on the scratch object, evaluate its modifiers, and write the result straight into a new shape key on the result object
+				if (engine == "numpy"):
+					coords = common.EvaluateModifiers(self._ScratchObj, common.ReadCoords(origShapeKey.data), context.scene, engine)
+				else:
+					coords = common.EvaluateModifiers(self._ScratchObj, common.ReadCoordsList(origShapeKey.data), context.scene, engine)
+			
+			self.addResultShapeKey(origShapeKey, coords, engine)
+			
+			self._CurShapeKeyIndex += 1
+			yield len(coords)
+	
+	# Generator for the scheduler, which finds the shape keys that do not move any verts, and (for modifiers that act on each vert by itself) groups the sparse shape keys that move different verts
+	# Returns (set of the indices of the unchanged shape keys, dict of {shape key index: list of the (shape key index, affected vert indices) in its group})
+	def scanShapeKeys(self, context, engine):
+		obj = self._Obj
+		keyBlocks = obj.data.shape_keys.key_blocks
+		groupSparse = (engine == "numpy" and self.areModifiersLocal())
+		
+		unchangedShapeKeys = set()
+		sparseShapeKeys = [] # (shape key index, affected vert indices)
+		if (engine == "numpy"):
+			basisCoords = common.ReadCoords(keyBlocks[0].data)
+		else:
+			basisCoords = common.ReadCoordsList(keyBlocks[0].data)
+		for i in range(self._CurShapeKeyIndex, self._TotalShapeKeys):
+			if (engine == "numpy"):
+				vertIndices = common.FindAffectedVerts(basisCoords, common.ReadCoords(keyBlocks[i].data))
+				if (len(vertIndices) == 0):
+					unchangedShapeKeys.add(i)
+				elif (groupSparse and len(vertIndices) <= len(basisCoords) * SparseShapeKeyFraction):
+					sparseShapeKeys.append((i, vertIndices))
+			else:
+				if (common.ReadCoordsList(keyBlocks[i].data) == basisCoords):
+					unchangedShapeKeys.add(i)
+			yield len(basisCoords)
+		
+		shapeKeyGroups = {}
+		numGroups = 0
+		if (len(sparseShapeKeys) > 0):
+			for groupIndices in common.PackDisjointShapeKeys(len(basisCoords), [vertIndices for (i, vertIndices) in sparseShapeKeys]):
+				if (len(groupIndices) > 1): # a group of one is no different from evaluating the shape key by itself
+					group = [sparseShapeKeys[j] for j in groupIndices]
+					for (i, vertIndices) in group:
+						shapeKeyGroups[i] = group
+					numGroups += 1
+		
+		self.preport(str(len(unchangedShapeKeys)) + " shape keys do not move any verts. " + str(len(shapeKeyGroups)) + " sparse shape keys share " + str(numGroups) + " evaluations of the modifiers.")
+		return (unchangedShapeKeys, shapeKeyGroups)
+	
+	# Checks whether every applied modifier moves each vert based on nothing but its own position
+	def areModifiersLocal(self):
+		for modifierName in self._ModifierApplyOrder:
+			if (modifierName in self._InvalidModifiers):
+				continue
+			modifier = self._Obj.modifiers[modifierName]
+			if (not modifier.type in LocalModifierTypes):
+				return False
+			if (modifier.type == "DISPLACE" and modifier.direction in ("NORMAL", "CUSTOM_NORMAL")):
+				return False
+			if (modifier.type == "WAVE" and modifier.use_normal):
+				return False
+		return True
+	
+	# Generator for the scheduler, which builds the native linear blend skinning map of the Armature modifiers and checks it against Blender's result on the base mesh
+	# Returns the common.ArmatureLinearMap, or None if the modifiers are not all supported Armature modifiers or the check fails
+	def buildArmatureMap(self, context):
+		obj = self._Obj
+		appliedModifiers = [modifierName for modifierName in self._ModifierApplyOrder if not modifierName in self._InvalidModifiers]
+		if (len(appliedModifiers) == 0):
+			return None
+		
+		problem = common.FindArmatureSkinningProblem(obj, appliedModifiers)
+		if (problem != None):
+			# Only worth mentioning if there are Armature modifiers to skin in the first place
+			if (any(obj.modifiers[modifierName].type == "ARMATURE" for modifierName in appliedModifiers)):
+				self.preport("Native armature skinning is not possible: " + problem + ".")
+			return None
+		
+		self.preport("Skinning the shape keys with the armature bones")
+		basisCoords = common.ReadCoords(obj.data.shape_keys.key_blocks[0].data)
+		with common.TraceSpan("Build skinning matrices", "kernel"):
+			armatureMap = common.ArmatureLinearMap(obj, appliedModifiers, basisCoords)
+		yield len(basisCoords)
+		
+		# The result object's basis is Blender's own result of applying the modifiers to the base mesh
+		error = armatureMap.Error(basisCoords, common.ReadCoords(self._ResultObj.data.shape_keys.key_blocks[0].data))
+		if (error > LinearMapTolerance):
+			self.preport("Native armature skinning does not match Blender's result on the base mesh (error: " + "{:.2e}".format(error) + " of the mesh size), so it will not be used.", "WARNING")
+			return None
+		
+		self.preport("Native armature skinning matches Blender's result on the base mesh with an error of " + "{:.2e}".format(error) + " of the mesh size")
+		return armatureMap
+	
+	# Generator for the scheduler, which fits a linear map to the modifiers and checks it against a full evaluation of the modifiers on a few shape keys
+	# Returns the common.ModifierLinearMap, or None if it is not accurate enough
+	def fitLinearMap(self, context):
+		keyBlocks = self._Obj.data.shape_keys.key_blocks
+		
+		self.preport("Fitting a linear map to the modifiers")
+		with common.TraceSpan("Fit linear map", "kernel"):
+			linearMap = common.ModifierLinearMap(self._ScratchObj, common.ReadCoords(keyBlocks[0].data), context.scene, LinearMapProbeStep)
+		yield len(linearMap.BasisCoords) * 4
+		
+		# Check the map on the shape keys that move the farthest
+		deltaSizes = []
+		for i in range(1, self._TotalShapeKeys):
+			coords = common.ReadCoords(keyBlocks[i].data)
+			deltaSizes.append((linearMap.DeltaSize(coords), i))
+			yield len(coords)
+		deltaSizes.sort(key=lambda item: item[0], reverse=True)
+		
+		maxError = 0.0
+		for (deltaSize, i) in deltaSizes[:LinearMapCheckKeys]:
+			self.preport("Checking the linear map against shape key '" + keyBlocks[i].name + "'")
+			coords = common.ReadCoords(keyBlocks[i].data)
+			maxError = max(maxError, linearMap.Error(coords, common.EvaluateModifiers(self._ScratchObj, coords, context.scene, "numpy")))
+			yield len(coords)
+		
+		if (maxError > LinearMapTolerance):
+			self.preport("The modifiers are not linear enough for the linear fast path (error: " + "{:.2e}".format(maxError) + " of the mesh size). The modifiers will be evaluated on every shape key.")
+			return None
+		
+		self.preport("Linear map fit with an error of " + "{:.2e}".format(maxError) + " of the mesh size")
+		return linearMap
+	
+	# Generator for the scheduler, which applies the modifiers to as many shape keys per chunk as fit in the scheduler's chunk size, with a linear map from fitLinearMap()
+	def applyLinearMapChunks(self, linearMap):
+		keyBlocks = self._Obj.data.shape_keys.key_blocks
+		vertCount = len(linearMap.BasisCoords)
+		
+		while (self._CurShapeKeyIndex < self._TotalShapeKeys):
+			batchSize = max(1, self._Scheduler.ChunkSize // max(1, vertCount))
+			batch = range(self._CurShapeKeyIndex, min(self._TotalShapeKeys, self._CurShapeKeyIndex + batchSize))
+			self.preport("Applying modifiers to shape keys " + str(batch[0]) + "-" + str(batch[-1]) + "/" + str(self._TotalShapeKeys - 1))
+			
+			# All of the shape keys in the batch are transformed in one array op
+			origShapeKeys = [keyBlocks[i] for i in batch]
+			newCoords = linearMap.Apply([common.ReadCoords(origShapeKey.data) for origShapeKey in origShapeKeys])
+			for (origShapeKey, coords) in zip(origShapeKeys, newCoords):
+				self.addResultShapeKey(origShapeKey, coords, "numpy")
+			
+			self._CurShapeKeyIndex += len(batch)
+			yield vertCount * len(batch)
+	
+	# Generator for the scheduler, which adds the shape keys that the previous run finished to the result object from its checkpoint
+	def resumeChunks(self, engine):
+		keyBlocks = self._Obj.data.shape_keys.key_blocks
+		resumeIndex = self._ResumeState["curShapeKeyIndex"]
+		self.preport("Resuming the previous run after shape key " + str(resumeIndex - 1) + "/" + str(self._TotalShapeKeys - 1))
+		
+		while (self._CurShapeKeyIndex < resumeIndex):
+			origShapeKey = keyBlocks[self._CurShapeKeyIndex]
+			try:
+				coords = self._Checkpoint.LoadCoords(self._CurShapeKeyIndex, engine)
+				if (len(coords) != self._CheckpointState["vertCount"]):
+					raise ValueError("wrong vertex count")
+			except (OSError, ValueError) as e:
+				# Do the rest of the shape keys over again
+				self.preport("Could not load shape key '" + origShapeKey.name + "' from the checkpoint (" + str(e) + "). The modifiers will be applied to it and the shape keys after it again.", "WARNING")
+				break
+			self.addResultShapeKey(origShapeKey, coords, engine)
+			
+			self._CurShapeKeyIndex += 1
+			yield len(coords)
+		
+		# The checkpoint's files are good up to here, so the next save continues after the loaded shape keys
+		self._CheckpointState["curShapeKeyIndex"] = self._CurShapeKeyIndex
+		self._ResumeState = None
+	
+	# Adds a shape key with the given (already modified) vertex positions to the result object, with the same pose parameters as the original shape key
+	def addResultShapeKey(self, origShapeKey, coords, engine):
+		newShapeKey = self._ResultObj.shape_key_add(name=origShapeKey.name, from_mix=False)
+		if (engine == "numpy"):
+			common.WriteCoords(newShapeKey.data, coords)
+		else:
+			common.WriteCoordsList(newShapeKey.data, coords)
+		
+		# Copy the original shape key's pose parameters to the new shape key
+		newShapeKey.slider_min = origShapeKey.slider_min
+		newShapeKey.slider_max = origShapeKey.slider_max
+		newShapeKey.value = origShapeKey.value
+		newShapeKey.interpolation = origShapeKey.interpolation
+		newShapeKey.vertex_group = origShapeKey.vertex_group # this is a string, not a VertexGroup
+		newShapeKey.mute = origShapeKey.mute
+		# relative_key will be set in the final work segment
+		
+		return newShapeKey
+	
+	# Saves the shape keys that were finished since the last save to the checkpoint
+	# Does nothing if the last save was less than CheckpointInterval seconds ago, unless force is True
+	def saveCheckpoint(self, force=False):
+		if (not self._CheckpointEnabled or self._ResultObj == None):
+			return
+		if (not force and time.perf_counter() - self._LastCheckpointTime < CheckpointInterval):
+			return
+		
+		# The shape keys are added to the result object in order, so each new shape key has the same index as its original one
+		resultKeyBlocks = self._ResultObj.data.shape_keys.key_blocks
+		savedIndex = self._CheckpointState["curShapeKeyIndex"]
+		finishedIndex = len(resultKeyBlocks)
+		if (finishedIndex > savedIndex):
+			engine = common.ResolveKernelEngine()
+			with common.TraceSpan("Save checkpoint", "kernel", {"shapeKeys": finishedIndex - savedIndex}):
+				for i in range(savedIndex, finishedIndex):
+					if (engine == "numpy"):
+						self._Checkpoint.SaveCoords(i, common.ReadCoords(resultKeyBlocks[i].data), engine)
+					else:
+						self._Checkpoint.SaveCoords(i, common.ReadCoordsList(resultKeyBlocks[i].data), engine)
+				self._CheckpointState["curShapeKeyIndex"] = finishedIndex
+				self._Checkpoint.Save(self._CheckpointState)
+		self._LastCheckpointTime = time.perf_counter()
+	
+	# Writes the vertex positions of the finished mesh and its shape keys into the original mesh, for when it cannot be swapped out
+	# Only the positions are written. Anything else the modifiers changed on the mesh (i.e. vertex weights from Data Transfer) is left as it was for the mesh's other users.
+	def writeResultIntoMesh(self, resultMesh, mesh):
+		engine = common.ResolveKernelEngine()
+		# The shape keys are added to the result object in order, so each new shape key has the same index as its original one
+		resultKeyBlocks = resultMesh.shape_keys.key_blocks
+		keyBlocks = mesh.shape_keys.key_blocks
+		with common.TraceSpan("Write result into shared mesh", "kernel", {"shapeKeys": len(resultKeyBlocks)}):
+			for (resultVerts, verts) in [(resultMesh.vertices, mesh.vertices)] + [(resultKeyBlocks[i].data, keyBlocks[i].data) for i in range(len(resultKeyBlocks))]:
+				if (engine == "numpy"):
+					common.WriteCoords(verts, common.ReadCoords(resultVerts))
+				else:
+					common.WriteCoordsList(verts, common.ReadCoordsList(resultVerts))
+		mesh.update()
+	
+	# Undoes all of the work done so far, after the user cancels with Esc
+	def rollback(self, context):
+		# The original object is not changed until the very last modal event, so only the duplicates need to be deleted
+		self._Scheduler = None
+		with common.TraceSpan("Roll back", "modal"):
+			# Keep the shape keys finished since the last checkpoint save, so the run can be resumed later
+			self.saveCheckpoint(force=True)
+			for helperObj in (self._ScratchObj, self._ResultObj):
+				if (helperObj != None):
+					self.deleteHelperObject(context, helperObj, True)
+		self._ScratchObj = None
+		self._ResultObj = None
+		self.singleSelect(context, self._Obj)
+		self._Progress.Finish()
+		self._Progress = None
+		self.cancel(context)
+		finishedShapeKeys = self._CheckpointState["curShapeKeyIndex"] - 1
+		if (self._Checkpoint.Directory != None and finishedShapeKeys > 0):
+			self.preport("Cancelled. The object was not changed. Run this operation again to resume after shape key " + str(finishedShapeKeys) + "/" + str(self._TotalShapeKeys - 1) + ".")
+		else:
+			self.preport("Cancelled. The object was not changed.")
+		self._Checkpoint = None
+		self._ResumeState = None
+		self.endTrace()
+	
+	# Writes the trace file, if this run was traced
+	def endTrace(self):
+		tracePath = common.EndTrace(self._Trace)
+		self._Trace = None
+		if (tracePath != None):
+			self.preport("Trace written to " + tracePath)
+	
 	def cancel(self, context):
 		if (self._Timer != None):
 			context.window_manager.event_timer_remove(self._Timer)
@@ -438,6 +917,10 @@ class WM_OT_ShapeKeyTools_ApplyModifiersToShapeKeys(bpy.types.Operator):
 		
 		obj = context.object
 		
+		# Offer to resume the previous run if it stopped before it finished
+		self._Resumable = self.findResumableCheckpoint(obj)
+		self.opt_resume = (self._Resumable[1] != None)
+		
 		# Show all of the object's modifiers, but disable & mark the incompatible ones
 		self.opt_modifiers.clear()
 		for modifier in obj.modifiers:
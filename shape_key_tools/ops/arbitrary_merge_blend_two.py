@@ -234,7 +234,8 @@ class WM_OT_ShapeKeyTools_OpCombineTwo(bpy.types.Operator):
 			vertexFilterParams = properties.getEnabledVertexFilterParams()
 		
 		# Blend and merge
-		common.MergeAndBlendShapeKeys(
+		metrics = common.OperationMetrics(self.bl_label, obj)
+		writtenShapeKeys = common.MergeAndBlendShapeKeys(
 			obj,
 			obj.data.shape_keys.key_blocks[int(self.opt_shape_key_1, 10)].name,
 			obj.data.shape_keys.key_blocks[int(self.opt_shape_key_2, 10)].name,
@@ -245,6 +246,7 @@ class WM_OT_ShapeKeyTools_OpCombineTwo(bpy.types.Operator):
 			delete1OnFinish = self.opt_delete_shapekey1_on_finish,
 			delete2OnFinish = self.opt_delete_shapekey2_on_finish,
 		)
+		metrics.Finish(len(writtenShapeKeys))
 		
 		return{'FINISHED'}
 	
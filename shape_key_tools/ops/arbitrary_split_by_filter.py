@@ -92,7 +92,9 @@ class WM_OT_ShapeKeyTools_OpSplitByFilter(bpy.types.Operator):
 			vertexFilterParams = properties.getEnabledVertexFilterParams()
 		
 		# Do the split
-		common.SplitFilterActiveShapeKey(obj,  self.opt_new_shape_key_name, self.opt_mode, vertexFilterParams)
+		metrics = common.OperationMetrics(self.bl_label, obj)
+		writtenShapeKeys = common.SplitFilterActiveShapeKey(obj,  self.opt_new_shape_key_name, self.opt_mode, vertexFilterParams)
+		metrics.Finish(len(writtenShapeKeys))
 		
 		return {'FINISHED'}
 	
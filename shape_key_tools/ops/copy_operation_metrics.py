@@ -0,0 +1,34 @@
+import sys, os
+
+import bpy
+from bpy.props import *
+
+from shape_key_tools import common
+
+
+class WM_OT_ShapeKeyTools_OpCopyOperationMetrics(bpy.types.Operator):
+	bl_idname = "wm.shape_key_tools_copy_operation_metrics"
+	bl_label = "Copy Recent Operations"
+	bl_description = "Copies the timings of the most recent Shape Key Tools operations to the clipboard as text. Paste them into a bug report if an operation is slower than you expect."
+	
+	
+	@classmethod
+	def poll(cls, context):
+		return (len(common.OperationMetricsHistory) > 0)
+	
+	def execute(self, context):
+		context.window_manager.clipboard = common.FormatOperationMetricsHistory()
+		self.report({'INFO'}, "Copied the timings of " + str(len(common.OperationMetricsHistory)) + " recent operations to the clipboard")
+		return {'FINISHED'}
+
+
+def register():
+	bpy.utils.register_class(WM_OT_ShapeKeyTools_OpCopyOperationMetrics)
+	return WM_OT_ShapeKeyTools_OpCopyOperationMetrics
+
+def unregister():
+	bpy.utils.unregister_class(WM_OT_ShapeKeyTools_OpCopyOperationMetrics)
+	return WM_OT_ShapeKeyTools_OpCopyOperationMetrics
+
+if (__name__ == "__main__"):
+	register()
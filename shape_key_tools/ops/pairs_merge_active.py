@@ -71,11 +71,14 @@ class WM_OT_ShapeKeyTools_OpMergeActive(bpy.types.Operator):
 		# Find the name of the complementary shape key and the name of the to-be-merged shape key
 		(firstShapeKey, expectedCompShapeKey, mergedShapeKey) = common.FindShapeKeyMergeNames(obj.active_shape_key.name, validateWith=obj)
 		
+		metrics = common.OperationMetrics(self.bl_label, obj)
+		
 		# Merge em
 		if (firstShapeKey[-1] == "L"):
-			common.MergeShapeKeyPair(obj, properties.opt_shapepairs_split_axis, firstShapeKey, expectedCompShapeKey, mergedShapeKey, properties.opt_shapepairs_merge_mode)
+			writtenShapeKeys = common.MergeShapeKeyPair(obj, properties.opt_shapepairs_split_axis, firstShapeKey, expectedCompShapeKey, mergedShapeKey, properties.opt_shapepairs_merge_mode)
 		else:
-			common.MergeShapeKeyPair(obj, properties.opt_shapepairs_split_axis, expectedCompShapeKey, firstShapeKey, mergedShapeKey, properties.opt_shapepairs_merge_mode)
+			writtenShapeKeys = common.MergeShapeKeyPair(obj, properties.opt_shapepairs_split_axis, expectedCompShapeKey, firstShapeKey, mergedShapeKey, properties.opt_shapepairs_merge_mode)
+		metrics.Finish(len(writtenShapeKeys))
 		self.report({'INFO'}, "Merged shape key '" + firstShapeKey + "' with '"  + expectedCompShapeKey + "' to create new '" + mergedShapeKey + "'")
 		
 		return {'FINISHED'}
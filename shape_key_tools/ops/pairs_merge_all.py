@@ -67,10 +67,14 @@ class WM_OT_ShapeKeyTools_OpMergeAllPairs(bpy.types.Operator):
 	_MergeAxis = None
 	_MergeMode = None
 	_MergeBatch = []
+	_PairMergeBatch = None
+	_Metrics = None
+	_Trace = None
+	_Scheduler = None
+	_Progress = None
+	_Snapshot = None
 	_CurBatchNum = 0
-	_CurVert = 0
 	_TotalVerts = 0
-	_ModalWorkPacing = 0
 	
 	
 	def invoke(self, context, event):
@@ -93,10 +97,11 @@ class WM_OT_ShapeKeyTools_OpMergeAllPairs(bpy.types.Operator):
 		# Example: "HappyL" and "HappyR" becomes "HappyL+HappyR"
 		seen = {}
 		self._MergeBatch = []
+		nameIndex = common.ShapeKeyNameIndex(obj)
 		for keyBlock in obj.data.shape_keys.key_blocks:
 			if (not keyBlock.name in seen):
-				(firstShapeKey, expectedCompShapeKey, mergedShapeKey) = common.FindShapeKeyMergeNames(keyBlock.name, validateWith=obj)
-				if (expectedCompShapeKey != None and expectedCompShapeKey in obj.data.shape_keys.key_blocks.keys() and not expectedCompShapeKey in seen):
+				(firstShapeKey, expectedCompShapeKey, mergedShapeKey) = common.FindShapeKeyMergeNames(keyBlock.name, validateWith=obj, nameIndex=nameIndex)
+				if (expectedCompShapeKey != None and expectedCompShapeKey in nameIndex and not expectedCompShapeKey in seen):
 					if (keyBlock.name[-1] == "L"):
 						self._MergeBatch.append((firstShapeKey, expectedCompShapeKey, mergedShapeKey))
 					else:
@@ -110,31 +115,48 @@ class WM_OT_ShapeKeyTools_OpMergeAllPairs(bpy.types.Operator):
 			self._MergeAxis = properties.opt_shapepairs_split_axis
 			self._MergeMode = properties.opt_shapepairs_merge_mode
 			self._CurBatchNum = 0
-			self._CurVert = 0
 			self._TotalVerts = len(obj.data.vertices) * len(self._MergeBatch)
-			self._ModalWorkPacing = 0
+			self._Metrics = common.OperationMetrics(self.bl_label, obj)
+			self._Trace = common.BeginTrace(self.bl_label)
+			
+			# The basis shape key is read and the left/right side of each vert is computed only once for the entire batch
+			self._PairMergeBatch = common.PairMergeBatch(obj, self._MergeAxis, self._MergeMode)
+			
+			# The pairs are merged a chunk of verts at a time, in as many chunks per modal event as fit in the scheduler's time budget
+			self._Scheduler = common.ChunkedWorkScheduler(self.mergeChunks())
 			
 			self.preport("Preparing to merge " + str(len(self._MergeBatch) * 2) + " of " + str(len(obj.data.shape_keys.key_blocks)) + " total shape keys")
 			
-			context.window_manager.progress_begin(0, self._TotalVerts)
+			self._Progress = common.ProgressReporter(self._TotalVerts)
 			
 			if (self.opt_run_async):
+				# Save the shape keys that will be deleted, so they can be restored if the user cancels
+				self._Snapshot = common.ShapeKeySnapshot(obj, [name for (leftKey, rightKey, mergedName) in self._MergeBatch for name in (leftKey, rightKey)])
 				context.window_manager.modal_handler_add(self)
 				self._Timer = context.window_manager.event_timer_add(0.01, context.window)
 				return {"RUNNING_MODAL"}
 			else:
 				modalComplete = None
 				while (not modalComplete):
-					modalComplete = self.modalStep(context)
+					with common.TraceSpan("Work", "modal"):
+						modalComplete = self.modalStep(context)
+				self.endTrace()
 				return {"FINISHED"}
 			
 		else:
 			return {"FINISHED"}
 	
-	# Merge one shape key at a time per modal event
+	# Merge as many verts per modal event as fit in the scheduler's time budget
 	def modal(self, context, event):
+		if (event.type == "ESC"):
+			self.rollback(context)
+			return {"CANCELLED"}
+		
 		if (event.type == "TIMER"):
-			if (self.modalStep(context)): # modalStep only returns True when all work is done
+			with common.TraceSpan("Work", "modal"):
+				modalComplete = self.modalStep(context)
+			if (modalComplete): # modalStep only returns True when all work is done
+				self.endTrace()
 				return {"CANCELLED"}
 			else:
 				return {"PASS_THROUGH"}
@@ -142,48 +164,50 @@ class WM_OT_ShapeKeyTools_OpMergeAllPairs(bpy.types.Operator):
 		return {"PASS_THROUGH"}
 	
 	def modalStep(self, context):
-		obj = self._Obj
-		
-		(leftKey, rightKey, mergedName) = self._MergeBatch[self._CurBatchNum]
+		if (self._Scheduler.Step()): # all work completed
+			self._PairMergeBatch.Finish() # move all of the new shape keys into place at once
+			writtenShapeKeys = sum(len(mergedNames) for mergedNames in self._PairMergeBatch.MergedNames.values())
+			self._PairMergeBatch = None
+			self._Scheduler = None
+			self._Snapshot = None
+			self._Progress.Finish()
+			self._Progress = None
+			self._Metrics.Finish(writtenShapeKeys)
+			self.cancel(context)
+			self.preport("All shape keys pairs merged.")
+			return True
 		
-		# If we do work every modal() event (or even every 2nd or 3rd), the Blender UI will not update
-		# So we always wait a few modal pulses after finishing the last work segment before doing the next work segment
-		if (self._ModalWorkPacing == 0): # notify
-			# The UI needs one full update cycle after self.report() to display it, so we do this one modal event *before* the actual work
+		# The progress cursor and status report are only updated a few times per second, no matter how many chunks each modal event runs
+		if (self._Progress.Update(self._Scheduler.VertsDone) and self.opt_run_async):
+			self.report({'INFO'}, "Merging shape key pair " + str(self._CurBatchNum + 1) + "/" + str(len(self._MergeBatch)) + ": " + self._Progress.StatusText() + " - Esc to cancel")
+	
+	# Generator of all the work for the scheduler, which merges every shape key pair in the batch
+	def mergeChunks(self):
+		for (batchNum, (leftKey, rightKey, mergedName)) in enumerate(self._MergeBatch):
+			self._CurBatchNum = batchNum
 			self.preport("Merging shape key pair " + str(self._CurBatchNum + 1) + "/" + str(len(self._MergeBatch)) + " '" + leftKey + "' and '" + rightKey + "' into '" + mergedName + "'")
-			
-		elif (self._ModalWorkPacing == 1): # work
-			# Persistent parameters for all shape key merges
-			obj = self._Obj
-			axis = self._MergeAxis
-			mergeMode = self._MergeMode
-			
-			# Create async progress reporting data so the merge method can report progress to the window manager's progress cursor
-			asyncProgressReporting = {
-				"CurrentVert": self._CurVert,
-				"TotalVerts": self._TotalVerts,
-			}
-			
-			# Merge the two victim shape keys
-			common.MergeShapeKeyPair(obj, axis, leftKey, rightKey, mergedName, mergeMode, asyncProgressReporting=asyncProgressReporting)
-			
-			# Finalize this segment of the async work
-			self._CurVert = asyncProgressReporting["CurrentVert"]
-			self._CurBatchNum += 1
-			
-			if (self._CurBatchNum > len(self._MergeBatch) - 1):
-				# All work completed
-				bpy.context.window_manager.progress_end()
-				self.cancel(context)
-				self.preport("All shape keys pairs merged.")
-				return True
-			#else: # Need to do more work in the next modal
-			
-		#else: # rest
-		
-		self._ModalWorkPacing += 1
-		if (self._ModalWorkPacing > 3):
-			self._ModalWorkPacing = 0
+			for chunkVerts in self._PairMergeBatch.MergePairChunks(leftKey, rightKey, mergedName, scheduler=self._Scheduler):
+				yield chunkVerts
+	
+	# Undoes all of the work done so far, after the user cancels with Esc
+	def rollback(self, context):
+		self._Scheduler = None
+		self._PairMergeBatch = None
+		with common.TraceSpan("Roll back", "modal"):
+			self._Snapshot.Restore()
+		self._Snapshot = None
+		self._Progress.Finish()
+		self._Progress = None
+		self.cancel(context)
+		self.preport("Cancelled. All shape keys were restored.")
+		self.endTrace()
+	
+	# Writes the trace file, if this run was traced
+	def endTrace(self):
+		tracePath = common.EndTrace(self._Trace)
+		self._Trace = None
+		if (tracePath != None):
+			self.preport("Trace written to " + tracePath)
 	
 	def cancel(self, context):
 		if (self._Timer != None):
@@ -78,11 +78,14 @@ class WM_OT_ShapeKeyTools_OpSplitActivePair(bpy.types.Operator):
 		if (usesPlusConvention == False): # shape key name is not in MyShapeKeyL+MyShapeKeyR format
 			self.report({'INFO'}, "Shape key '" + obj.active_shape_key.name + "' does not use the 'MyShapeKeyL+MyShapeKeyR' naming convention!")
 		
+		metrics = common.OperationMetrics(self.bl_label, obj)
+		
 		# Split the active shape key
 		smoothingDistance = properties.opt_shapepairs_split_smoothdist
 		if (properties.opt_shapepairs_split_mode == "sharp"):
 			smoothingDistance = 0
-		common.SplitPairActiveShapeKey(obj, properties.opt_shapepairs_split_axis, splitLName, splitRName, smoothingDistance, self.opt_delete_original)
+		writtenShapeKeys = common.SplitPairActiveShapeKey(obj, properties.opt_shapepairs_split_axis, splitLName, splitRName, smoothingDistance, self.opt_delete_original)
+		metrics.Finish(len(writtenShapeKeys))
 		self.report({'INFO'}, "Split shape key '" + oldName + "' into left: '"  + splitLName + "' and right: '" + splitRName + "'")
 		
 		# If the user was previewing this split, disable the preview now and make active the shape key side that was being previewed (L or R)
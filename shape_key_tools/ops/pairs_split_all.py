@@ -80,10 +80,14 @@ class WM_OT_ShapeKeyTools_OpSplitAllPairs(bpy.types.Operator):
 	_SplitAxis = None
 	_SmoothingDistance = 0
 	_SplitBatch = []
+	_PairSplitBatch = None
+	_Metrics = None
+	_Trace = None
+	_Scheduler = None
+	_Progress = None
+	_Snapshot = None
 	_CurBatchNum = 0
-	_CurVert = 0
 	_TotalVerts = 0
-	_ModalWorkPacing = 0
 	
 	
 	def invoke(self, context, event):
@@ -108,8 +112,9 @@ class WM_OT_ShapeKeyTools_OpSplitAllPairs(bpy.types.Operator):
 		# - "HappyL+UnhappyR" becomes HappyL and UnhappyR (works, but bad names, cannot recombine later)
 		# - "Happyl+happyR" becomes "Happyl" and "happyR" (works, but bad names, cannot recombine later)
 		self._SplitBatch = []
+		nameIndex = common.ShapeKeyNameIndex(obj)
 		for keyBlock in obj.data.shape_keys.key_blocks:
-			(splitLName, splitRName, usesPlusConvention) = common.FindShapeKeyPairSplitNames(keyBlock.name, validateWith=obj)
+			(splitLName, splitRName, usesPlusConvention) = common.FindShapeKeyPairSplitNames(keyBlock.name, validateWith=obj, nameIndex=nameIndex)
 			if (splitLName != None and splitRName != None and usesPlusConvention == True):
 				self._SplitBatch.append((keyBlock.name, splitLName, splitRName))
 		
@@ -121,9 +126,15 @@ class WM_OT_ShapeKeyTools_OpSplitAllPairs(bpy.types.Operator):
 			if (properties.opt_shapepairs_split_mode == "sharp"):
 				self._SmoothingDistance = 0
 			self._CurBatchNum = 0
-			self._CurVert = 0
 			self._TotalVerts = len(obj.data.vertices) * len(self._SplitBatch)
-			self._ModalWorkPacing = 0
+			self._Metrics = common.OperationMetrics(self.bl_label, obj)
+			self._Trace = common.BeginTrace(self.bl_label)
+			
+			# The basis shape key is read and the split weights are computed only once for the entire batch
+			self._PairSplitBatch = common.PairSplitBatch(obj, self._SplitAxis, self._SmoothingDistance)
+			
+			# The shape keys are split a chunk of verts at a time, in as many chunks per modal event as fit in the scheduler's time budget
+			self._Scheduler = common.ChunkedWorkScheduler(self.splitChunks())
 			
 			# If the user was previewing this split, disable the preview now
 			if (self.opt_clear_preview):
@@ -132,25 +143,36 @@ class WM_OT_ShapeKeyTools_OpSplitAllPairs(bpy.types.Operator):
 			
 			self.preport("Preparing to split " + str(len(self._SplitBatch)) + " of " + str(len(obj.data.shape_keys.key_blocks)) + " total shape keys")
 			
-			context.window_manager.progress_begin(0, self._TotalVerts)
+			self._Progress = common.ProgressReporter(self._TotalVerts)
 			
 			if (self.opt_run_async):
+				# Save the shape keys that will be deleted, so they can be restored if the user cancels
+				self._Snapshot = common.ShapeKeySnapshot(obj, [oldName for (oldName, splitLName, splitRName) in self._SplitBatch if self.opt_delete_originals])
 				context.window_manager.modal_handler_add(self)
 				self._Timer = context.window_manager.event_timer_add(0.01, context.window)
 				return {"RUNNING_MODAL"}
 			else:
 				modalComplete = None
 				while (not modalComplete):
-					modalComplete = self.modalStep(context)
+					with common.TraceSpan("Work", "modal"):
+						modalComplete = self.modalStep(context)
+				self.endTrace()
 				return {"FINISHED"}
 			
 		else:
 			return {"FINISHED"}
 	
-	# Split one shape key at a time per modal event
+	# Split as many verts per modal event as fit in the scheduler's time budget
 	def modal(self, context, event):
+		if (event.type == "ESC"):
+			self.rollback(context)
+			return {"CANCELLED"}
+		
 		if (event.type == "TIMER"):
-			if (self.modalStep(context)): # modalStep only returns True when all work is done
+			with common.TraceSpan("Work", "modal"):
+				modalComplete = self.modalStep(context)
+			if (modalComplete): # modalStep only returns True when all work is done
+				self.endTrace()
 				return {"CANCELLED"}
 			else:
 				return {"PASS_THROUGH"}
@@ -158,49 +180,50 @@ class WM_OT_ShapeKeyTools_OpSplitAllPairs(bpy.types.Operator):
 		return {"PASS_THROUGH"}
 	
 	def modalStep(self, context):
-		obj = self._Obj
-		
-		(oldName, splitLName, splitRName) = self._SplitBatch[self._CurBatchNum]
+		if (self._Scheduler.Step()): # all work completed
+			self._PairSplitBatch.Finish() # move all of the new shape keys into place at once
+			writtenShapeKeys = sum(len(newNames) for newNames in self._PairSplitBatch.SplitNames.values())
+			self._PairSplitBatch = None
+			self._Scheduler = None
+			self._Snapshot = None
+			self._Progress.Finish()
+			self._Progress = None
+			self._Metrics.Finish(writtenShapeKeys)
+			self.cancel(context)
+			self.preport("All shape keys pairs split.")
+			return True
 		
-		# If we do work every modal() event (or even every 2nd or 3rd), the Blender UI will not update
-		# So we always wait a few modal pulses after finishing the last work segment before doing the next work segment
-		if (self._ModalWorkPacing == 0): # notify
-			# The UI needs one full update cycle after self.report() to display it, so we do this one modal event *before* the actual work
+		# The progress cursor and status report are only updated a few times per second, no matter how many chunks each modal event runs
+		if (self._Progress.Update(self._Scheduler.VertsDone) and self.opt_run_async):
+			self.report({'INFO'}, "Splitting shape key " + str(self._CurBatchNum + 1) + "/" + str(len(self._SplitBatch)) + ": " + self._Progress.StatusText() + " - Esc to cancel")
+	
+	# Generator of all the work for the scheduler, which splits every shape key in the batch
+	def splitChunks(self):
+		for (batchNum, (oldName, splitLName, splitRName)) in enumerate(self._SplitBatch):
+			self._CurBatchNum = batchNum
 			self.preport("Splitting shape key " + str(self._CurBatchNum + 1) + "/" + str(len(self._SplitBatch)) + " '" + oldName + "' into left: '" + splitLName + "' and right: '" + splitRName + "'")
-			
-		elif (self._ModalWorkPacing == 1): # work
-			# Persistent parameters for all shape key splits
-			axis = self._SplitAxis
-			smoothingDistance = self._SmoothingDistance
-			
-			# Create async progress reporting data so the split method can report progress to the window manager's progress cursor
-			asyncProgressReporting = {
-				"CurrentVert": self._CurVert,
-				"TotalVerts": self._TotalVerts,
-			}
-			
-			# Make the victim shape key active and split it
-			obj.active_shape_key_index = obj.data.shape_keys.key_blocks.keys().index(oldName)
-			common.SplitPairActiveShapeKey(obj, axis, splitLName, splitRName, smoothingDistance, self.opt_delete_originals, asyncProgressReporting=asyncProgressReporting)
-			
-			# Finalize this segment of the async work
-			self._CurVert = asyncProgressReporting["CurrentVert"]
-			self._CurBatchNum += 1
-			
-			if (self._CurBatchNum > len(self._SplitBatch) - 1):
-				# All work completed
-				bpy.context.window_manager.progress_end()
-				self.cancel(context)
-				self.preport("All shape keys pairs split.")
-				return True
-			
-			#else: # Need to do more work in the next modal
-			
-		#else: # rest
-		
-		self._ModalWorkPacing += 1
-		if (self._ModalWorkPacing > 3):
-			self._ModalWorkPacing = 0
+			for chunkVerts in self._PairSplitBatch.SplitShapeKeyChunks(oldName, splitLName, splitRName, self.opt_delete_originals, self._Scheduler):
+				yield chunkVerts
+	
+	# Undoes all of the work done so far, after the user cancels with Esc
+	def rollback(self, context):
+		self._Scheduler = None
+		self._PairSplitBatch = None
+		with common.TraceSpan("Roll back", "modal"):
+			self._Snapshot.Restore()
+		self._Snapshot = None
+		self._Progress.Finish()
+		self._Progress = None
+		self.cancel(context)
+		self.preport("Cancelled. All shape keys were restored.")
+		self.endTrace()
+	
+	# Writes the trace file, if this run was traced
+	def endTrace(self):
+		tracePath = common.EndTrace(self._Trace)
+		self._Trace = None
+		if (tracePath != None):
+			self.preport("Trace written to " + tracePath)
 	
 	def cancel(self, context):
 		if (self._Timer != None):
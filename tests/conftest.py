@@ -0,0 +1,80 @@
+# ////////////////////////////////////////////////////////////////////////////////////////////////////
+# //
+# //    Test setup
+# //    - Installs the fake bpy from tools/fakebpy.py and registers the addon against it
+# //    - Provides scene setup and modal event helpers for the operator tests
+# //
+# ////////////////////////////////////////////////////////////////////////////////////////////////////
+
+import sys, os, types
+
+import pytest
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "tools"))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import fakebpy
+fakebpy.Install()
+
+import shape_key_tools
+from shape_key_tools import common
+shape_key_tools.register()
+
+
+### Gets a registered operator class by its bl_idname
+def GetOperator(bl_idname):
+	return shape_key_tools.RegisteredOps[bl_idname].OpClass
+
+### Makes a fake window event
+def Event(type):
+	return types.SimpleNamespace(type=type, value="PRESS", shift=False, ctrl=False, alt=False)
+
+### Runs an async operator for some number of TIMER events, then cancels it with Esc
+# Returns the result set of the Esc event, or None if the operator finished before it could be cancelled
+def RunAndCancel(cls, timerEvents, **props):
+	op = cls()
+	for (name, value) in props.items():
+		setattr(op, name, value)
+	result = op.execute(fakebpy.context)
+	for i in range(timerEvents):
+		if (not ("RUNNING_MODAL" in result or "PASS_THROUGH" in result)):
+			return None
+		result = op.modal(fakebpy.context, Event("TIMER"))
+	if (not ("RUNNING_MODAL" in result or "PASS_THROUGH" in result)):
+		return None
+	return op.modal(fakebpy.context, Event("ESC"))
+
+### Everything about an object's shape keys, modifiers, and scene that an operator could change
+def ObjectState(obj):
+	keyBlocks = obj.data.shape_keys.key_blocks
+	shapeKeys = [(kb.name, kb.relative_key.name, kb.value, kb.slider_min, kb.slider_max, kb.mute, kb.vertex_group, kb.interpolation, kb.data._co.tobytes()) for kb in keyBlocks]
+	return (shapeKeys, obj.active_shape_key_index, [m.name for m in obj.modifiers], obj.data.name, obj.data.vertices._co.tobytes(), [o.name for o in fakebpy.context.scene.objects])
+
+### Gets the (n, 3) vertex positions of a shape key
+def KeyCoords(obj, name):
+	return obj.data.shape_keys.key_blocks[name].data._co.astype(np.float64)
+
+
+@pytest.fixture(params=["numpy", "legacy"])
+def engine(request):
+	previous = common.KernelEngine
+	common.KernelEngine = request.param
+	yield request.param
+	common.KernelEngine = previous
+
+@pytest.fixture
+def scene():
+	scene = fakebpy.Reset()
+	scene.shape_key_tools_props = types.SimpleNamespace(
+		opt_shapepairs_split_axis = "+X",
+		opt_shapepairs_split_smoothdist = 0.2,
+		opt_shapepairs_split_mode = "smooth",
+		opt_shapepairs_merge_mode = "additive",
+		opt_shapepairs_splitmerge_preview_split_left = False,
+		opt_shapepairs_splitmerge_preview_split_right = False,
+	)
+	# Only run one chunk of verts per modal event, so that the operators take many modal events to finish
+	previousBudget = common.ModalWorkBudget
+	common.ModalWorkBudget = 0.0
+	yield scene
+	common.ModalWorkBudget = previousBudget
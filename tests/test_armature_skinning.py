@@ -0,0 +1,275 @@
+# Checks native armature skinning (opt_native_armature) against a straightforward, one vert at a time linear blend skinning reference
+
+import types
+
+import pytest
+import numpy as np
+
+import fakebpy
+from shape_key_tools import core, common
+from conftest import GetOperator, KeyCoords
+
+
+ApplyModifiers = "wm.shape_key_tools_apply_modifiers_to_shape_keys"
+
+BoneNames = ["Jaw", "LipL", "LipR", "Brow"]
+
+
+### Reference linear blend skinning: each vert moves to sum(w * M * v) / sum(w) over its deforming bones, in the armature's space
+# Verts whose bone weights add up to 0.0001 or less are not moved. The mask weights blend between the original and the skinned positions.
+# Params:
+# - coords: (n, 3) array of vertex positions
+# - vertWeights: List of {vertex group index: weight} of each vert
+# - boneMatrices: Dict of {vertex group index: 4x4 deform matrix} of the deforming bones
+# - meshToArmature: 4x4 matrix from the mesh object's space to the armature object's space
+# - (optional) maskWeights: (n,) array of mask weights
+def ReferenceSkinning(coords, vertWeights, boneMatrices, meshToArmature, maskWeights=None):
+	armatureToMesh = np.linalg.inv(meshToArmature)
+	result = np.array(coords, dtype=np.float64)
+	for (i, co) in enumerate(result.copy()):
+		armatureCo = np.dot(meshToArmature, np.append(co, 1.0))
+		weightedSum = np.zeros(4)
+		totalWeight = 0.0
+		for (group, weight) in vertWeights[i].items():
+			if (group in boneMatrices):
+				weightedSum += weight * np.dot(boneMatrices[group], armatureCo)
+				totalWeight += weight
+		if (totalWeight > 0.0001):
+			skinned = np.dot(armatureToMesh, weightedSum / totalWeight)[:3]
+			if (maskWeights is not None):
+				skinned = co + (skinned - co) * maskWeights[i]
+			result[i] = skinned
+	return result
+
+### Applies (n, 3, 4) per-vertex affine matrices to (n, 3) vertex positions
+def ApplyMatrices(matrices, coords):
+	return np.einsum("nij,nj->ni", matrices[:, :, :3], coords) + matrices[:, :, 3]
+
+### A random rotation, scale, and translation
+def RandomTransform(rng):
+	(rotation, r) = np.linalg.qr(rng.normal(size=(3, 3)))
+	matrix = np.identity(4)
+	matrix[:3, :3] = rotation * rng.uniform(0.8, 1.2)
+	matrix[:3, 3] = rng.normal(0, 0.3, 3)
+	return matrix
+
+### Random bone weights for each vert, over vertex groups 0-3
+# The first 5 verts have no weights, and the next 5 have weights that add up to less than Blender's 0.0001 threshold
+def RandomVertWeights(rng, vertCount):
+	vertWeights = []
+	for i in range(vertCount):
+		weights = {}
+		if (i >= 10):
+			for group in rng.choice(4, rng.randint(1, 4), replace=False):
+				weights[int(group)] = float(np.float32(rng.uniform(0.1, 1.0)))
+		elif (i >= 5):
+			weights[0] = float(np.float32(0.00005))
+		vertWeights.append(weights)
+	return vertWeights
+
+### Builds a core.VertexGroupCSR from the per-vert weights
+def BuildGroupIndex(vertWeights, numGroups):
+	groups = []
+	vertIndices = []
+	weights = []
+	for (i, vertWeight) in enumerate(vertWeights):
+		for (group, weight) in vertWeight.items():
+			groups.append(group)
+			vertIndices.append(i)
+			weights.append(weight)
+	return core.VertexGroupCSR(len(vertWeights), numGroups, groups, vertIndices, weights)
+
+
+#
+#====================================================================================================
+#    core
+#====================================================================================================
+#
+
+@pytest.mark.parametrize("transformed", [False, True])
+@pytest.mark.parametrize("masked", [False, True])
+def test_build_skinning_matrices(transformed, masked):
+	rng = np.random.RandomState(1)
+	coords = rng.uniform(-1, 1, (60, 3))
+	vertWeights = RandomVertWeights(rng, len(coords))
+	boneMatrices = dict((group, RandomTransform(rng)) for group in range(3)) # vertex group 3 has no deforming bone
+	meshToArmature = (RandomTransform(rng) if transformed else np.identity(4))
+	maskWeights = (rng.uniform(0, 1, len(coords)) if masked else None)
+	
+	matrices = core.BuildSkinningMatrices(BuildGroupIndex(vertWeights, 4), boneMatrices, meshToArmature, maskWeights)
+	expected = ReferenceSkinning(coords, vertWeights, boneMatrices, meshToArmature, maskWeights)
+	np.testing.assert_allclose(ApplyMatrices(matrices, coords), expected, atol=1e-9)
+	
+	# Verts without weights (or with too little weight, or only weights of non-deforming groups) are not moved
+	unweighted = [i for (i, weights) in enumerate(vertWeights) if sum(w for (g, w) in weights.items() if g in boneMatrices) <= 0.0001]
+	assert len(unweighted) >= 10
+	np.testing.assert_allclose(ApplyMatrices(matrices, coords)[unweighted], coords[unweighted], atol=1e-12)
+
+def test_compose_skinning_matrices():
+	rng = np.random.RandomState(2)
+	coords = rng.uniform(-1, 1, (60, 3))
+	first = (RandomVertWeights(rng, len(coords)), dict((group, RandomTransform(rng)) for group in range(4)), RandomTransform(rng))
+	second = (RandomVertWeights(rng, len(coords)), dict((group, RandomTransform(rng)) for group in range(4)), RandomTransform(rng))
+	firstMatrices = core.BuildSkinningMatrices(BuildGroupIndex(first[0], 4), first[1], first[2])
+	secondMatrices = core.BuildSkinningMatrices(BuildGroupIndex(second[0], 4), second[1], second[2])
+	
+	# The inner (first) modifier deforms the verts before the outer (second) one does
+	expected = ReferenceSkinning(ReferenceSkinning(coords, *first), *second)
+	np.testing.assert_allclose(ApplyMatrices(core.ComposeSkinningMatrices(secondMatrices, firstMatrices), coords), expected, atol=1e-9)
+	assert not np.allclose(ApplyMatrices(core.ComposeSkinningMatrices(firstMatrices, secondMatrices), coords), expected, atol=1e-3)
+
+
+#
+#====================================================================================================
+#    common.ArmatureLinearMap
+#====================================================================================================
+#
+
+### Creates a mesh object with shape keys, random bone weights, and a "Mask" vertex group, plus an armature object with a bone for each of the first 3 vertex groups
+# Returns (mesh object, armature object, per-vert weights, mask weights)
+def CreateRiggedObject(rng, transformed=False, vertCount=60):
+	basis = rng.uniform(-1, 1, (vertCount, 3)).astype(np.float32)
+	obj = fakebpy.CreateMeshObject("Body", basis, [("K" + str(i), basis + rng.normal(0, 0.1, basis.shape).astype(np.float32)) for i in range(4)])
+	vertWeights = RandomVertWeights(rng, vertCount)
+	for name in BoneNames:
+		obj.vertex_groups.new(name)
+	for (i, weights) in enumerate(vertWeights):
+		for (group, weight) in weights.items():
+			obj.vertex_groups[group].add([i], weight, "REPLACE")
+	
+	maskWeights = np.zeros(vertCount)
+	maskGroup = obj.vertex_groups.new("Mask")
+	for i in range(0, vertCount, 2):
+		maskWeights[i] = float(np.float32(rng.uniform(0, 1)))
+		maskGroup.add([i], maskWeights[i], "REPLACE")
+	
+	armatureObj = fakebpy.CreateArmatureObject("Rig", [(name, RandomTransform(rng), RandomTransform(rng)) for name in BoneNames[:3]], RandomTransform(rng) if transformed else None)
+	if (transformed):
+		obj.matrix_world = fakebpy.Matrix(RandomTransform(rng))
+	return (obj, armatureObj, vertWeights, maskWeights)
+
+### Adds an Armature modifier to the object, whose Blender evaluation is the reference skinning
+def AddArmatureModifier(obj, armatureObj, vertWeights, name="Armature", maskWeights=None, mask=False, invert=False):
+	boneMatrices = {}
+	for poseBone in armatureObj.pose.bones:
+		boneMatrices[obj.vertex_groups[poseBone.name].index] = np.dot(poseBone.matrix._m, np.linalg.inv(poseBone.bone.matrix_local._m))
+	meshToArmature = np.dot(np.linalg.inv(armatureObj.matrix_world._m), obj.matrix_world._m)
+	if (mask):
+		maskWeights = (1.0 - maskWeights if invert else maskWeights)
+	else:
+		maskWeights = None
+	
+	modifier = obj.modifiers.new(name, "ARMATURE", deform=lambda coords: ReferenceSkinning(coords, vertWeights, boneMatrices, meshToArmature, maskWeights))
+	modifier.object = armatureObj
+	if (mask):
+		modifier.vertex_group = "Mask"
+		modifier.invert_vertex_group = invert
+	return modifier
+
+@pytest.mark.parametrize("transformed", [False, True])
+@pytest.mark.parametrize("mask", [None, "mask", "inverted mask"])
+def test_armature_linear_map(scene, transformed, mask):
+	(obj, armatureObj, vertWeights, maskWeights) = CreateRiggedObject(np.random.RandomState(3), transformed)
+	modifier = AddArmatureModifier(obj, armatureObj, vertWeights, maskWeights=maskWeights, mask=(mask != None), invert=(mask == "inverted mask"))
+	assert common.FindArmatureSkinningProblem(obj, ["Armature"]) == None
+	
+	keyCoords = np.array([KeyCoords(obj, keyBlock.name) for keyBlock in obj.data.shape_keys.key_blocks])
+	armatureMap = common.ArmatureLinearMap(obj, ["Armature"], keyCoords[0].astype(np.float32))
+	np.testing.assert_allclose(armatureMap.DeformedBasisCoords, modifier.deform(keyCoords[0]), atol=1e-5)
+	np.testing.assert_allclose(armatureMap.Apply(keyCoords), [modifier.deform(coords) for coords in keyCoords], atol=1e-5)
+
+def test_armature_linear_map_stacked_modifiers(scene):
+	rng = np.random.RandomState(4)
+	(obj, armatureObj, vertWeights, maskWeights) = CreateRiggedObject(rng, True)
+	secondArmatureObj = fakebpy.CreateArmatureObject("Rig2", [(name, RandomTransform(rng), RandomTransform(rng)) for name in BoneNames[:3]], RandomTransform(rng))
+	first = AddArmatureModifier(obj, armatureObj, vertWeights, "First")
+	second = AddArmatureModifier(obj, secondArmatureObj, vertWeights, "Second", maskWeights, mask=True)
+	
+	keyCoords = np.array([KeyCoords(obj, keyBlock.name) for keyBlock in obj.data.shape_keys.key_blocks])
+	armatureMap = common.ArmatureLinearMap(obj, ["First", "Second"], keyCoords[0].astype(np.float32))
+	np.testing.assert_allclose(armatureMap.Apply(keyCoords), [second.deform(first.deform(coords)) for coords in keyCoords], atol=1e-5)
+
+
+#
+#====================================================================================================
+#    common.FindArmatureSkinningProblem
+#====================================================================================================
+#
+
+@pytest.mark.parametrize("setup,problem", [
+	(lambda obj, modifier: None, None),
+	(lambda obj, modifier: setattr(modifier, "use_bone_envelopes", True), "uses bone envelopes"),
+	(lambda obj, modifier: setattr(modifier, "use_deform_preserve_volume", True), "uses Preserve Volume"),
+	(lambda obj, modifier: setattr(modifier, "use_multi_modifier", True), "uses Multi Modifier"),
+	(lambda obj, modifier: setattr(modifier.object.pose.bones["LipL"].bone, "bbone_segments", 4), "is a B-Bone with segments"),
+	(lambda obj, modifier: setattr(modifier, "object", None), "has no armature object"),
+	(lambda obj, modifier: setattr(modifier, "type", "HOOK"), "is not an Armature modifier"),
+])
+def test_find_armature_skinning_problem(scene, setup, problem):
+	(obj, armatureObj, vertWeights, maskWeights) = CreateRiggedObject(np.random.RandomState(5))
+	modifier = AddArmatureModifier(obj, armatureObj, vertWeights)
+	setup(obj, modifier)
+	
+	found = common.FindArmatureSkinningProblem(obj, ["Armature"])
+	if (problem == None):
+		assert found == None
+	else:
+		assert problem in found
+
+def test_bbone_segments_only_matter_for_deforming_bones_with_vertex_groups(scene):
+	(obj, armatureObj, vertWeights, maskWeights) = CreateRiggedObject(np.random.RandomState(6))
+	AddArmatureModifier(obj, armatureObj, vertWeights)
+	armatureObj.pose.bones["LipL"].bone.bbone_segments = 4
+	armatureObj.pose.bones["LipL"].bone.use_deform = False
+	assert common.FindArmatureSkinningProblem(obj, ["Armature"]) == None
+	
+	# A B-Bone that no vertex group of the mesh belongs to
+	armatureObj.pose.bones["LipL"].bone.use_deform = True
+	obj.vertex_groups["LipL"].name = "Unrelated"
+	assert common.FindArmatureSkinningProblem(obj, ["Armature"]) == None
+
+
+#
+#====================================================================================================
+#    Apply Modifiers
+#====================================================================================================
+#
+
+### Counts how many times the modifiers are evaluated in full
+class CountingEvaluations(object):
+	def __init__(self, monkeypatch):
+		self.Calls = 0
+		evaluateModifiers = common.EvaluateModifiers
+		def countingEvaluateModifiers(*args, **kwargs):
+			self.Calls += 1
+			return evaluateModifiers(*args, **kwargs)
+		monkeypatch.setattr(common, "EvaluateModifiers", countingEvaluateModifiers)
+
+def test_apply_modifiers_with_native_armature_skinning(scene, monkeypatch):
+	(obj, armatureObj, vertWeights, maskWeights) = CreateRiggedObject(np.random.RandomState(7), True, 300)
+	modifier = AddArmatureModifier(obj, armatureObj, vertWeights, maskWeights=maskWeights, mask=True)
+	deform = modifier.deform
+	originals = [KeyCoords(obj, keyBlock.name) for keyBlock in obj.data.shape_keys.key_blocks]
+	evaluations = CountingEvaluations(monkeypatch)
+	
+	fakebpy.RunOperator(GetOperator(ApplyModifiers), opt_modifiers=[types.SimpleNamespace(name="Armature", do_apply=True)])
+	
+	# Only the base mesh is evaluated by Blender, to check the skinning against
+	assert evaluations.Calls == 0
+	for (keyBlock, coords) in zip(obj.data.shape_keys.key_blocks, originals):
+		np.testing.assert_allclose(keyBlock.data._co, deform(coords), atol=1e-5)
+
+def test_apply_modifiers_falls_back_when_native_armature_skinning_does_not_match(scene, monkeypatch):
+	(obj, armatureObj, vertWeights, maskWeights) = CreateRiggedObject(np.random.RandomState(8), True, 300)
+	modifier = AddArmatureModifier(obj, armatureObj, vertWeights)
+	# Something in Blender's evaluation that the native skinning does not reproduce
+	skinning = modifier.deform
+	modifier.deform = lambda coords: skinning(coords) + 0.01
+	originals = [KeyCoords(obj, keyBlock.name) for keyBlock in obj.data.shape_keys.key_blocks]
+	evaluations = CountingEvaluations(monkeypatch)
+	
+	fakebpy.RunOperator(GetOperator(ApplyModifiers), opt_modifiers=[types.SimpleNamespace(name="Armature", do_apply=True)])
+	
+	assert evaluations.Calls == len(originals) - 1
+	for (keyBlock, coords) in zip(obj.data.shape_keys.key_blocks, originals):
+		np.testing.assert_allclose(keyBlock.data._co, modifier.deform(coords), atol=1e-5)
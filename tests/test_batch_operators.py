@@ -0,0 +1,265 @@
+# Runs the batch operators (Split All Pairs, Merge All Pairs, Apply Modifiers) the way Blender does, as modal operators pumped by TIMER events, on both kernel engines
+
+import sys, types
+
+import pytest
+import numpy as np
+
+import fakebpy
+from shape_key_tools import core, common
+from conftest import GetOperator, Event, RunAndCancel, ObjectState, KeyCoords
+
+
+SplitAllPairs = "wm.shape_key_tools_split_all_pairs"
+MergeAllPairs = "wm.shape_key_tools_smartmerge_all_pairs"
+ApplyModifiers = "wm.shape_key_tools_apply_modifiers_to_shape_keys"
+
+ShapeKeyNames = ["S0L+S0R", "Other", "A0L", "S1L+S1R", "A0R", "S2L+S2R"]
+
+
+### Creates the test object, with some pairs to split, a pair to merge, and a shape key that neither op touches
+def CreatePairsObject(vertCount=1500):
+	rng = np.random.RandomState(7)
+	basis = rng.uniform(-1, 1, (vertCount, 3)).astype(np.float32)
+	obj = fakebpy.CreateMeshObject("Face", basis, [(name, basis + rng.normal(0, 0.1, basis.shape).astype(np.float32)) for name in ShapeKeyNames])
+	keyBlocks = obj.data.shape_keys.key_blocks
+	keyBlocks["Other"].value = 0.5
+	keyBlocks["Other"].slider_min = -1.0
+	keyBlocks["A0R"].mute = True
+	# The legacy engine copies the shape keys it splits from the shape key mix, which only has the shape key being split when it is pinned
+	obj.show_only_shape_key = True
+	return obj
+
+### The left and right halves that splitting a shape key along +X with the scene's smoothing distance should produce
+def ExpectedSplit(basis, original, smoothDistance):
+	rightWeights = core.ComputePairSplitWeights(basis.astype(np.float32), "+X", smoothDistance).astype(np.float64)[:, None]
+	deltas = original - basis
+	return (basis + deltas * (1.0 - rightWeights), basis + deltas * rightWeights)
+
+
+#
+#====================================================================================================
+#    Split All Pairs
+#====================================================================================================
+#
+
+@pytest.mark.parametrize("deleteOriginals", [True, False])
+def test_split_all_pairs(scene, engine, deleteOriginals):
+	obj = CreatePairsObject()
+	basis = KeyCoords(obj, "Basis")
+	originals = dict((name, KeyCoords(obj, name)) for name in ShapeKeyNames)
+	
+	result = fakebpy.RunOperator(GetOperator(SplitAllPairs), opt_run_async=True, opt_delete_originals=deleteOriginals)
+	assert "CANCELLED" in result # the modal operators end with CANCELLED once all of their work is done
+	
+	# Each pair is split into left and right shape keys which take the place of the original
+	expectedNames = ["Basis"]
+	for name in ShapeKeyNames:
+		if ("+" in name):
+			if (not deleteOriginals):
+				expectedNames.append(name)
+			expectedNames.extend(name.split("+"))
+		else:
+			expectedNames.append(name)
+	assert obj.data.shape_keys.key_blocks.keys() == expectedNames
+	assert obj.active_shape_key.name == "S2L"
+	
+	for name in ShapeKeyNames:
+		if ("+" in name):
+			(leftName, rightName) = name.split("+")
+			(expectedLeft, expectedRight) = ExpectedSplit(basis, originals[name], 0.2)
+			np.testing.assert_allclose(KeyCoords(obj, leftName), expectedLeft, atol=1e-5)
+			np.testing.assert_allclose(KeyCoords(obj, rightName), expectedRight, atol=1e-5)
+			# Together, the two halves have all of the original deltas
+			np.testing.assert_allclose(KeyCoords(obj, leftName) + KeyCoords(obj, rightName) - basis, originals[name], atol=1e-5)
+			assert obj.data.shape_keys.key_blocks[leftName].relative_key.name == "Basis"
+		if (name in obj.data.shape_keys.key_blocks):
+			np.testing.assert_array_equal(KeyCoords(obj, name), originals[name])
+	assert obj.data.shape_keys.key_blocks["Other"].value == 0.5
+	assert obj.data.shape_keys.key_blocks["A0R"].mute == True
+
+def test_split_all_pairs_sync_matches_async(scene, engine):
+	obj = CreatePairsObject()
+	fakebpy.RunOperator(GetOperator(SplitAllPairs), opt_run_async=False)
+	syncState = ObjectState(obj)
+	
+	fakebpy.Reset().shape_key_tools_props = scene.shape_key_tools_props
+	obj = CreatePairsObject()
+	fakebpy.RunOperator(GetOperator(SplitAllPairs), opt_run_async=True)
+	assert ObjectState(obj) == syncState
+
+@pytest.mark.parametrize("deleteOriginals", [True, False])
+@pytest.mark.parametrize("timerEvents", [0, 1, 4, 9])
+def test_split_all_pairs_esc_rolls_back(scene, engine, deleteOriginals, timerEvents):
+	obj = CreatePairsObject()
+	before = ObjectState(obj)
+	
+	result = RunAndCancel(GetOperator(SplitAllPairs), timerEvents, opt_run_async=True, opt_delete_originals=deleteOriginals)
+	assert result == {"CANCELLED"}
+	assert ObjectState(obj) == before
+
+
+#
+#====================================================================================================
+#    Merge All Pairs
+#====================================================================================================
+#
+
+def test_merge_all_pairs(scene, engine):
+	obj = CreatePairsObject()
+	basis = KeyCoords(obj, "Basis")
+	originals = dict((name, KeyCoords(obj, name)) for name in ShapeKeyNames)
+	fakebpy.RunOperator(GetOperator(SplitAllPairs), opt_run_async=True)
+	
+	result = fakebpy.RunOperator(GetOperator(MergeAllPairs), opt_run_async=True)
+	assert "CANCELLED" in result
+	
+	# Each merged pair takes the place of its left shape key
+	assert obj.data.shape_keys.key_blocks.keys() == ["Basis", "S0L+S0R", "Other", "A0L+A0R", "S1L+S1R", "S2L+S2R"]
+	assert obj.active_shape_key.name == "S2L+S2R"
+	
+	# Additive merging undoes the split
+	for name in ("S0L+S0R", "S1L+S1R", "S2L+S2R"):
+		np.testing.assert_allclose(KeyCoords(obj, name), originals[name], atol=1e-5)
+	np.testing.assert_allclose(KeyCoords(obj, "A0L+A0R"), originals["A0L"] + originals["A0R"] - basis, atol=1e-5)
+	np.testing.assert_array_equal(KeyCoords(obj, "Other"), originals["Other"])
+	for keyBlock in obj.data.shape_keys.key_blocks:
+		assert keyBlock.relative_key.name == "Basis"
+
+@pytest.mark.parametrize("timerEvents", [0, 1, 3, 8])
+def test_merge_all_pairs_esc_rolls_back(scene, engine, timerEvents):
+	obj = CreatePairsObject()
+	fakebpy.RunOperator(GetOperator(SplitAllPairs), opt_run_async=True)
+	before = ObjectState(obj)
+	
+	result = RunAndCancel(GetOperator(MergeAllPairs), timerEvents, opt_run_async=True)
+	assert result == {"CANCELLED"}
+	assert ObjectState(obj) == before
+
+
+#
+#====================================================================================================
+#    Apply Modifiers
+#====================================================================================================
+#
+
+### Stand-in for a modifier that is neither linear nor an armature, so that every shape key goes through the modifier evaluation path
+class CountingDeform(object):
+	def __init__(self):
+		self.Calls = 0
+	
+	def __call__(self, coords):
+		self.Calls += 1
+		return coords + np.sin(coords * 3.0) * 0.25
+
+def CreateModifiersObject():
+	rng = np.random.RandomState(11)
+	basis = rng.uniform(-1, 1, (200, 3)).astype(np.float32)
+	obj = fakebpy.CreateMeshObject("Body", basis, [("K" + str(i), basis + rng.normal(0, 0.1, basis.shape).astype(np.float32)) for i in range(12)])
+	keyBlocks = obj.data.shape_keys.key_blocks
+	keyBlocks["K3"].relative_key = keyBlocks["K2"]
+	keyBlocks["K5"].slider_max = 2.0
+	deform = CountingDeform()
+	obj.modifiers.new("Wobble", "DISPLACE", deform=deform)
+	obj.modifiers.new("Keep", "CAST", deform=lambda coords: coords)
+	return (obj, deform)
+
+def ApplyWobble(**props):
+	return fakebpy.RunOperator(GetOperator(ApplyModifiers), opt_modifiers=[types.SimpleNamespace(name="Wobble", do_apply=True)], **props)
+
+### Lets the checkpoint be saved after every shape key, for the duration of the test
+@pytest.fixture
+def checkpointEveryKey(monkeypatch, tmp_path):
+	fakebpy.data.filepath = str(tmp_path / "test.blend")
+	monkeypatch.setattr(sys.modules[GetOperator(ApplyModifiers).__module__], "CheckpointInterval", 0.0)
+	return tmp_path
+
+def test_apply_modifiers(scene, engine):
+	(obj, deform) = CreateModifiersObject()
+	mesh = obj.data
+	originals = [(kb.name, kb.relative_key.name, kb.slider_max, KeyCoords(obj, kb.name)) for kb in obj.data.shape_keys.key_blocks]
+	
+	result = ApplyWobble()
+	assert "CANCELLED" in result
+	
+	keyBlocks = obj.data.shape_keys.key_blocks
+	assert [(kb.name, kb.relative_key.name, kb.slider_max) for kb in keyBlocks] == [(name, relName, sliderMax) for (name, relName, sliderMax, coords) in originals]
+	for (name, relName, sliderMax, coords) in originals:
+		np.testing.assert_allclose(KeyCoords(obj, name), deform(coords), atol=1e-5)
+	np.testing.assert_allclose(obj.data.vertices._co, deform(originals[0][3]), atol=1e-5)
+	
+	# Only the applied modifier is removed, and the helper objects and original mesh are gone
+	assert [m.name for m in obj.modifiers] == ["Keep"]
+	assert [o.name for o in fakebpy.context.scene.objects] == ["Body"]
+	assert obj.data.name == "Body"
+	assert not mesh in fakebpy.data.meshes._items
+
+def test_apply_modifiers_to_linked_duplicates(scene, engine):
+	(obj, deform) = CreateModifiersObject()
+	mesh = obj.data
+	originals = [KeyCoords(obj, kb.name) for kb in obj.data.shape_keys.key_blocks]
+	duplicate = fakebpy.data.objects.new("Body.001", mesh)
+	fakebpy.context.scene.objects.link(duplicate)
+	
+	ApplyWobble()
+	
+	# The shared mesh is kept and gets the results
+	assert obj.data is mesh and duplicate.data is mesh
+	for (keyBlock, coords) in zip(mesh.shape_keys.key_blocks, originals):
+		np.testing.assert_allclose(keyBlock.data._co, deform(coords), atol=1e-5)
+	assert [o.name for o in fakebpy.context.scene.objects] == ["Body", "Body.001"]
+
+@pytest.mark.parametrize("timerEvents", [0, 1, 3, 9, 15, 20])
+def test_apply_modifiers_esc_rolls_back(scene, engine, timerEvents):
+	(obj, deform) = CreateModifiersObject()
+	before = ObjectState(obj)
+	
+	result = RunAndCancel(GetOperator(ApplyModifiers), timerEvents, opt_modifiers=[types.SimpleNamespace(name="Wobble", do_apply=True)])
+	assert result == {"CANCELLED"}
+	assert ObjectState(obj) == before
+
+@pytest.mark.parametrize("crash", [False, True])
+def test_apply_modifiers_resumes_from_checkpoint(scene, engine, checkpointEveryKey, crash):
+	(obj, deform) = CreateModifiersObject()
+	ApplyWobble()
+	expected = ObjectState(obj)
+	fullRunCalls = deform.Calls
+	
+	# Stop partway through, either with Esc or by abandoning the run like a crash would
+	fakebpy.Reset().shape_key_tools_props = scene.shape_key_tools_props
+	fakebpy.data.filepath = str(checkpointEveryKey / "test.blend")
+	(obj, deform) = CreateModifiersObject()
+	op = GetOperator(ApplyModifiers)()
+	op.opt_modifiers = [types.SimpleNamespace(name="Wobble", do_apply=True)]
+	op.execute(fakebpy.context)
+	for i in range(18):
+		op.modal(fakebpy.context, Event("TIMER"))
+	assert 0 < deform.Calls < fullRunCalls
+	if (not crash):
+		op.modal(fakebpy.context, Event("ESC"))
+		assert [o.name for o in fakebpy.context.scene.objects] == ["Body"]
+	
+	# invoke() offers to resume, and the resumed run only evaluates the modifiers for the shape keys that were not finished
+	op = GetOperator(ApplyModifiers)()
+	op.invoke(fakebpy.context, Event("NONE"))
+	assert op.opt_resume == True
+	deform.Calls = 0
+	ApplyWobble(opt_resume=True)
+	assert 0 < deform.Calls < fullRunCalls
+	assert ObjectState(obj) == expected
+	assert list(checkpointEveryKey.iterdir()) == []
+
+@pytest.mark.parametrize("edit", ["coords", "slider", "modifier"])
+def test_apply_modifiers_does_not_resume_after_edits(scene, engine, checkpointEveryKey, edit):
+	(obj, deform) = CreateModifiersObject()
+	RunAndCancel(GetOperator(ApplyModifiers), 18, opt_modifiers=[types.SimpleNamespace(name="Wobble", do_apply=True)])
+	op = GetOperator(ApplyModifiers)()
+	assert op.findResumableCheckpoint(obj)[1] != None
+	
+	if (edit == "coords"):
+		obj.data.shape_keys.key_blocks["K1"].data._co[4, 1] += 0.5
+	elif (edit == "slider"):
+		obj.data.shape_keys.key_blocks["K5"].slider_max = 3.0
+	elif (edit == "modifier"):
+		obj.modifiers["Wobble"].direction = "X"
+	assert op.findResumableCheckpoint(obj)[1] == None
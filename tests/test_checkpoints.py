@@ -0,0 +1,102 @@
+# Checks common.ShapeKeyCheckpoint directly: saving and loading, damaged checkpoints, and unsaved .blend files
+
+import sys, os, types
+
+import pytest
+import numpy as np
+
+import fakebpy
+from shape_key_tools import common
+from conftest import GetOperator, RunAndCancel, Event
+
+
+ApplyModifiers = "wm.shape_key_tools_apply_modifiers_to_shape_keys"
+
+State = {"object": "Body", "vertCount": 50, "curShapeKeyIndex": 3, "fingerprint": 12345}
+
+
+def CreateObject():
+	rng = np.random.RandomState(41)
+	basis = rng.uniform(-1, 1, (50, 3)).astype(np.float32)
+	obj = fakebpy.CreateMeshObject("Body", basis, [("K" + str(i), basis + rng.normal(0, 0.1, basis.shape).astype(np.float32)) for i in range(6)])
+	obj.modifiers.new("Wobble", "CAST", deform=lambda coords: coords + np.sin(coords * 3.0) * 0.25)
+	return obj
+
+@pytest.fixture
+def blendFile(scene, tmp_path):
+	fakebpy.data.filepath = str(tmp_path / "test.blend")
+	return tmp_path
+
+
+def test_save_and_load(blendFile, engine):
+	obj = CreateObject()
+	checkpoint = common.ShapeKeyCheckpoint("test", obj)
+	assert checkpoint.Load() == None
+	
+	coords = obj.data.shape_keys.key_blocks["K2"].data._co.copy()
+	if (engine == "numpy"):
+		checkpoint.SaveCoords(2, coords, engine)
+	else:
+		checkpoint.SaveCoords(2, [tuple(co) for co in coords.tolist()], engine)
+	checkpoint.Save(State)
+	
+	# A new checkpoint for the same object and operation finds the saved one
+	checkpoint = common.ShapeKeyCheckpoint("test", obj)
+	assert checkpoint.Load() == State
+	np.testing.assert_array_equal(np.array(checkpoint.LoadCoords(2, engine), dtype=np.float32), coords)
+	assert sorted(os.listdir(checkpoint.Directory)) == ["shape_key_2.f32", "state.json"]
+	
+	checkpoint.Delete()
+	assert list(blendFile.iterdir()) == []
+	assert checkpoint.Load() == None
+
+@pytest.mark.parametrize("damage", ["empty", "truncated", "garbage", "not a dict", "only the temp file"])
+def test_load_damaged_state(blendFile, damage):
+	obj = CreateObject()
+	checkpoint = common.ShapeKeyCheckpoint("test", obj)
+	checkpoint.Save(State)
+	with open(checkpoint.statePath(), "rb") as f:
+		saved = f.read()
+	
+	if (damage == "empty"):
+		contents = b""
+	elif (damage == "truncated"):
+		contents = saved[:len(saved) // 2]
+	elif (damage == "garbage"):
+		contents = b"\xff\xfe\x00\x13garbage"
+	elif (damage == "not a dict"):
+		contents = b"[1, 2, 3]"
+	if (damage == "only the temp file"):
+		# A crash after the new state was written but before it replaced the old one, with no old one
+		os.replace(checkpoint.statePath(), checkpoint.statePath() + ".tmp")
+	else:
+		with open(checkpoint.statePath(), "wb") as f:
+			f.write(contents)
+	
+	assert checkpoint.Load() == None
+	assert GetOperator(ApplyModifiers)().findResumableCheckpoint(obj)[1] == None
+
+def test_disabled_without_saved_blend_file(scene, tmp_path, monkeypatch):
+	monkeypatch.chdir(tmp_path)
+	assert fakebpy.data.filepath == ""
+	obj = CreateObject()
+	
+	# There is nowhere to put the checkpoint, so nothing is saved or loaded
+	checkpoint = common.ShapeKeyCheckpoint("test", obj)
+	assert checkpoint.Directory == None
+	checkpoint.Save(State)
+	checkpoint.SaveCoords(1, obj.data.shape_keys.key_blocks["K1"].data._co)
+	assert checkpoint.Load() == None
+	checkpoint.Delete()
+	
+	# Nor by the operator, even if it would save after every shape key
+	monkeypatch.setattr(sys.modules[GetOperator(ApplyModifiers).__module__], "CheckpointInterval", 0.0)
+	assert RunAndCancel(GetOperator(ApplyModifiers), 12, opt_modifiers=[types.SimpleNamespace(name="Wobble", do_apply=True)]) == {"CANCELLED"}
+	assert list(tmp_path.iterdir()) == []
+	op = GetOperator(ApplyModifiers)()
+	op.invoke(fakebpy.context, Event("NONE"))
+	assert op.opt_resume == False
+
+def test_fingerprint_is_the_same_on_both_engines(scene):
+	obj = CreateObject()
+	assert common.ComputeCheckpointFingerprint(obj, ["Wobble"], "numpy") == common.ComputeCheckpointFingerprint(obj, ["Wobble"], "legacy")
@@ -0,0 +1,95 @@
+# Checks the numpy kernel engine against the legacy engine's original per-vertex mathutils loops, on fakebpy's Blender 2.79 Vector
+# The random cases come from tools/diffcheck.py, which can also run many more of them from the command line
+
+import pytest
+import numpy as np
+
+import fakebpy
+import diffcheck
+from shape_key_tools import common
+
+diffcheck.LoadCommon()
+
+CoreSeeds = range(500)
+CommonSeeds = range(50)
+
+
+@pytest.mark.parametrize("seed", CoreSeeds)
+@pytest.mark.parametrize("check", diffcheck.CoreChecks, ids=lambda check: check.__name__)
+def test_core_kernels(seed, check):
+	check(diffcheck.RandomCase(seed))
+
+@pytest.mark.parametrize("seed", CommonSeeds)
+@pytest.mark.parametrize("check", diffcheck.CommonChecks, ids=lambda check: check.__name__)
+def test_common_functions(seed, check):
+	check(diffcheck.RandomCase(seed))
+
+
+#
+#====================================================================================================
+#    Where the engines intentionally differ
+#====================================================================================================
+#
+
+### Creates a small mesh with verts on both sides of the X axis, a pair to split, and a second shape key that is posed
+def CreateSplitObject():
+	rng = np.random.RandomState(3)
+	basis = rng.uniform(-1, 1, (100, 3)).astype(np.float32)
+	obj = fakebpy.CreateMeshObject("Face", basis, [("AL+AR", basis + rng.normal(0, 0.1, basis.shape).astype(np.float32)), ("Other", basis + rng.normal(0, 0.1, basis.shape).astype(np.float32))])
+	obj.data.shape_keys.key_blocks["Other"].value = 1.0
+	return obj
+
+def SplitPosedPair(pinned, engine):
+	fakebpy.Reset()
+	obj = CreateSplitObject()
+	keyBlocks = obj.data.shape_keys.key_blocks
+	basis = keyBlocks["Basis"].data._co.astype(np.float64)
+	mix = keyBlocks["Other"].data._co.astype(np.float64) # the shape key being split is not posed, so only the other one is in the mix
+	obj.show_only_shape_key = pinned
+	obj.active_shape_key_index = 1
+	common.SplitPairActiveShapeKey(obj, "+X", "AL", "AR", 0, True, engine=engine)
+	return (obj.data.shape_keys.key_blocks["AR"].data._co.astype(np.float64), basis, mix)
+
+def test_legacy_split_copies_shape_key_mix():
+	# Like the original loop, the legacy engine starts both halves from the shape key mix and only overwrites the verts it removes deltas from
+	# So unless the shape key being split is pinned, the right side of the right half has the deltas of the posed shape keys instead of its own
+	(unpinned, basis, mix) = SplitPosedPair(False, "legacy")
+	(pinned, basis, mix) = SplitPosedPair(True, "legacy")
+	rightSide = (basis[:, 0] < 0)
+	np.testing.assert_allclose(unpinned[rightSide], mix[rightSide], atol=1e-5)
+	assert not np.allclose(unpinned, pinned, atol=1e-5)
+
+def test_numpy_split_ignores_shape_key_mix():
+	(unpinned, basis, mix) = SplitPosedPair(False, "numpy")
+	(pinned, basis, mix) = SplitPosedPair(True, "numpy")
+	np.testing.assert_array_equal(unpinned, pinned)
+	(legacyPinned, basis, mix) = SplitPosedPair(True, "legacy")
+	np.testing.assert_allclose(pinned, legacyPinned, atol=1e-5)
+
+@pytest.mark.parametrize("blendMode", ["multiply", "divide"])
+def test_legacy_multiply_and_divide_fail_on_2_79_vector(blendMode):
+	# The original loop uses Vector * Vector (a dot product in Blender 2.79) and Vector / Vector (unsupported), so it cannot write any blended vert
+	fakebpy.Reset()
+	obj = CreateSplitObject()
+	with pytest.raises(TypeError):
+		common.MergeAndBlendShapeKeys(obj, "AL+AR", "Other", "Blended", blendMode, {"Factor": 1.0}, {}, engine="legacy")
+
+@pytest.mark.parametrize("blendMode", ["multiply", "divide"])
+def test_numpy_multiply_and_divide_per_component(blendMode):
+	fakebpy.Reset()
+	obj = CreateSplitObject()
+	keyBlocks = obj.data.shape_keys.key_blocks
+	basis = keyBlocks["Basis"].data._co.astype(np.float64)
+	lowerDeltas = keyBlocks["AL+AR"].data._co - basis
+	upperDeltas = keyBlocks["Other"].data._co - basis
+	upperDeltas[5, 1] = 0.0
+	keyBlocks["Other"].data._co[5, 1] = basis[5, 1]
+	
+	common.MergeAndBlendShapeKeys(obj, "AL+AR", "Other", "Blended", blendMode, {"Factor": 1.0}, {}, engine="numpy")
+	
+	if (blendMode == "multiply"):
+		expected = basis + lowerDeltas * upperDeltas
+	else:
+		# Components divided by zero keep Shape Key 1's delta
+		expected = basis + np.where(upperDeltas == 0, lowerDeltas, lowerDeltas / np.where(upperDeltas == 0, 1, upperDeltas))
+	np.testing.assert_allclose(obj.data.shape_keys.key_blocks["Blended"].data._co, expected, rtol=1e-3, atol=1e-4)
@@ -0,0 +1,98 @@
+# Checks the linear fast path of Apply Modifiers (opt_linear_fast_path), which fits a per-vertex linear map to the modifiers instead of evaluating them on every shape key
+
+import sys, types
+
+import pytest
+import numpy as np
+
+import fakebpy
+from shape_key_tools import core, common
+from conftest import GetOperator, KeyCoords
+
+
+ApplyModifiers = "wm.shape_key_tools_apply_modifiers_to_shape_keys"
+
+KeyCount = 12
+
+
+### Stand-in for a modifier that moves each vert by its own affine map, like an Armature, Hook, or Lattice modifier
+def AffineDeform(vertCount):
+	rng = np.random.RandomState(21)
+	matrices = np.identity(3) + rng.normal(0, 0.3, (vertCount, 3, 3))
+	offsets = rng.normal(0, 0.2, (vertCount, 3))
+	return lambda coords: np.einsum("nij,nj->ni", matrices, coords) + offsets
+
+### Stand-in for a modifier that is not linear at all
+def QuadraticDeform(coords):
+	return coords + 0.3 * coords * coords
+
+def CreateObject(modifierType, deform, vertCount=300):
+	rng = np.random.RandomState(22)
+	basis = rng.uniform(-1, 1, (vertCount, 3)).astype(np.float32)
+	obj = fakebpy.CreateMeshObject("Body", basis, [("K" + str(i), basis + rng.normal(0, 0.1, basis.shape).astype(np.float32)) for i in range(KeyCount)])
+	obj.modifiers.new("Deform", modifierType, deform=deform)
+	return obj
+
+### Records what fitLinearMap() returns and how many times the modifiers are evaluated in full, for the duration of the test
+class FastPathRecorder(object):
+	def __init__(self, monkeypatch):
+		self.Evaluations = 0
+		self.LinearMaps = []
+		
+		evaluateModifiers = common.EvaluateModifiers
+		def countingEvaluateModifiers(*args, **kwargs):
+			self.Evaluations += 1
+			return evaluateModifiers(*args, **kwargs)
+		monkeypatch.setattr(common, "EvaluateModifiers", countingEvaluateModifiers)
+		
+		cls = GetOperator(ApplyModifiers)
+		fitLinearMap = cls.fitLinearMap
+		def recordingFitLinearMap(op, context):
+			linearMap = yield from fitLinearMap(op, context)
+			self.LinearMaps.append(linearMap)
+			return linearMap
+		monkeypatch.setattr(cls, "fitLinearMap", recordingFitLinearMap)
+
+def ApplyDeform():
+	return fakebpy.RunOperator(GetOperator(ApplyModifiers), opt_modifiers=[types.SimpleNamespace(name="Deform", do_apply=True)], opt_linear_fast_path=True)
+
+
+def test_linear_map_fits_affine_deform():
+	rng = np.random.RandomState(23)
+	basis = rng.uniform(-1, 1, (100, 3)).astype(np.float32)
+	deform = AffineDeform(len(basis))
+	probes = core.CreateLinearMapProbes(basis, 0.02)
+	jacobians = core.FitPerVertexLinearMap(probes, [deform(probe.astype(np.float64)).astype(np.float32) for probe in probes])
+	
+	keyCoords = basis + rng.normal(0, 0.1, (5,) + basis.shape)
+	newCoords = core.ApplyPerVertexLinearMap(jacobians, basis, deform(basis.astype(np.float64)), keyCoords)
+	np.testing.assert_allclose(newCoords, [deform(coords) for coords in keyCoords], atol=1e-4)
+
+def test_apply_modifiers_takes_linear_fast_path(scene, monkeypatch):
+	deform = AffineDeform(300)
+	obj = CreateObject("LATTICE", deform)
+	originals = [KeyCoords(obj, keyBlock.name) for keyBlock in obj.data.shape_keys.key_blocks]
+	recorder = FastPathRecorder(monkeypatch)
+	
+	ApplyDeform()
+	
+	# The map is fit with 4 evaluations and checked against a few more, no matter how many shape keys there are
+	assert len(recorder.LinearMaps) == 1 and recorder.LinearMaps[0] != None
+	checkKeys = sys.modules[GetOperator(ApplyModifiers).__module__].LinearMapCheckKeys
+	assert recorder.Evaluations == 4 + checkKeys < KeyCount
+	for (keyBlock, coords) in zip(obj.data.shape_keys.key_blocks, originals):
+		np.testing.assert_allclose(keyBlock.data._co, deform(coords), atol=1e-5)
+
+def test_apply_modifiers_falls_back_from_linear_fast_path(scene, monkeypatch):
+	obj = CreateObject("SIMPLE_DEFORM", QuadraticDeform)
+	originals = [KeyCoords(obj, keyBlock.name) for keyBlock in obj.data.shape_keys.key_blocks]
+	recorder = FastPathRecorder(monkeypatch)
+	
+	ApplyDeform()
+	
+	# The error check fails, so every shape key is evaluated in full after the fit and the check
+	assert recorder.LinearMaps == [None]
+	checkKeys = sys.modules[GetOperator(ApplyModifiers).__module__].LinearMapCheckKeys
+	assert recorder.Evaluations == 4 + checkKeys + KeyCount
+	for (keyBlock, coords) in zip(obj.data.shape_keys.key_blocks, originals):
+		np.testing.assert_allclose(keyBlock.data._co, QuadraticDeform(coords), atol=1e-5)
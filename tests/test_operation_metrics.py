@@ -0,0 +1,52 @@
+# Checks the shape key counts that the operators record in their OperationMetrics
+
+import pytest
+import numpy as np
+
+import fakebpy
+from shape_key_tools import common
+from conftest import GetOperator
+
+
+def CreateObject():
+	rng = np.random.RandomState(9)
+	basis = rng.uniform(-1, 1, (80, 3)).astype(np.float32)
+	obj = fakebpy.CreateMeshObject("Face", basis, [(name, basis + rng.normal(0, 0.1, basis.shape).astype(np.float32)) for name in ("AL+AR", "BL", "BR", "CL+CR")], [("Mouth", range(40), 1.0)])
+	return obj
+
+def LastKeyCount():
+	return common.OperationMetricsHistory[-1].KeyCount
+
+
+def test_split_and_merge_active_pair(scene, engine):
+	obj = CreateObject()
+	obj.active_shape_key_index = 1
+	fakebpy.RunOperator(GetOperator("wm.shape_key_tools_split_active_pair"), opt_delete_original=True, opt_clear_preview=False)
+	assert LastKeyCount() == 2 # the left and right shape keys
+	
+	obj.active_shape_key_index = obj.data.shape_keys.key_blocks.find("BL")
+	fakebpy.RunOperator(GetOperator("wm.shape_key_tools_smartmerge_active"))
+	assert LastKeyCount() == 1 # the merged shape key
+
+def test_split_and_merge_all_pairs(scene, engine):
+	obj = CreateObject()
+	fakebpy.RunOperator(GetOperator("wm.shape_key_tools_split_all_pairs"), opt_run_async=True)
+	assert LastKeyCount() == 4 # AL, AR, CL, CR
+	
+	fakebpy.RunOperator(GetOperator("wm.shape_key_tools_smartmerge_all_pairs"), opt_run_async=True)
+	assert LastKeyCount() == 3 # AL+AR, BL+BR, CL+CR
+
+@pytest.mark.parametrize("mode", ["copy", "move"])
+def test_split_by_filter(scene, mode):
+	obj = CreateObject()
+	scene.shape_key_tools_props.opt_global_enable_filterverts = True
+	scene.shape_key_tools_props.getEnabledVertexFilterParams = lambda: {"VertexGroupIndex": "0"}
+	fakebpy.RunOperator(GetOperator("wm.shape_key_tools_split_by_filter"), opt_mode=mode, opt_new_shape_key_name="Mouth")
+	assert LastKeyCount() == {"copy": 1, "move": 2}[mode]
+
+def test_combine_two(scene):
+	obj = CreateObject()
+	scene.shape_key_tools_props.opt_global_enable_filterverts = False
+	fakebpy.RunOperator(GetOperator("wm.shape_key_tools_combine_two"), opt_shape_key_1="1", opt_shape_key_2="2", opt_output="new", opt_output_newname="Combined", opt_blend_mode="add", opt_delete_shapekey1_on_finish=False, opt_delete_shapekey2_on_finish=False)
+	assert LastKeyCount() == 1
+	assert "Combined" in obj.data.shape_keys.key_blocks
@@ -0,0 +1,27 @@
+# Checks that the "Profile Operators" addon preference profiles a whole operator run, from invoke() to its last modal() event
+
+import pstats
+
+import numpy as np
+
+import fakebpy
+from conftest import GetOperator
+
+
+def test_profile_covers_invoke_execute_and_modal(scene, tmp_path):
+	prefs = fakebpy.context.user_preferences.addons["shape_key_tools"].preferences
+	prefs.opt_profile_ops = True
+	prefs.opt_profile_dir = str(tmp_path)
+	prefs.opt_profile_top_count = 3
+	try:
+		basis = np.random.RandomState(0).uniform(-1, 1, (3000, 3))
+		fakebpy.CreateMeshObject("Face", basis, [("AL+AR", basis + 0.1), ("BL+BR", basis + 0.2)])
+		fakebpy.RunOperator(GetOperator("wm.shape_key_tools_split_all_pairs"), useInvoke=True, opt_run_async=True)
+	finally:
+		prefs.opt_profile_ops = False
+	
+	# One profile for the whole run, even though invoke() calls execute() itself
+	profiles = list(tmp_path.glob("*.pstats"))
+	assert len(profiles) == 1
+	profiledFunctions = set(function[2] for function in pstats.Stats(str(profiles[0])).stats)
+	assert set(["invoke", "execute", "modal"]) <= profiledFunctions
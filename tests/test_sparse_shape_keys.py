@@ -0,0 +1,115 @@
+# Checks that Apply Modifiers skips shape keys that move no verts, and shares one evaluation of the modifiers between sparse shape keys that move different verts (opt_skip_unchanged)
+
+import types
+
+import pytest
+import numpy as np
+
+import fakebpy
+from shape_key_tools import core, common
+from conftest import GetOperator, KeyCoords
+
+
+ApplyModifiers = "wm.shape_key_tools_apply_modifiers_to_shape_keys"
+
+
+#
+#====================================================================================================
+#    core
+#====================================================================================================
+#
+
+def test_find_affected_verts():
+	basis = np.zeros((10, 3), dtype=np.float32)
+	coords = basis.copy()
+	coords[[2, 7], 1] = 0.5
+	coords[4, 2] = -1e-6
+	np.testing.assert_array_equal(core.FindAffectedVerts(basis, coords), [2, 4, 7])
+	assert len(core.FindAffectedVerts(basis, basis.copy())) == 0
+
+def test_pack_disjoint_shape_keys_shares_groups():
+	affectedVerts = [np.array([0, 1]), np.array([2, 3]), np.array([4]), np.array([5, 6, 7])]
+	assert core.PackDisjointShapeKeys(8, affectedVerts) == [[0, 1, 2, 3]]
+
+def test_pack_disjoint_shape_keys_splits_overlapping():
+	affectedVerts = [np.array([0, 1]), np.array([1, 2]), np.array([3]), np.array([2, 4])]
+	assert core.PackDisjointShapeKeys(5, affectedVerts) == [[0, 2, 3], [1]]
+
+def test_pack_disjoint_shape_keys_evicts_old_groups():
+	# Three shape keys that all move vert 0 start three groups, and a shape key that moves vert 1 joins the oldest group that is still open
+	affectedVerts = [np.array([0]), np.array([0]), np.array([0]), np.array([1])]
+	assert core.PackDisjointShapeKeys(2, affectedVerts) == [[0, 3], [1], [2]]
+	assert core.PackDisjointShapeKeys(2, affectedVerts, maxOpenGroups=2) == [[0], [1, 3], [2]]
+
+
+#
+#====================================================================================================
+#    Apply Modifiers
+#====================================================================================================
+#
+
+### Stand-in for a local modifier that is not linear, so that the linear fast path can't be used
+def LocalDeform(coords):
+	return coords + np.sin(coords * 3.0) * 0.25
+
+### Creates an object with six sparse shape keys that move different verts, a seventh that moves some of the same verts as the first, a shape key that moves every vert, and one that moves none
+def CreateSparseObject():
+	rng = np.random.RandomState(31)
+	basis = rng.uniform(-1, 1, (200, 3)).astype(np.float32)
+	shapeKeys = []
+	for i in range(6):
+		coords = basis.copy()
+		coords[i * 5:i * 5 + 5] += rng.normal(0, 0.1, (5, 3)).astype(np.float32)
+		shapeKeys.append(("Sparse" + str(i), coords))
+	coords = basis.copy()
+	coords[2:8] += 0.05
+	shapeKeys.append(("Overlapping", coords))
+	shapeKeys.append(("Dense", basis + rng.normal(0, 0.1, basis.shape).astype(np.float32)))
+	shapeKeys.append(("Rest", basis.copy()))
+	obj = fakebpy.CreateMeshObject("Body", basis, shapeKeys)
+	obj.modifiers.new("Deform", "LATTICE", deform=LocalDeform)
+	return obj
+
+### Counts how many times the modifiers are evaluated in full, for the duration of the test
+class CountingEvaluations(object):
+	def __init__(self, monkeypatch):
+		self.Calls = 0
+		evaluateModifiers = common.EvaluateModifiers
+		def countingEvaluateModifiers(*args, **kwargs):
+			self.Calls += 1
+			return evaluateModifiers(*args, **kwargs)
+		monkeypatch.setattr(common, "EvaluateModifiers", countingEvaluateModifiers)
+
+@pytest.mark.parametrize("skipUnchanged", [True, False])
+def test_apply_modifiers_to_sparse_shape_keys(scene, engine, monkeypatch, skipUnchanged):
+	obj = CreateSparseObject()
+	originals = [KeyCoords(obj, keyBlock.name) for keyBlock in obj.data.shape_keys.key_blocks]
+	evaluations = CountingEvaluations(monkeypatch)
+	
+	fakebpy.RunOperator(GetOperator(ApplyModifiers), opt_modifiers=[types.SimpleNamespace(name="Deform", do_apply=True)], opt_skip_unchanged=skipUnchanged)
+	
+	# Same result as evaluating the modifiers on every shape key
+	for (keyBlock, coords) in zip(obj.data.shape_keys.key_blocks, originals):
+		np.testing.assert_allclose(keyBlock.data._co, LocalDeform(coords), atol=1e-5)
+	
+	if (not skipUnchanged):
+		assert evaluations.Calls == 9
+	elif (engine == "numpy"):
+		# One evaluation for the six disjoint sparse shape keys, and one each for the overlapping and dense shape keys
+		assert evaluations.Calls == 3
+	else:
+		# The legacy engine only skips the shape key that moves no verts
+		assert evaluations.Calls == 8
+
+def test_apply_nonlocal_modifiers_to_sparse_shape_keys(scene, monkeypatch):
+	obj = CreateSparseObject()
+	obj.modifiers["Deform"].type = "SMOOTH"
+	originals = [KeyCoords(obj, keyBlock.name) for keyBlock in obj.data.shape_keys.key_blocks]
+	evaluations = CountingEvaluations(monkeypatch)
+	
+	fakebpy.RunOperator(GetOperator(ApplyModifiers), opt_modifiers=[types.SimpleNamespace(name="Deform", do_apply=True)])
+	
+	# Modifiers that look at the rest of the mesh can't share evaluations, but the shape key that moves no verts is still skipped
+	assert evaluations.Calls == 8
+	for (keyBlock, coords) in zip(obj.data.shape_keys.key_blocks, originals):
+		np.testing.assert_allclose(keyBlock.data._co, LocalDeform(coords), atol=1e-5)
@@ -0,0 +1,81 @@
+# Checks the trace files that the batch operators write when SHAPE_KEY_TOOLS_TRACE_DIR is set
+
+import json, types
+
+import pytest
+import numpy as np
+
+import fakebpy
+from shape_key_tools import common
+from conftest import GetOperator
+
+
+### Creates an object with pairs to split, and a modifier to apply
+def CreateObject():
+	rng = np.random.RandomState(51)
+	basis = rng.uniform(-1, 1, (1500, 3)).astype(np.float32)
+	obj = fakebpy.CreateMeshObject("Face", basis, [(name, basis + rng.normal(0, 0.1, basis.shape).astype(np.float32)) for name in ("AL+AR", "BL+BR", "C")])
+	obj.modifiers.new("Wobble", "CAST", deform=lambda coords: coords + np.sin(coords * 3.0) * 0.25)
+	return obj
+
+def RunSplitAllPairs():
+	fakebpy.RunOperator(GetOperator("wm.shape_key_tools_split_all_pairs"), opt_run_async=True)
+
+def RunMergeAllPairs():
+	RunSplitAllPairs()
+	fakebpy.RunOperator(GetOperator("wm.shape_key_tools_smartmerge_all_pairs"), opt_run_async=True)
+
+def RunApplyModifiers():
+	fakebpy.RunOperator(GetOperator("wm.shape_key_tools_apply_modifiers_to_shape_keys"), opt_modifiers=[types.SimpleNamespace(name="Wobble", do_apply=True)])
+
+### Checks that the complete ("X") events on each thread nest properly, like the begin/end pairs they stand for
+def CheckNesting(events):
+	for tid in set(event["tid"] for event in events):
+		open = [] # end times of the enclosing spans
+		for event in sorted((e for e in events if e["tid"] == tid), key=lambda e: (e["ts"], -e["dur"])):
+			while (len(open) > 0 and open[-1] <= event["ts"]):
+				open.pop()
+			end = event["ts"] + event["dur"]
+			if (len(open) > 0):
+				assert end <= open[-1], "'" + event["name"] + "' overlaps the end of the span around it"
+			open.append(end)
+
+
+# The categories of the spans inside the modal events that each run must have
+@pytest.mark.parametrize("run,opName,workCategories", [
+	(RunSplitAllPairs, "Split All Paired Shape Keys", ["kernel", "bpy.ops"]),
+	(RunMergeAllPairs, "Smart Merge All Shape Keys", ["kernel", "bpy.ops"]),
+	(RunApplyModifiers, "Apply Modifiers To Shape Keys", ["bpy", "bpy.ops"]),
+])
+def test_trace_file(scene, tmp_path, monkeypatch, run, opName, workCategories):
+	CreateObject()
+	monkeypatch.setenv("SHAPE_KEY_TOOLS_TRACE_DIR", str(tmp_path))
+	run()
+	
+	traceFiles = [path for path in tmp_path.glob("*.json") if json.loads(path.read_text())["otherData"]["operator"] == opName]
+	assert len(traceFiles) == 1
+	with open(str(traceFiles[0]), "r") as f:
+		trace = json.load(f)
+	
+	events = trace["traceEvents"]
+	assert len(events) > 0
+	for event in events:
+		assert event["ph"] == "X"
+		assert set(["name", "cat", "ts", "dur", "pid", "tid"]) <= set(event)
+		assert event["dur"] >= 0
+	CheckNesting(events)
+	
+	# Every modal event, the pacing idles between them, and the work inside them
+	categories = set(event["cat"] for event in events)
+	assert set(["modal", "idle"] + workCategories) <= categories
+	modalSpans = [event for event in events if event["cat"] == "modal"]
+	idleSpans = [event for event in events if event["cat"] == "idle"]
+	assert len(idleSpans) == len(modalSpans) - 1
+	assert common.ActiveTrace == None
+
+def test_no_trace_file_without_trace_dir(scene, tmp_path, monkeypatch):
+	CreateObject()
+	monkeypatch.delenv("SHAPE_KEY_TOOLS_TRACE_DIR", raising=False)
+	monkeypatch.chdir(tmp_path)
+	RunSplitAllPairs()
+	assert list(tmp_path.iterdir()) == []
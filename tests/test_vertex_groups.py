@@ -0,0 +1,26 @@
+# Checks that operators see vertex group edits that were made after an earlier run read the object's vertex groups
+
+import numpy as np
+
+import fakebpy
+from conftest import GetOperator, KeyCoords
+
+
+def test_split_by_filter_sees_vertex_group_edits(scene, engine):
+	rng = np.random.RandomState(5)
+	basis = rng.uniform(-1, 1, (50, 3)).astype(np.float32)
+	obj = fakebpy.CreateMeshObject("Face", basis, [("Smile", basis + 0.1)], [("Mouth", range(10), 1.0)])
+	scene.shape_key_tools_props.opt_global_enable_filterverts = True
+	scene.shape_key_tools_props.getEnabledVertexFilterParams = lambda: {"VertexGroupIndex": "0"}
+	splitByFilter = GetOperator("wm.shape_key_tools_split_by_filter")
+	
+	fakebpy.RunOperator(splitByFilter, opt_mode="copy", opt_new_shape_key_name="First")
+	moved = np.any(KeyCoords(obj, "First") != basis, axis=1)
+	assert moved.sum() == 10
+	
+	# Assigning more verts to the group changes neither the mesh nor the vertex group names
+	obj.active_shape_key_index = 1
+	obj.vertex_groups["Mouth"].add(range(10, 30), 1.0, "REPLACE")
+	fakebpy.RunOperator(splitByFilter, opt_mode="copy", opt_new_shape_key_name="Second")
+	moved = np.any(KeyCoords(obj, "Second") != basis, axis=1)
+	assert moved.sum() == 30
@@ -0,0 +1,414 @@
+# ////////////////////////////////////////////////////////////////////////////////////////////////////
+# //
+# //    Shape Key Tools Benchmark
+# //    - Times the shape key kernels on synthetic meshes and key sets at several scales
+# //    - Runs outside of Blender with any python 3 + numpy
+# //    - The common_* benchmarks run the Blender-facing functions in common.py on top of tools/fakebpy.py, including their bpy.ops calls
+# //
+# //    Usage:
+# //      python tools/benchmark.py                              (quick preset, results to benchmark.json)
+# //      python tools/benchmark.py --preset full -o full.json   (1k to 2M verts, 1 to 2000 keys)
+# //      python tools/benchmark.py --verts 1000 50000 --keys 1 100 --kernels pair_split blend_add
+# //      python tools/benchmark.py --kernels common_split_all --op-call-cost 0.0005   (charge a simulated cost for every bpy.ops call)
+# //      python tools/benchmark.py --compare old.json new.json  (compare the results of two runs, e.g. from two commits)
+# //
+# ////////////////////////////////////////////////////////////////////////////////////////////////////
+
+import sys, os, time, json, math, argparse, platform, subprocess, tracemalloc, importlib.util
+
+import numpy as np
+
+RepoDir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+### Loads shape_key_tools/core.py by file path, since importing the shape_key_tools package would import bpy
+def LoadCore():
+	spec = importlib.util.spec_from_file_location("shape_key_tools_core", os.path.join(RepoDir, "shape_key_tools", "core.py"))
+	module = importlib.util.module_from_spec(spec)
+	spec.loader.exec_module(module)
+	return module
+
+core = LoadCore()
+
+
+#
+#====================================================================================================
+#    Synthetic data
+#====================================================================================================
+#
+
+Presets = {
+	"quick": {
+		"verts": [1000, 10000, 100000],
+		"keys": [1, 10],
+	},
+	"full": {
+		"verts": [1000, 10000, 100000, 500000, 2000000],
+		"keys": [1, 10, 100, 2000],
+	},
+}
+
+# Number of distinct shape keys generated for each case. Cases with more keys than this cycle through them, so that 2000 keys on a 2M vert mesh do not need 48GB of memory.
+KeyPoolSize = 4
+
+### A synthetic mesh: basis vertex positions, a pool of shape keys, and vertex group membership
+# Params:
+# - vertCount: Number of verts
+# - seed: Random seed. The same vertCount and seed always give the same mesh.
+class SyntheticMesh():
+	def __init__(self, vertCount, seed=0):
+		rng = np.random.RandomState(seed)
+		self.VertCount = vertCount
+		
+		# Verts spread evenly around the origin, with a column of verts exactly on the split axis (like the center line of a symmetrical face)
+		self.BasisCoords = rng.uniform(-1.0, 1.0, (vertCount, 3)).astype(np.float32)
+		self.BasisCoords[::50, 0] = 0
+		
+		# Each shape key moves a random region of the mesh, like a typical facial expression shape key
+		self.KeyPool = []
+		for i in range(KeyPoolSize):
+			center = rng.uniform(-0.5, 0.5, 3).astype(np.float32)
+			distances = np.sqrt(np.einsum("ij,ij->i", self.BasisCoords - center, self.BasisCoords - center))
+			falloff = np.clip(1.0 - (distances / 0.8), 0.0, 1.0)[:, None]
+			deltas = rng.normal(0, 0.05, (vertCount, 3)).astype(np.float32) * falloff
+			self.KeyPool.append(self.BasisCoords + deltas)
+		
+		# Two vertex groups: the +X half of the mesh, and a random 10% of verts
+		halfVerts = np.nonzero(self.BasisCoords[:, 0] > 0)[0]
+		randomVerts = np.nonzero(rng.uniform(0, 1, vertCount) < 0.1)[0]
+		groups = np.concatenate((np.zeros(len(halfVerts), dtype=np.int32), np.ones(len(randomVerts), dtype=np.int32)))
+		vertIndices = np.concatenate((halfVerts, randomVerts))
+		order = np.argsort(vertIndices, kind="mergesort")
+		self.Groups = groups[order]
+		self.GroupVertIndices = vertIndices[order]
+		self.GroupWeights = np.ones(len(order), dtype=np.float32)
+	
+	### Gets the shape key to use for key number i of a case
+	def GetKey(self, i):
+		return self.KeyPool[i % len(self.KeyPool)]
+	
+	### Builds a core.VertexGroupCSR of the mesh's vertex groups
+	def BuildGroupIndex(self):
+		return core.VertexGroupCSR(self.VertCount, 2, self.Groups, self.GroupVertIndices, self.GroupWeights)
+
+
+
+#
+#====================================================================================================
+#    Kernels
+#====================================================================================================
+#
+
+# Vertex filter parameters used by the filter_split benchmarks. Same dictionary format as the ops build from the Vertex Filter panel.
+FilterParams = {
+	"DeltaDistanceMin": 0.01,
+	"VertexGroupIndex": "0",
+}
+
+# Each core kernel benchmark is a function(mesh, keyCount, engine) that does the same work an op does for keyCount shape keys: the per-batch setup once, then the per-key kernel keyCount times
+# The core kernels are numpy only. The per-vertex loops of the legacy engine work on shape key data, so they are timed by the common_* benchmarks below.
+
+def BenchPairSplit(mesh, keyCount, engine):
+	basisCoords = mesh.BasisCoords
+	rightWeights = core.ComputePairSplitWeights(basisCoords, "+X", 0.1)[:, None]
+	for i in range(keyCount):
+		core.SplitPairCoords(basisCoords, mesh.GetKey(i), rightWeights)
+
+def BenchPairMerge(mesh, keyCount, engine, mode):
+	basisCoords = mesh.BasisCoords
+	rightSideMask = core.ComputeRightSideMask(basisCoords, "+X")
+	for i in range(keyCount):
+		core.MergePairCoords(basisCoords, mesh.GetKey(i), mesh.GetKey(i + 1), rightSideMask, mode)
+
+def BenchBlend(mesh, keyCount, engine, blendMode):
+	blendModeParams = {"Factor": 0.5}
+	basisCoords = mesh.BasisCoords
+	for i in range(keyCount):
+		core.BlendCoords(basisCoords, mesh.GetKey(i), mesh.GetKey(i + 1), blendMode, blendModeParams)
+
+def BenchFilterSplit(mesh, keyCount, engine):
+	basisCoords = mesh.BasisCoords
+	groupIndex = mesh.BuildGroupIndex()
+	filterMask = core.CreateVertexFilterMaskKernel(FilterParams)
+	for i in range(keyCount):
+		sourceCoords = mesh.GetKey(i)
+		core.FilterSplitCoords(basisCoords, sourceCoords, filterMask(sourceCoords - basisCoords, groupIndex), "move")
+
+
+
+#
+#====================================================================================================
+#    Blender-facing functions
+#====================================================================================================
+#
+
+# The common.py functions, running on tools/fakebpy.py instead of Blender. These include the cost of reading and writing shape keys and of the bpy.ops calls for adding, removing, and moving shape keys.
+# Each benchmark is a function(mesh, keyCount, engine) that builds a fake mesh object for the case and returns a function which does the timed work
+
+fakebpy = None
+common = None
+
+### Installs tools/fakebpy.py as bpy and imports shape_key_tools.common on top of it. Only done if a Blender-facing benchmark is run.
+def LoadCommon():
+	global fakebpy, common
+	if (common == None):
+		sys.path.insert(0, os.path.join(RepoDir, "tools"))
+		sys.path.insert(0, RepoDir)
+		import fakebpy
+		fakebpy.Install()
+		from shape_key_tools import common
+
+### Creates a fake mesh object from the synthetic mesh, with a shape key for every name in shapeKeyNames and the +X half of the mesh in vertex group 0
+def CreateFakeObject(mesh, shapeKeyNames):
+	LoadCommon()
+	fakebpy.Reset()
+	shapeKeys = [(name, mesh.GetKey(i)) for (i, name) in enumerate(shapeKeyNames)]
+	halfVerts = mesh.GroupVertIndices[mesh.Groups == 0]
+	obj = fakebpy.CreateMeshObject("Mesh", mesh.BasisCoords, shapeKeys, [("Half", halfVerts, 1.0)])
+	return obj
+
+def BenchCommonSplitAll(mesh, keyCount, engine):
+	obj = CreateFakeObject(mesh, ["K" + str(i) + "L+K" + str(i) + "R" for i in range(keyCount)])
+	def run():
+		splitBatch = common.PairSplitBatch(obj, "+X", 0.1, engine)
+		for i in range(keyCount):
+			splitBatch.SplitShapeKey("K" + str(i) + "L+K" + str(i) + "R", "K" + str(i) + "L", "K" + str(i) + "R")
+		splitBatch.Finish()
+	return run
+
+def BenchCommonMergeAll(mesh, keyCount, engine):
+	names = []
+	for i in range(keyCount):
+		names.extend(["K" + str(i) + "L", "K" + str(i) + "R"])
+	obj = CreateFakeObject(mesh, names)
+	def run():
+		mergeBatch = common.PairMergeBatch(obj, "+X", "overwrite", engine)
+		mergeBatch.MergePairs([("K" + str(i) + "L", "K" + str(i) + "R", "K" + str(i) + "L+K" + str(i) + "R") for i in range(keyCount)])
+		mergeBatch.Finish()
+	return run
+
+def BenchCommonBlend(mesh, keyCount, engine):
+	obj = CreateFakeObject(mesh, ["K" + str(i) for i in range(keyCount + 1)])
+	def run():
+		for i in range(keyCount):
+			common.MergeAndBlendShapeKeys(obj, "K" + str(i), "K" + str(i + 1), 1, "lerp", {"Factor": 0.5}, FilterParams, engine=engine)
+	return run
+
+def BenchCommonFilterSplit(mesh, keyCount, engine):
+	obj = CreateFakeObject(mesh, ["K" + str(i) for i in range(keyCount)])
+	def run():
+		for i in range(keyCount):
+			obj.active_shape_key_index = obj.data.shape_keys.key_blocks.find("K" + str(i))
+			common.SplitFilterActiveShapeKey(obj, "K" + str(i) + "_Split", "move", FilterParams, engine=engine)
+	return run
+
+
+
+#
+#====================================================================================================
+#    Benchmarks
+#====================================================================================================
+#
+
+### Turns a core kernel benchmark into a function(mesh, keyCount, engine) that returns the function to time, like the Blender-facing benchmarks
+def TimeWhole(bench, *extraArgs):
+	return lambda mesh, keyCount, engine: (lambda: bench(mesh, keyCount, engine, *extraArgs))
+
+CoreEngines = ("numpy",)
+CommonEngines = ("numpy", "legacy")
+Engines = ["numpy", "legacy"]
+
+# Benchmark name -> (engines it can run with, function(mesh, keyCount, engine) that prepares the case and returns the function to time)
+Kernels = {
+	"pair_split": (CoreEngines, TimeWhole(BenchPairSplit)),
+	"pair_merge_overwrite": (CoreEngines, TimeWhole(BenchPairMerge, "overwrite")),
+	"pair_merge_additive": (CoreEngines, TimeWhole(BenchPairMerge, "additive")),
+	"filter_split": (CoreEngines, TimeWhole(BenchFilterSplit)),
+	"common_split_all": (CommonEngines, BenchCommonSplitAll),
+	"common_merge_all": (CommonEngines, BenchCommonMergeAll),
+	"common_blend": (CommonEngines, BenchCommonBlend),
+	"common_filter_split": (CommonEngines, BenchCommonFilterSplit),
+}
+for blendMode in sorted(core.BlendModeFunctions.keys()):
+	Kernels["blend_" + blendMode] = (CoreEngines, TimeWhole(BenchBlend, blendMode))
+
+
+
+#
+#====================================================================================================
+#    Running
+#====================================================================================================
+#
+
+### Times one kernel + engine on one mesh for keyCount keys
+# Returns (seconds, peakMemoryBytes, opCalls). Time is the best of `repeat` runs. Peak memory is measured with tracemalloc in a separate run, since tracing slows the kernels down.
+# opCalls is the number of fake bpy.ops calls of each type made by one run, or None for the core kernels
+def RunCase(prepare, mesh, keyCount, engine, repeat, measureMemory):
+	seconds = None
+	opCalls = None
+	for i in range(repeat):
+		run = prepare(mesh, keyCount, engine)
+		if (fakebpy != None):
+			fakebpy.ResetOpCallCounts()
+		start = time.perf_counter()
+		run()
+		elapsed = time.perf_counter() - start
+		if (seconds == None or elapsed < seconds):
+			seconds = elapsed
+		if (fakebpy != None and len(fakebpy.OpCallCounts) > 0):
+			opCalls = dict(fakebpy.OpCallCounts)
+	
+	peakMemory = None
+	if (measureMemory):
+		run = prepare(mesh, min(keyCount, KeyPoolSize), engine) # peak memory does not grow with the key count, since every key's results are dropped before the next key
+		tracemalloc.start()
+		run()
+		peakMemory = tracemalloc.get_traced_memory()[1]
+		tracemalloc.stop()
+	
+	return (seconds, peakMemory, opCalls)
+
+### Fits the exponent k of time ~ verts^k for each kernel + engine + key count from the results
+# ~1.0 is linear scaling. Noticeably more than 1 means something is worse than linear in the vertex count.
+def ComputeScaling(results):
+	series = {}
+	for result in results:
+		if (result["seconds"] == None):
+			continue
+		series.setdefault((result["kernel"], result["engine"], result["keys"]), []).append((result["verts"], result["seconds"]))
+	
+	scaling = []
+	for ((kernel, engine, keyCount), points) in sorted(series.items()):
+		if (len(points) < 2):
+			continue
+		logVerts = np.log([p[0] for p in points])
+		logSeconds = np.log([max(p[1], 1e-9) for p in points])
+		exponent = float(np.polyfit(logVerts, logSeconds, 1)[0])
+		scaling.append({"kernel": kernel, "engine": engine, "keys": keyCount, "exponent": round(exponent, 3), "points": [[v, s] for (v, s) in points]})
+	return scaling
+
+### Gets the current git commit of the repo, or None if git is not available
+def GetCommit():
+	try:
+		return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=RepoDir, stderr=subprocess.DEVNULL).decode("ascii").strip()
+	except Exception:
+		return None
+
+def Run(args):
+	vertCounts = args.verts or Presets[args.preset]["verts"]
+	keyCounts = args.keys or Presets[args.preset]["keys"]
+	kernelNames = args.kernels or sorted(Kernels.keys())
+	engines = args.engines or Engines
+	
+	for name in kernelNames:
+		if (not name in Kernels):
+			raise SystemExit("Unknown kernel '" + name + "'. Available kernels: " + ", ".join(sorted(Kernels.keys())))
+	
+	results = []
+	for vertCount in vertCounts:
+		mesh = SyntheticMesh(vertCount, args.seed)
+		for keyCount in keyCounts:
+			for name in kernelNames:
+				(kernelEngines, prepare) = Kernels[name]
+				for engine in engines:
+					if (not engine in kernelEngines):
+						continue
+					result = {"kernel": name, "engine": engine, "verts": vertCount, "keys": keyCount, "seconds": None, "secondsPerKey": None, "vertsPerSecond": None, "peakMemoryBytes": None, "opCalls": None, "skipped": None}
+					
+					# The full preset would take days with the per-vertex python loops, so big cases are skipped for them
+					# The Blender-facing benchmarks keep every shape key of the case in memory, so they are limited too
+					maxWork = args.max_work
+					if (engine != "numpy"):
+						maxWork = min(maxWork, args.legacy_max_work)
+					if (name.startswith("common_")):
+						maxWork = min(maxWork, args.common_max_work)
+					if (vertCount * keyCount > maxWork):
+						result["skipped"] = "verts * keys > " + str(int(maxWork))
+					else:
+						(seconds, peakMemory, opCalls) = RunCase(prepare, mesh, keyCount, engine, args.repeat, not args.no_memory)
+						result["seconds"] = seconds
+						result["secondsPerKey"] = seconds / keyCount
+						result["vertsPerSecond"] = (vertCount * keyCount) / max(seconds, 1e-9)
+						result["peakMemoryBytes"] = peakMemory
+						result["opCalls"] = opCalls
+					results.append(result)
+					
+					line = "{:<22} {:<10} {:>8} verts {:>5} keys  ".format(name, engine, vertCount, keyCount)
+					if (result["skipped"]):
+						line += "skipped (" + result["skipped"] + ")"
+					else:
+						line += "{:10.4f}s  {:12.0f} verts/s".format(result["seconds"], result["vertsPerSecond"])
+						if (result["peakMemoryBytes"] != None):
+							line += "  {:8.1f} MB peak".format(result["peakMemoryBytes"] / 1048576.0)
+						if (result["opCalls"] != None):
+							line += "  " + str(sum(result["opCalls"].values())) + " bpy.ops calls"
+					print(line)
+					sys.stdout.flush()
+	
+	report = {
+		"format": 2,
+		"commit": GetCommit(),
+		"time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+		"python": platform.python_version(),
+		"numpy": np.__version__,
+		"platform": platform.platform(),
+		"seed": args.seed,
+		"repeat": args.repeat,
+		"results": results,
+		"scaling": ComputeScaling(results),
+	}
+	with open(args.output, "w") as f:
+		json.dump(report, f, indent=1)
+	print("Results written to " + args.output)
+
+### Prints the speed ratio of every case that appears in both result files
+def Compare(oldPath, newPath):
+	with open(oldPath) as f:
+		old = json.load(f)
+	with open(newPath) as f:
+		new = json.load(f)
+	
+	def caseKey(result):
+		return (result["kernel"], result["engine"], result["verts"], result["keys"])
+	oldResults = {caseKey(r): r for r in old["results"] if r["seconds"] != None}
+	
+	print("old: " + str(old.get("commit")) + "  new: " + str(new.get("commit")))
+	print("{:<22} {:<10} {:>8} {:>5}  {:>10} {:>10}  {:>7}".format("kernel", "engine", "verts", "keys", "old (s)", "new (s)", "speedup"))
+	for result in new["results"]:
+		oldResult = oldResults.get(caseKey(result))
+		if (oldResult == None or result["seconds"] == None):
+			continue
+		speedup = oldResult["seconds"] / max(result["seconds"], 1e-9)
+		flag = ""
+		if (speedup < 1.0 / 1.1):
+			flag = "  SLOWER"
+		print("{:<22} {:<10} {:>8} {:>5}  {:10.4f} {:10.4f}  {:6.2f}x{}".format(result["kernel"], result["engine"], result["verts"], result["keys"], oldResult["seconds"], result["seconds"], speedup, flag))
+
+def Main(argv=None):
+	parser = argparse.ArgumentParser(description="Benchmarks the Shape Key Tools shape key kernels on synthetic meshes")
+	parser.add_argument("--preset", choices=sorted(Presets.keys()), default="quick", help="Vertex and key counts to run (overridden by --verts and --keys)")
+	parser.add_argument("--verts", type=int, nargs="+", help="Vertex counts of the synthetic meshes")
+	parser.add_argument("--keys", type=int, nargs="+", help="Numbers of shape keys to process per case")
+	parser.add_argument("--kernels", nargs="+", help="Kernels to run (default: all). Available: " + ", ".join(sorted(Kernels.keys())))
+	parser.add_argument("--engines", nargs="+", choices=Engines, help="Engines to run (default: all)")
+	parser.add_argument("--repeat", type=int, default=3, help="Runs per case. The best time is kept.")
+	parser.add_argument("--seed", type=int, default=0, help="Random seed for the synthetic meshes")
+	parser.add_argument("--max-work", type=float, default=4e9, help="Skip cases where verts * keys is larger than this")
+	parser.add_argument("--legacy-max-work", type=float, default=2e6, help="Skip legacy engine cases where verts * keys is larger than this")
+	parser.add_argument("--common-max-work", type=float, default=2e7, help="Skip Blender-facing (common_*) cases where verts * keys is larger than this")
+	parser.add_argument("--op-call-cost", type=float, default=0.0, help="Simulated seconds per bpy.ops call in the Blender-facing benchmarks (see fakebpy.OpCallCost)")
+	parser.add_argument("--no-memory", action="store_true", help="Do not measure peak memory")
+	parser.add_argument("-o", "--output", default="benchmark.json", help="File to write the results to")
+	parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="Compare two result files instead of running the benchmarks")
+	args = parser.parse_args(argv)
+	
+	if (args.op_call_cost > 0):
+		LoadCommon()
+		fakebpy.OpCallCost = args.op_call_cost
+	
+	if (args.compare):
+		Compare(args.compare[0], args.compare[1])
+	else:
+		Run(args)
+
+if __name__ == "__main__":
+	Main()
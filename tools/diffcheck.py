@@ -0,0 +1,328 @@
+# ////////////////////////////////////////////////////////////////////////////////////////////////////
+# //
+# //    Shape Key Tools Differential Check
+# //    - Runs the Blender-facing functions in common.py with the numpy kernel engine and with the original per-vertex loops of the legacy engine on tools/fakebpy.py, and checks that they produce the same shape keys
+# //    - Also checks the numpy vertex filter against the per-vertex filter kernel on randomly generated meshes and parameters
+# //
+# //    Usage:
+# //      python tools/diffcheck.py                       (500 vertex filter cases + 50 common.py cases)
+# //      python tools/diffcheck.py --cases 5000 --seed 7
+# //      python tools/diffcheck.py --only 123            (rerun just the case with seed 123, e.g. one that failed)
+# //      python -m pytest tests/test_engines_agree.py     (the default cases, as tests)
+# //
+# ////////////////////////////////////////////////////////////////////////////////////////////////////
+
+import sys, os, argparse, traceback, importlib.util
+
+import numpy as np
+
+RepoDir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+### Loads shape_key_tools/core.py by file path, since importing the shape_key_tools package would import bpy
+def LoadCore():
+	spec = importlib.util.spec_from_file_location("shape_key_tools_core", os.path.join(RepoDir, "shape_key_tools", "core.py"))
+	module = importlib.util.module_from_spec(spec)
+	spec.loader.exec_module(module)
+	return module
+
+core = LoadCore()
+
+Axes = ["+X", "-X", "+Y", "-Y", "+Z", "-Z"]
+BlendModes = sorted(core.BlendModeFunctions.keys())
+
+# The numpy kernels work on float32 deltas while the fake mathutils.Vector does its math on python floats, so results are compared with a small tolerance
+Tolerance = {"rtol": 1e-5, "atol": 1e-5}
+# Dividing by a tiny delta component magnifies the float32 rounding of that component
+DivideTolerance = {"rtol": 1e-3, "atol": 1e-4}
+
+
+#
+#====================================================================================================
+#    Random cases
+#====================================================================================================
+#
+
+### A random mesh and random parameters for every kernel
+# Everything is derived from the seed, so any failing case can be rerun with --only <seed>
+# The mesh always includes the edge cases the kernels must agree on: verts exactly on the split axis (as 0 and -0), verts exactly on the edges of the smoothing band, zero deltas, and deltas with zero components
+class RandomCase():
+	def __init__(self, seed):
+		rng = np.random.RandomState(seed)
+		self.Seed = seed
+		
+		self.Axis = Axes[rng.randint(len(Axes))]
+		self.SmoothDistance = [0.0, 0.0, float(rng.uniform(0.001, 0.5)), float(rng.uniform(0.5, 3.0))][rng.randint(4)]
+		(axis, axisFlip) = core.GetSplitAxis(self.Axis)
+		
+		n = int(rng.randint(1, 400))
+		self.VertCount = n
+		self.BasisCoords = rng.uniform(-2.0, 2.0, (n, 3)).astype(np.float32)
+		special = rng.uniform(0, 1, n)
+		self.BasisCoords[special < 0.08, axis] = 0.0
+		self.BasisCoords[(special >= 0.08) & (special < 0.12), axis] = -0.0
+		self.BasisCoords[(special >= 0.12) & (special < 0.16), axis] = self.SmoothDistance
+		self.BasisCoords[(special >= 0.16) & (special < 0.2), axis] = -self.SmoothDistance
+		
+		self.KeyCoords = [self.RandomKey(rng) for i in range(3)]
+		
+		self.BlendMode = BlendModes[rng.randint(len(BlendModes))]
+		self.BlendModeParams = {"Factor": float(rng.uniform(-0.5, 1.5))} # out of range factors are clamped by both engines
+		self.MergeMode = ["overwrite", "additive"][rng.randint(2)]
+		self.SplitMode = ["copy", "move"][rng.randint(2)]
+		
+		# Vertex groups: 3 groups with random membership
+		self.NumGroups = 3
+		self.VertGroups = [[g for g in range(self.NumGroups) if rng.uniform(0, 1) < 0.4] for i in range(n)]
+		
+		# Random subset of the vertex filter conditions
+		self.FilterParams = {}
+		if (rng.uniform(0, 1) < 0.5):
+			self.FilterParams["DeltaDistanceMin"] = float(rng.uniform(0, 0.3))
+		if (rng.uniform(0, 1) < 0.5):
+			self.FilterParams["DeltaDistanceMax"] = float(rng.uniform(0.2, 1.0))
+		if (rng.uniform(0, 1) < 0.5):
+			self.FilterParams["VertexGroupIndex"] = str(rng.randint(self.NumGroups + 1)) # may name a vertex group that no vert belongs to
+	
+	def RandomKey(self, rng):
+		deltas = rng.normal(0, 0.3, (self.VertCount, 3)).astype(np.float32)
+		deltas[rng.uniform(0, 1, self.VertCount) < 0.15] = 0 # verts the shape key does not move
+		deltas[rng.uniform(0, 1, (self.VertCount, 3)) < 0.1] = 0 # zero delta components, e.g. for the divide blend mode
+		return self.BasisCoords + deltas
+	
+	def BuildGroupIndex(self):
+		groups = []
+		vertIndices = []
+		for (vertIndex, vgIndices) in enumerate(self.VertGroups):
+			for g in vgIndices:
+				groups.append(g)
+				vertIndices.append(vertIndex)
+		return core.VertexGroupCSR(self.VertCount, self.NumGroups, groups, vertIndices, [1.0] * len(groups))
+	
+	def Describe(self):
+		return "seed=" + str(self.Seed) + " verts=" + str(self.VertCount) + " axis=" + self.Axis + " smooth=" + str(self.SmoothDistance) + " blend=" + self.BlendMode + " " + str(self.BlendModeParams) + " merge=" + self.MergeMode + " split=" + self.SplitMode + " filter=" + str(self.FilterParams)
+
+### Raises an AssertionError describing the worst mismatch if the two coord arrays differ by more than the tolerance
+def AssertCoordsClose(what, numpyCoords, referenceCoords, tolerance=Tolerance, ignoreVerts=None):
+	numpyCoords = np.asarray(numpyCoords, dtype=np.float64)
+	referenceCoords = np.asarray(referenceCoords, dtype=np.float64).reshape(numpyCoords.shape)
+	close = np.isclose(numpyCoords, referenceCoords, **tolerance).all(axis=1)
+	if (ignoreVerts is not None):
+		close |= ignoreVerts
+	if (not close.all()):
+		i = int(np.nonzero(~close)[0][0])
+		raise AssertionError(what + ": " + str(int((~close).sum())) + " verts differ, first is vert " + str(i) + ": numpy " + str(numpyCoords[i].tolist()) + " vs reference " + str(referenceCoords[i].tolist()))
+
+### Finds the verts whose delta length is so close to a delta distance threshold that float32 vs float64 rounding may put them on either side of it
+def AmbiguousFilterVerts(case, deltas):
+	lengths = np.sqrt(np.einsum("ij,ij->i", deltas.astype(np.float64), deltas.astype(np.float64)))
+	ambiguous = np.zeros(len(deltas), dtype=bool)
+	for param in ("DeltaDistanceMin", "DeltaDistanceMax"):
+		if (param in case.FilterParams):
+			ambiguous |= np.abs(lengths - case.FilterParams[param]) < 1e-5
+	return ambiguous
+
+
+
+#
+#====================================================================================================
+#    Core kernel checks
+#====================================================================================================
+#
+
+def CheckVertexFilter(case):
+	deltas = case.KeyCoords[1] - case.BasisCoords
+	mask = core.CreateVertexFilterMaskKernel(case.FilterParams)(deltas, case.BuildGroupIndex())
+	vertexFilterKernel = core.CreateVertexFilterKernel(case.FilterParams)
+	refMask = np.array([vertexFilterKernel(vgIndices, delta) for (delta, vgIndices) in zip(deltas.tolist(), case.VertGroups)], dtype=bool)
+	differ = (mask != refMask) & ~AmbiguousFilterVerts(case, deltas)
+	if (differ.any()):
+		i = int(np.nonzero(differ)[0][0])
+		raise AssertionError("vertex filter: " + str(int(differ.sum())) + " verts differ, first is vert " + str(i) + ": numpy " + str(bool(mask[i])) + " vs per-vertex " + str(bool(refMask[i])))
+
+CoreChecks = [CheckVertexFilter]
+
+
+
+#
+#====================================================================================================
+#    common.py checks
+#====================================================================================================
+#
+
+fakebpy = None
+common = None
+
+### Installs tools/fakebpy.py as bpy (unless it already is, i.e. under pytest) and imports shape_key_tools.common on top of it
+def LoadCommon():
+	global fakebpy, common
+	if (common == None):
+		sys.path.insert(0, os.path.join(RepoDir, "tools"))
+		sys.path.insert(0, RepoDir)
+		import fakebpy
+		if (not "bpy" in sys.modules):
+			fakebpy.Install()
+		from shape_key_tools import common
+
+### Builds a fake mesh object for the case with the given shape keys, runs func(obj) on it, and returns the resulting (shape key names, shape key coords, active index, relative key names)
+def RunOnFakeObject(case, shapeKeys, func):
+	fakebpy.Reset()
+	vertexGroups = [("Group" + str(g), [i for (i, vgIndices) in enumerate(case.VertGroups) if g in vgIndices], 1.0) for g in range(case.NumGroups)]
+	obj = fakebpy.CreateMeshObject("Mesh", case.BasisCoords, shapeKeys, vertexGroups)
+	func(obj)
+	keyBlocks = obj.data.shape_keys.key_blocks
+	return (
+		[k.name for k in keyBlocks],
+		[k.data._co.copy() for k in keyBlocks],
+		obj.active_shape_key_index,
+		[k.relative_key.name for k in keyBlocks],
+	)
+
+### Runs func(obj, engine) with both engines and checks that they leave the object's shape keys in the same state
+# The legacy engine runs the original per-vertex loops, so this checks the numpy engine against the behaviour from before it existed
+def CheckEnginesAgree(case, what, shapeKeys, func, tolerance=Tolerance, ignoreVerts=None):
+	(names, coords, activeIndex, relativeKeys) = RunOnFakeObject(case, shapeKeys, lambda obj: func(obj, "numpy"))
+	(refNames, refCoords, refActiveIndex, refRelativeKeys) = RunOnFakeObject(case, shapeKeys, lambda obj: func(obj, "legacy"))
+	if (names != refNames):
+		raise AssertionError(what + ": shape key order differs: numpy " + str(names) + " vs legacy " + str(refNames))
+	if (activeIndex != refActiveIndex):
+		raise AssertionError(what + ": active shape key differs: numpy " + str(activeIndex) + " vs legacy " + str(refActiveIndex))
+	if (relativeKeys != refRelativeKeys):
+		raise AssertionError(what + ": relative keys differ: numpy " + str(relativeKeys) + " vs legacy " + str(refRelativeKeys))
+	for (name, a, b) in zip(names, coords, refCoords):
+		AssertCoordsClose(what + " shape key '" + name + "'", a, b, tolerance, ignoreVerts)
+
+def CheckCommonPairSplit(case):
+	shapeKeys = [("AL+AR", case.KeyCoords[0]), ("Other", case.KeyCoords[1]), ("B", case.KeyCoords[2])]
+	def split(obj, engine):
+		# The legacy loop starts both halves from the shape key mix, which is the shape key being split only when it is shown alone
+		obj.show_only_shape_key = True
+		obj.active_shape_key_index = 1
+		common.SplitPairActiveShapeKey(obj, case.Axis, "AL", "AR", case.SmoothDistance, True, engine=engine)
+		obj.active_shape_key_index = obj.data.shape_keys.key_blocks.find("B")
+		batch = common.PairSplitBatch(obj, case.Axis, case.SmoothDistance, engine)
+		batch.SplitShapeKey("B", "BL", "BR", deleteOriginal=False)
+		batch.Finish()
+	CheckEnginesAgree(case, "SplitPairActiveShapeKey + PairSplitBatch", shapeKeys, split)
+
+def CheckCommonPairMerge(case):
+	shapeKeys = [("AR", case.KeyCoords[0]), ("Other", case.KeyCoords[2]), ("AL", case.KeyCoords[1]), ("BL", case.KeyCoords[2]), ("BR", case.KeyCoords[0])]
+	def merge(obj, engine):
+		common.MergeShapeKeyPair(obj, case.Axis, "AL", "AR", "AL+AR", case.MergeMode, engine=engine)
+		batch = common.PairMergeBatch(obj, case.Axis, case.MergeMode, engine)
+		batch.MergePairs([("BL", "BR", "BL+BR")], deleteInputShapeKeys=False)
+		batch.Finish()
+	CheckEnginesAgree(case, "MergeShapeKeyPair + PairMergeBatch", shapeKeys, merge)
+
+def CheckCommonBlend(case):
+	shapeKeys = [("Lower", case.KeyCoords[0]), ("Upper", case.KeyCoords[1]), ("Other", case.KeyCoords[2])]
+	tolerance = Tolerance
+	if (case.BlendMode == "divide"):
+		tolerance = DivideTolerance
+	upperDeltas = case.KeyCoords[1] - case.BasisCoords
+	ignoreVerts = AmbiguousFilterVerts(case, upperDeltas)
+	for destination in (1, 2, "Blended"):
+		def blend(obj, engine):
+			common.MergeAndBlendShapeKeys(obj, "Lower", "Upper", destination, case.BlendMode, case.BlendModeParams, case.FilterParams, delete1OnFinish=(destination == 2), engine=engine)
+		what = "MergeAndBlendShapeKeys (destination " + str(destination) + ")"
+		
+		# The legacy loop multiplies and divides with mathutils' Vector * Vector (a dot product) and Vector / Vector, which fail with a TypeError in Blender 2.79 as soon as one vert is blended
+		# The numpy engine multiplies and divides per component instead, so it is checked against that directly
+		vertsPassFilter = core.CreateVertexFilterMaskKernel(case.FilterParams)(upperDeltas, case.BuildGroupIndex())
+		if (case.BlendMode in ("multiply", "divide") and (vertsPassFilter & ~ignoreVerts).any()):
+			try:
+				RunOnFakeObject(case, shapeKeys, lambda obj: blend(obj, "legacy"))
+			except TypeError:
+				pass
+			else:
+				raise AssertionError(what + ": the legacy " + case.BlendMode + " blend mode did not raise a TypeError")
+			(names, coords, activeIndex, relativeKeys) = RunOnFakeObject(case, shapeKeys, lambda obj: blend(obj, "numpy"))
+			destinationName = {1: "Lower", 2: "Upper"}.get(destination, destination)
+			AssertCoordsClose(what + " shape key '" + destinationName + "'", coords[names.index(destinationName)], ExpectedPerComponentBlend(case, destination, vertsPassFilter), tolerance, ignoreVerts)
+			continue
+		
+		CheckEnginesAgree(case, what, shapeKeys, blend, tolerance, ignoreVerts)
+
+### Computes the destination shape key of the numpy engine's per component multiply or divide blend, in float64
+def ExpectedPerComponentBlend(case, destination, vertsPassFilter):
+	basis = case.BasisCoords.astype(np.float64)
+	lowerDeltas = case.KeyCoords[0] - basis
+	upperDeltas = case.KeyCoords[1] - basis
+	if (case.BlendMode == "multiply"):
+		blended = basis + (lowerDeltas * upperDeltas)
+	else:
+		zeroDivisor = (upperDeltas == 0)
+		blended = basis + np.where(zeroDivisor, lowerDeltas, lowerDeltas / np.where(zeroDivisor, 1, upperDeltas))
+	destinationCoords = {1: case.KeyCoords[0], 2: case.KeyCoords[1]}.get(destination, case.BasisCoords)
+	return np.where(vertsPassFilter[:, None], blended, destinationCoords)
+
+def CheckCommonFilterSplit(case):
+	shapeKeys = [("Source", case.KeyCoords[0]), ("Other", case.KeyCoords[1])]
+	ignoreVerts = AmbiguousFilterVerts(case, case.KeyCoords[0] - case.BasisCoords)
+	def split(obj, engine):
+		obj.active_shape_key_index = 1
+		common.SplitFilterActiveShapeKey(obj, "Source__SPLIT", case.SplitMode, case.FilterParams, engine=engine)
+	CheckEnginesAgree(case, "SplitFilterActiveShapeKey", shapeKeys, split, Tolerance, ignoreVerts)
+
+CommonChecks = [CheckCommonPairSplit, CheckCommonPairMerge, CheckCommonBlend, CheckCommonFilterSplit]
+
+
+
+#
+#====================================================================================================
+#    Running
+#====================================================================================================
+#
+
+### Runs every check on one case. Returns a list of failure descriptions.
+def RunCase(seed, checks):
+	case = RandomCase(seed)
+	failures = []
+	for check in checks:
+		try:
+			check(case)
+		except Exception:
+			failures.append(check.__name__ + " [" + case.Describe() + "]\n" + traceback.format_exc())
+	return failures
+
+def Main(argv=None):
+	parser = argparse.ArgumentParser(description="Checks that the numpy kernel engine and the per-vertex loops of the legacy engine agree on random inputs")
+	parser.add_argument("--cases", type=int, default=500, help="Number of random cases for the vertex filter")
+	parser.add_argument("--common-cases", type=int, default=50, help="Number of random cases for the common.py functions (0 to skip them)")
+	parser.add_argument("--seed", type=int, default=0, help="Seed of the first case. Case i uses seed + i.")
+	parser.add_argument("--only", type=int, help="Run only the case with this seed")
+	parser.add_argument("--max-failures", type=int, default=10, help="Stop after this many failing cases")
+	args = parser.parse_args(argv)
+	
+	if (args.common_cases > 0 or args.only != None):
+		LoadCommon()
+	
+	runs = []
+	if (args.only != None):
+		runs.append((args.only, CoreChecks + CommonChecks))
+	else:
+		for i in range(max(args.cases, args.common_cases)):
+			checks = []
+			if (i < args.cases):
+				checks += CoreChecks
+			if (i < args.common_cases):
+				checks += CommonChecks
+			runs.append((args.seed + i, checks))
+	
+	failedCases = 0
+	ranCases = 0
+	for (seed, checks) in runs:
+		ranCases += 1
+		failures = RunCase(seed, checks)
+		if (len(failures) > 0):
+			failedCases += 1
+			for failure in failures:
+				print("FAIL " + failure)
+			if (failedCases >= args.max_failures):
+				print("Stopping after " + str(failedCases) + " failing cases")
+				break
+	
+	print(str(ranCases) + " cases, " + str(failedCases) + " failed")
+	return (1 if failedCases > 0 else 0)
+
+if __name__ == "__main__":
+	sys.exit(Main())
@@ -0,0 +1,1053 @@
+# ////////////////////////////////////////////////////////////////////////////////////////////////////
+# //
+# //    Fake bpy
+# //    - In-process stand-in for the parts of Blender's python API that Shape Key Tools uses
+# //    - Lets common.py and the operators in ops/ run (and be profiled) on plain python + numpy
+# //
+# //    Usage:
+# //      import fakebpy
+# //      fakebpy.Install()                                  (before anything imports bpy)
+# //      from shape_key_tools import common
+# //      obj = fakebpy.CreateMeshObject("Face", basisCoords, [("SmileL+SmileR", smileCoords)])
+# //      common.SplitPairActiveShapeKey(obj, "+X", "SmileL", "SmileR")
+# //      fakebpy.RunOperator(SomeOperatorClass, opt_run_async=True)   (runs execute() then pumps modal() to completion)
+# //
+# ////////////////////////////////////////////////////////////////////////////////////////////////////
+
+import sys, types, math, time
+
+import numpy as np
+
+
+#
+#====================================================================================================
+#    Operator call cost model
+#====================================================================================================
+#
+
+# Every call to a fake bpy.ops operator is counted here, by operator id (e.g. "object.shape_key_move")
+OpCallCounts = {}
+
+# Simulated wall time (in seconds) spent per bpy.ops call. Real Blender pays for context setup, notifier dispatch, and depsgraph tagging on every operator call, which the fake does not.
+# Leave this at 0 for correctness tests. Set it to something like 0.0005 to get a more realistic picture of how much a kernel relies on operator calls.
+OpCallCost = 0.0
+
+def ResetOpCallCounts():
+	OpCallCounts.clear()
+
+def _CountOpCall(opId):
+	OpCallCounts[opId] = OpCallCounts.get(opId, 0) + 1
+	if (OpCallCost > 0):
+		end = time.perf_counter() + OpCallCost
+		while (time.perf_counter() < end):
+			pass
+
+
+
+#
+#====================================================================================================
+#    mathutils
+#====================================================================================================
+#
+
+class Vector(object):
+	__slots__ = ("_v",)
+	
+	def __init__(self, seq=(0.0, 0.0, 0.0)):
+		self._v = [float(c) for c in seq]
+	
+	def __len__(self):
+		return len(self._v)
+	def __iter__(self):
+		return iter(self._v)
+	def __getitem__(self, i):
+		return self._v[i]
+	def __setitem__(self, i, value):
+		self._v[i] = float(value)
+	def __repr__(self):
+		return "Vector((" + ", ".join("%.4f" % c for c in self._v) + "))"
+	def __eq__(self, other):
+		return isinstance(other, Vector) and self._v == other._v
+	
+	x = property(lambda self: self._v[0], lambda self, value: self.__setitem__(0, value))
+	y = property(lambda self: self._v[1], lambda self, value: self.__setitem__(1, value))
+	z = property(lambda self: self._v[2], lambda self, value: self.__setitem__(2, value))
+	
+	def __add__(self, other):
+		return Vector(a + b for (a, b) in zip(self._v, other))
+	def __sub__(self, other):
+		return Vector(a - b for (a, b) in zip(self._v, other))
+	def __neg__(self):
+		return Vector(-a for a in self._v)
+	def __mul__(self, other):
+		if (isinstance(other, Vector)): # Blender 2.79 semantics: Vector * Vector is the dot product
+			return sum(a * b for (a, b) in zip(self._v, other._v))
+		return Vector(a * other for a in self._v)
+	__rmul__ = __mul__
+	def __truediv__(self, other):
+		if (isinstance(other, Vector)):
+			raise TypeError("Vector division: (Vector / Vector) invalid type for this operation")
+		return Vector(a / other for a in self._v)
+	
+	@property
+	def length(self):
+		return math.sqrt(sum(a * a for a in self._v))
+	
+	def lerp(self, other, factor):
+		return Vector((a * (1.0 - factor)) + (b * factor) for (a, b) in zip(self._v, other))
+	
+	def copy(self):
+		return Vector(self._v)
+
+class Matrix(object):
+	def __init__(self, rows=None):
+		if (rows is None):
+			rows = np.identity(4)
+		self._m = np.array(rows, dtype=np.float64)
+	
+	@classmethod
+	def Identity(cls, size):
+		return cls(np.identity(size))
+	
+	def inverted(self):
+		return Matrix(np.linalg.inv(self._m))
+	
+	def __mul__(self, other):
+		if (isinstance(other, Matrix)):
+			return Matrix(np.dot(self._m, other._m))
+		v = np.ones(4)
+		v[:3] = list(other)
+		return Vector(np.dot(self._m, v)[:3])
+	
+	def __iter__(self):
+		return iter([list(row) for row in self._m])
+	def __getitem__(self, i):
+		return list(self._m[i])
+	def __len__(self):
+		return len(self._m)
+
+
+
+#
+#====================================================================================================
+#    bpy.props and bpy.types
+#====================================================================================================
+#
+
+### bpy.props.*Property() stand-in
+# Blender turns these into RNA properties when the owning class is registered. The fake turns them into plain class-level defaults, which instances can then override as normal attributes.
+def _MakePropertyFunc(kind, fallbackDefault):
+	def prop(**kwargs):
+		if ("default" in kwargs):
+			return kwargs["default"]
+		if (kind == "EnumProperty"):
+			items = kwargs.get("items")
+			if (isinstance(items, (list, tuple)) and len(items) > 0):
+				return items[0][0]
+			return ""
+		if (kind == "CollectionProperty"):
+			return _FakeCollection()
+		if (kind == "PointerProperty"):
+			return kwargs.get("type")
+		return fallbackDefault
+	prop.__name__ = kind
+	return prop
+
+class _FakeCollection(list):
+	def add(self):
+		item = types.SimpleNamespace()
+		self.append(item)
+		return item
+	def clear(self):
+		del self[:]
+
+class bpy_struct(object):
+	pass
+
+class Operator(bpy_struct):
+	bl_idname = ""
+	bl_label = ""
+	bl_options = set()
+	
+	def report(self, type, message):
+		context.window_manager.reports.append((set(type), message))
+
+class PropertyGroup(bpy_struct):
+	pass
+
+class Panel(bpy_struct):
+	pass
+
+class AddonPreferences(bpy_struct):
+	pass
+
+class SpaceView3D(object):
+	@staticmethod
+	def draw_handler_add(*args):
+		return object()
+	@staticmethod
+	def draw_handler_remove(*args):
+		pass
+
+
+
+#
+#====================================================================================================
+#    Data
+#====================================================================================================
+#
+
+### Common base for collections that are backed by a (n, 3) float32 "co" array
+class _CoCollection(object):
+	def __init__(self, co):
+		self._co = co
+	
+	def __len__(self):
+		return len(self._co)
+	
+	def foreach_get(self, attr, seq):
+		if (attr != "co"):
+			raise AttributeError("Fake bpy only supports foreach_get('co')")
+		if (len(seq) != self._co.size):
+			raise RuntimeError("internal error setting the array")
+		seq[:] = self._co.ravel()
+	
+	def foreach_set(self, attr, seq):
+		if (attr != "co"):
+			raise AttributeError("Fake bpy only supports foreach_set('co')")
+		if (len(seq) != self._co.size):
+			raise RuntimeError("internal error setting the array")
+		self._co[:] = np.asarray(seq, dtype=np.float32).reshape(-1, 3)
+
+class _CoElement(object):
+	__slots__ = ("_owner", "index")
+	
+	def __init__(self, owner, index):
+		self._owner = owner
+		self.index = index
+	
+	@property
+	def co(self):
+		return Vector(self._owner._co[self.index])
+	@co.setter
+	def co(self, value):
+		self._owner._co[self.index] = tuple(value)
+
+
+class ShapeKeyPoint(_CoElement):
+	__slots__ = ()
+
+class ShapeKeyData(_CoCollection):
+	def __getitem__(self, i):
+		if (i < 0):
+			i += len(self)
+		if (i < 0 or i >= len(self)):
+			raise IndexError("bpy_prop_collection[index]: index out of range")
+		return ShapeKeyPoint(self, i)
+	def __iter__(self):
+		return (ShapeKeyPoint(self, i) for i in range(len(self)))
+
+
+class VertexGroupElement(object):
+	__slots__ = ("group", "weight")
+	
+	def __init__(self, group, weight):
+		self.group = group
+		self.weight = weight
+
+class MeshVertex(_CoElement):
+	__slots__ = ()
+	
+	@property
+	def groups(self):
+		return self._owner._groups[self.index]
+
+class MeshVertices(_CoCollection):
+	def __init__(self, co):
+		_CoCollection.__init__(self, co)
+		self._groups = [[] for i in range(len(co))]
+	def __getitem__(self, i):
+		if (i < 0):
+			i += len(self)
+		if (i < 0 or i >= len(self)):
+			raise IndexError("bpy_prop_collection[index]: index out of range")
+		return MeshVertex(self, i)
+	def __iter__(self):
+		return (MeshVertex(self, i) for i in range(len(self)))
+
+
+### Ordered, name-addressable collection (key_blocks, vertex_groups, modifiers, bpy.data.objects)
+class _NamedCollection(object):
+	def __init__(self):
+		self._items = []
+	
+	def __len__(self):
+		return len(self._items)
+	def __iter__(self):
+		return iter(list(self._items))
+	def __getitem__(self, key):
+		if (isinstance(key, str)):
+			for item in self._items:
+				if (item.name == key):
+					return item
+			raise KeyError("bpy_prop_collection[key]: key \"" + key + "\" not found")
+		return self._items[key]
+	def __contains__(self, name):
+		return any(item.name == name for item in self._items)
+	def keys(self):
+		return [item.name for item in self._items]
+	def values(self):
+		return list(self._items)
+	def items(self):
+		return [(item.name, item) for item in self._items]
+	def get(self, name, default=None):
+		for item in self._items:
+			if (item.name == name):
+				return item
+		return default
+	def find(self, name):
+		for (i, item) in enumerate(self._items):
+			if (item.name == name):
+				return i
+		return -1
+	
+	# Blender-style unique naming (Name, Name.001, Name.002, ...)
+	def _UniqueName(self, name, exclude=None):
+		existing = set(item.name for item in self._items if item is not exclude)
+		if (not name in existing):
+			return name
+		i = 1
+		while True:
+			candidate = name + "." + "{:03d}".format(i)
+			if (not candidate in existing):
+				return candidate
+			i += 1
+
+
+class ShapeKey(object):
+	def __init__(self, owner, name, co):
+		self._owner = owner
+		self._name = name
+		self.data = ShapeKeyData(co)
+		self.relative_key = self
+		self.value = 0.0
+		self.slider_min = 0.0
+		self.slider_max = 1.0
+		self.mute = False
+		self.vertex_group = ""
+		self.interpolation = "KEY_LINEAR"
+	
+	@property
+	def name(self):
+		return self._name
+	@name.setter
+	def name(self, value):
+		self._name = self._owner.key_blocks._UniqueName(value, exclude=self)
+	
+	def __repr__(self):
+		return "<ShapeKey '" + self._name + "'>"
+
+class KeyBlocks(_NamedCollection):
+	pass
+
+class Key(object):
+	def __init__(self, user):
+		self.user = user
+		self.key_blocks = KeyBlocks()
+		self.use_relative = True
+	
+	@property
+	def reference_key(self):
+		return self.key_blocks._items[0] if len(self.key_blocks) > 0 else None
+
+
+class VertexGroup(object):
+	def __init__(self, obj, name, index):
+		self._obj = obj
+		self.name = name
+		self.index = index
+	
+	def add(self, index, weight, type):
+		groups = self._obj.data.vertices._groups
+		for i in index:
+			for vge in groups[i]:
+				if (vge.group == self.index):
+					vge.weight = (weight if type == "REPLACE" else vge.weight + weight)
+					break
+			else:
+				groups[i].append(VertexGroupElement(self.index, weight))
+	
+	def weight(self, index):
+		for vge in self._obj.data.vertices._groups[index]:
+			if (vge.group == self.index):
+				return vge.weight
+		raise RuntimeError("Error: Vertex not in group")
+
+class VertexGroups(_NamedCollection):
+	def __init__(self, obj):
+		_NamedCollection.__init__(self)
+		self._obj = obj
+	
+	def new(self, name="Group"):
+		vg = VertexGroup(self._obj, self._UniqueName(name), len(self._items))
+		self._items.append(vg)
+		return vg
+	
+	@property
+	def active_index(self):
+		return len(self._items) - 1
+
+
+class Mesh(object):
+	def __init__(self, name, coords):
+		self.name = name
+		self.vertices = MeshVertices(np.array(coords, dtype=np.float32).reshape(-1, 3))
+		self.shape_keys = None
+	
+	# Number of objects that use this mesh (linked duplicates share one)
+	@property
+	def users(self):
+		return sum(1 for obj in data.objects._items if obj.data is self)
+	
+	def copy(self):
+		newMesh = Mesh(self.name, self.vertices._co.copy())
+		newMesh.vertices._groups = [[VertexGroupElement(vge.group, vge.weight) for vge in groups] for groups in self.vertices._groups]
+		if (self.shape_keys != None):
+			newMesh.shape_keys = Key(newMesh)
+			mapping = {}
+			for keyBlock in self.shape_keys.key_blocks:
+				newKeyBlock = ShapeKey(newMesh.shape_keys, keyBlock.name, keyBlock.data._co.copy())
+				for attr in ("value", "slider_min", "slider_max", "mute", "vertex_group", "interpolation"):
+					setattr(newKeyBlock, attr, getattr(keyBlock, attr))
+				newMesh.shape_keys.key_blocks._items.append(newKeyBlock)
+				mapping[keyBlock] = newKeyBlock
+			for keyBlock in self.shape_keys.key_blocks:
+				mapping[keyBlock].relative_key = mapping.get(keyBlock.relative_key, mapping[self.shape_keys.key_blocks[0]])
+		return newMesh
+	
+	# Blender recalculates the normals and tags the mesh for redraw. The fake has neither.
+	def update(self, calc_edges=False, calc_tessface=False):
+		pass
+
+
+# Blender's defaults for the type-specific modifier settings that the addon reads
+ModifierSettingDefaults = {
+	"ARMATURE": {"object": None, "use_vertex_groups": True, "use_bone_envelopes": False, "use_deform_preserve_volume": False, "use_multi_modifier": False, "vertex_group": "", "invert_vertex_group": False},
+	"DISPLACE": {"direction": "NORMAL"},
+	"WAVE": {"use_normal": False},
+}
+
+### Modifier stand-in
+# deform(coords) is a python callable which takes and returns a (n, 3) float array. It stands in for Blender's own modifier evaluation.
+class Modifier(object):
+	def __init__(self, name, type, deform=None):
+		self.name = name
+		self.type = type
+		self.show_viewport = True
+		self.show_render = True
+		self.deform = deform
+		for (attr, value) in ModifierSettingDefaults.get(type, {}).items():
+			setattr(self, attr, value)
+	
+	def copySettings(self, other):
+		self.show_viewport = other.show_viewport
+		self.show_render = other.show_render
+		for attr in ModifierSettingDefaults.get(self.type, {}):
+			setattr(self, attr, getattr(other, attr))
+	
+	# RNA descriptions of the settings above, so that they can be enumerated like in Blender
+	@property
+	def bl_rna(self):
+		properties = []
+		for attr in ["name", "type", "show_viewport", "show_render"] + sorted(ModifierSettingDefaults.get(self.type, {})):
+			propType = "POINTER" if (attr == "object") else ("BOOLEAN" if isinstance(getattr(self, attr), bool) else "STRING")
+			properties.append(types.SimpleNamespace(identifier=attr, type=propType, is_array=False))
+		return types.SimpleNamespace(properties=properties)
+	
+	def Evaluate(self, coords):
+		if (self.deform == None):
+			raise RuntimeError("Error: Modifier is disabled, skipping apply")
+		return np.asarray(self.deform(np.array(coords, dtype=np.float64)), dtype=np.float32)
+
+class ObjectModifiers(_NamedCollection):
+	def new(self, name, type, deform=None):
+		modifier = Modifier(self._UniqueName(name), type, deform)
+		self._items.append(modifier)
+		return modifier
+	
+	def remove(self, modifier):
+		self._items.remove(modifier)
+
+
+class Object(object):
+	def __init__(self, name, data):
+		self.name = name
+		self.type = "MESH"
+		self.data = data
+		self.active_shape_key_index = 0
+		self.show_only_shape_key = False
+		self.select = False
+		self.hide = False
+		self.vertex_groups = VertexGroups(self)
+		self.modifiers = ObjectModifiers()
+		self.matrix_world = Matrix.Identity(4)
+	
+	def __repr__(self):
+		return "<Object '" + self.name + "'>"
+	
+	@property
+	def active_shape_key(self):
+		if (self.data.shape_keys == None or len(self.data.shape_keys.key_blocks) == 0):
+			return None
+		return self.data.shape_keys.key_blocks[min(self.active_shape_key_index, len(self.data.shape_keys.key_blocks) - 1)]
+	
+	### Evaluates the relative shape key mix, like Blender does for from_mix=True
+	def _EvaluateShapeKeyMix(self):
+		keyBlocks = self.data.shape_keys.key_blocks
+		if (self.show_only_shape_key):
+			return self.active_shape_key.data._co.copy()
+		mix = keyBlocks[0].data._co.astype(np.float64)
+		for keyBlock in keyBlocks._items[1:]:
+			if (keyBlock.mute or keyBlock.value == 0):
+				continue
+			weights = keyBlock.value
+			if (keyBlock.vertex_group != ""):
+				vg = self.vertex_groups[keyBlock.vertex_group]
+				weights = np.zeros(len(mix))
+				for (i, groups) in enumerate(self.data.vertices._groups):
+					for vge in groups:
+						if (vge.group == vg.index):
+							weights[i] = vge.weight * keyBlock.value
+				weights = weights[:, None]
+			mix += (keyBlock.data._co - keyBlock.relative_key.data._co) * weights
+		return mix.astype(np.float32)
+	
+	def shape_key_add(self, name="Key", from_mix=True):
+		mesh = self.data
+		if (mesh.shape_keys == None):
+			mesh.shape_keys = Key(mesh)
+		keyBlocks = mesh.shape_keys.key_blocks
+		if (len(keyBlocks) == 0 or from_mix == False):
+			co = mesh.vertices._co.copy()
+		else:
+			co = self._EvaluateShapeKeyMix()
+		keyBlock = ShapeKey(mesh.shape_keys, keyBlocks._UniqueName(name), co)
+		if (len(keyBlocks) > 0):
+			keyBlock.relative_key = keyBlocks[0]
+		keyBlocks._items.append(keyBlock)
+		return keyBlock
+	
+	### Returns an evaluated copy of this object's mesh, like Object.to_mesh(scene, apply_modifiers, settings) in Blender 2.7x
+	def to_mesh(self, scene, apply_modifiers, settings, calc_tessface=True, calc_undeformed=False):
+		coords = self.data.vertices._co.copy()
+		if (self.data.shape_keys != None):
+			coords = self._EvaluateShapeKeyMix()
+		if (apply_modifiers):
+			for modifier in self.modifiers:
+				if ((settings == "PREVIEW" and modifier.show_viewport) or (settings == "RENDER" and modifier.show_render)):
+					coords = modifier.Evaluate(coords)
+		mesh = data.meshes.new(self.data.name + "_eval")
+		mesh.vertices = MeshVertices(np.array(coords, dtype=np.float32))
+		return mesh
+
+
+### Armature stand-ins
+# Only what native armature skinning reads: each bone's rest and pose matrices, whether it deforms, and its B-Bone segments
+class Bone(object):
+	def __init__(self, name, matrix_local):
+		self.name = name
+		self.matrix_local = Matrix(matrix_local)
+		self.use_deform = True
+		self.bbone_segments = 1
+
+class PoseBone(object):
+	def __init__(self, bone, matrix):
+		self.bone = bone
+		self.matrix = Matrix(matrix)
+	
+	@property
+	def name(self):
+		return self.bone.name
+
+class Pose(object):
+	def __init__(self):
+		self.bones = _NamedCollection()
+
+class Armature(object):
+	def __init__(self, name):
+		self.name = name
+		self.bones = _NamedCollection()
+
+
+### bpy.data
+class _IDCollection(_NamedCollection):
+	def __init__(self, idType):
+		_NamedCollection.__init__(self)
+		self._idType = idType
+	
+	def remove(self, item, do_unlink=True):
+		self._items.remove(item)
+		if (self._idType == "OBJECT"):
+			for scene in data.scenes:
+				if (item in scene.objects._items):
+					scene.objects._items.remove(item)
+				if (scene.objects.active is item):
+					scene.objects.active = None
+
+class _Meshes(_IDCollection):
+	def new(self, name, coords=()):
+		mesh = Mesh(self._UniqueName(name), coords)
+		self._items.append(mesh)
+		return mesh
+
+class _Objects(_IDCollection):
+	def new(self, name, object_data):
+		obj = Object(self._UniqueName(name), object_data)
+		self._items.append(obj)
+		return obj
+
+
+class SceneObjects(_NamedCollection):
+	def __init__(self):
+		_NamedCollection.__init__(self)
+		self.active = None
+	
+	def link(self, obj):
+		self._items.append(obj)
+
+class Scene(object):
+	def __init__(self, name):
+		self.name = name
+		self.objects = SceneObjects()
+	
+	def update(self):
+		pass
+
+class _Scenes(_IDCollection):
+	def new(self, name):
+		scene = Scene(self._UniqueName(name))
+		self._items.append(scene)
+		return scene
+
+class BlendData(object):
+	def __init__(self):
+		self.filepath = ""
+		self.meshes = _Meshes("MESH")
+		self.objects = _Objects("OBJECT")
+		self.scenes = _Scenes("SCENE")
+
+data = BlendData()
+
+
+
+#
+#====================================================================================================
+#    Context
+#====================================================================================================
+#
+
+class WindowManager(object):
+	def __init__(self):
+		self.reports = []
+		self.progress = None
+		self.progress_range = None
+		self.modal_handlers = []
+		self.timers = []
+		self.clipboard = ""
+		self.operators = [] # only ever empty, since the fake does not keep an operator history
+	
+	def progress_begin(self, min, max):
+		self.progress_range = (min, max)
+		self.progress = min
+	def progress_update(self, value):
+		self.progress = value
+	def progress_end(self):
+		self.progress_range = None
+		self.progress = None
+	
+	def modal_handler_add(self, op):
+		self.modal_handlers.append(op)
+		return True
+	def event_timer_add(self, time_step, window=None):
+		timer = types.SimpleNamespace(time_step=time_step, window=window)
+		self.timers.append(timer)
+		return timer
+	def event_timer_remove(self, timer):
+		if (timer in self.timers):
+			self.timers.remove(timer)
+	def invoke_props_dialog(self, op, width=300, height=20):
+		return {"RUNNING_MODAL"}
+
+# user_preferences.addons: the preferences of an addon are an instance of its AddonPreferences subclass (found by bl_idname), created with default values on first access
+class _Addons(dict):
+	def __missing__(self, name):
+		addon = None
+		for cls in AddonPreferences.__subclasses__():
+			if (getattr(cls, "bl_idname", None) == name):
+				addon = types.SimpleNamespace(module=name, preferences=cls())
+		if (addon == None):
+			raise KeyError(name)
+		self[name] = addon
+		return addon
+
+class Context(object):
+	def __init__(self):
+		self.window_manager = WindowManager()
+		self.window = object()
+		self.screen = None
+		self.area = None
+		self.scene = None
+		self.user_preferences = types.SimpleNamespace(addons=_Addons())
+	
+	@property
+	def object(self):
+		return self.scene.objects.active if self.scene != None else None
+	@property
+	def active_object(self):
+		return self.object
+	
+	def copy(self):
+		return dict(self.__dict__)
+
+context = Context()
+
+
+
+#
+#====================================================================================================
+#    Operators
+#====================================================================================================
+#
+
+### bpy.ops.object.*
+class _ObjectOps(object):
+	@staticmethod
+	def shape_key_add(from_mix=False):
+		_CountOpCall("object.shape_key_add")
+		context.object.shape_key_add(name="Key", from_mix=from_mix)
+		obj = context.object
+		obj.active_shape_key_index = len(obj.data.shape_keys.key_blocks) - 1
+		return {"FINISHED"}
+	
+	@staticmethod
+	def shape_key_remove(all=False):
+		_CountOpCall("object.shape_key_remove")
+		obj = context.object
+		key = obj.data.shape_keys
+		if (key == None):
+			return {"CANCELLED"}
+		if (all):
+			obj.data.shape_keys = None
+			obj.active_shape_key_index = 0
+			return {"FINISHED"}
+		index = obj.active_shape_key_index
+		removed = key.key_blocks._items.pop(index)
+		for keyBlock in key.key_blocks._items:
+			if (keyBlock.relative_key is removed):
+				keyBlock.relative_key = key.key_blocks._items[0] if len(key.key_blocks) > 0 else keyBlock
+		if (index == 0 and len(key.key_blocks) > 0): # new reference key, whose positions become the mesh's positions
+			obj.data.vertices._co[:] = key.key_blocks._items[0].data._co
+		obj.active_shape_key_index = max(0, index - 1)
+		if (len(key.key_blocks) == 0):
+			obj.data.shape_keys = None
+		return {"FINISHED"}
+	
+	@staticmethod
+	def shape_key_move(type="TOP"):
+		_CountOpCall("object.shape_key_move")
+		obj = context.object
+		items = obj.data.shape_keys.key_blocks._items
+		total = len(items)
+		actIndex = obj.active_shape_key_index
+		# Mirrors shape_key_move_exec() in Blender's object_shapekey.c
+		if (type == "TOP"):
+			newIndex = 0 if (actIndex in (0, 1)) else 1
+		elif (type == "BOTTOM"):
+			newIndex = total - 1
+		elif (type == "UP"):
+			newIndex = (total + actIndex - 1) % total
+		elif (type == "DOWN"):
+			newIndex = (actIndex + 1) % total
+		else:
+			raise TypeError("Converting py args to operator properties: enum \"" + str(type) + "\" not found")
+		if (newIndex != actIndex):
+			oldRef = items[0]
+			items.insert(newIndex, items.pop(actIndex))
+			if (items[0] is not oldRef):
+				obj.data.vertices._co[:] = items[0].data._co
+		obj.active_shape_key_index = newIndex
+		return {"FINISHED"}
+	
+	@staticmethod
+	def duplicate(linked=False):
+		_CountOpCall("object.duplicate")
+		scene = context.scene
+		newObjs = []
+		for obj in list(scene.objects):
+			if (obj.select):
+				newMesh = obj.data.copy()
+				data.meshes._items.append(newMesh)
+				newObj = data.objects.new(obj.name, newMesh)
+				newObj.active_shape_key_index = obj.active_shape_key_index
+				for vg in obj.vertex_groups:
+					newObj.vertex_groups._items.append(VertexGroup(newObj, vg.name, vg.index))
+				for modifier in obj.modifiers:
+					newModifier = newObj.modifiers.new(modifier.name, modifier.type, modifier.deform)
+					newModifier.copySettings(modifier)
+				scene.objects.link(newObj)
+				newObjs.append((obj, newObj))
+		for (obj, newObj) in newObjs:
+			obj.select = False
+			newObj.select = True
+			if (scene.objects.active is obj):
+				scene.objects.active = newObj
+		return {"FINISHED"}
+	
+	@staticmethod
+	def delete(use_global=False):
+		_CountOpCall("object.delete")
+		for obj in list(context.scene.objects):
+			if (obj.select):
+				data.objects.remove(obj)
+		return {"FINISHED"}
+	
+	@staticmethod
+	def modifier_apply(apply_as="DATA", modifier=""):
+		_CountOpCall("object.modifier_apply")
+		obj = context.object
+		mod = obj.modifiers.get(modifier)
+		if (mod == None):
+			raise RuntimeError("Error: Modifier '" + modifier + "' not found")
+		if (obj.data.shape_keys != None):
+			raise RuntimeError("Error: Modifier cannot be applied to a mesh with shape keys")
+		obj.data.vertices._co[:] = mod.Evaluate(obj.data.vertices._co)
+		obj.modifiers.remove(mod)
+		return {"FINISHED"}
+	
+	@staticmethod
+	def join_shapes():
+		_CountOpCall("object.join_shapes")
+		target = context.object
+		for obj in list(context.scene.objects):
+			if (obj.select and obj is not target):
+				if (len(obj.data.vertices) != len(target.data.vertices)):
+					raise RuntimeError("Error: Mesh has different number of vertices")
+				keyBlock = target.shape_key_add(name=obj.name, from_mix=False)
+				keyBlock.data._co[:] = obj.data.vertices._co
+		return {"FINISHED"}
+	
+	@staticmethod
+	def make_links_data(type="OBDATA"):
+		_CountOpCall("object.make_links_data")
+		source = context.object
+		for obj in list(context.scene.objects):
+			if (obj.select and obj is not source and type == "MODIFIERS"):
+				obj.modifiers = ObjectModifiers()
+				for modifier in source.modifiers:
+					if (modifier.type in ("HOOK", "COLLISION")): # BKE_object_link_modifiers() skips these
+						continue
+					newModifier = obj.modifiers.new(modifier.name, modifier.type, modifier.deform)
+					newModifier.copySettings(modifier)
+		return {"FINISHED"}
+
+class _OpsNamespace(object):
+	def __init__(self, **categories):
+		for (name, value) in categories.items():
+			setattr(self, name, value)
+
+class _OpCategory(object):
+	def __init__(self, name):
+		self._name = name
+	
+	# Addon operators are registered as e.g. bpy.ops.wm.shape_key_tools_split_active_pair. The fake dispatches these to the registered class.
+	def __getattr__(self, name):
+		bl_idname = self._name + "." + name
+		if (bl_idname in _RegisteredOperators):
+			def call(*args, **kwargs):
+				_CountOpCall(bl_idname)
+				return RunOperator(_RegisteredOperators[bl_idname], **kwargs)
+			return call
+		raise AttributeError("Calling operator \"bpy.ops." + bl_idname + "\" error, could not be found")
+
+ops = _OpsNamespace(object=_ObjectOps(), wm=_OpCategory("wm"), view3d=_OpCategory("view3d"))
+
+
+
+#
+#====================================================================================================
+#    Registration & operator running
+#====================================================================================================
+#
+
+_RegisteredOperators = {}
+
+def register_class(cls):
+	if (getattr(cls, "bl_idname", None)):
+		_RegisteredOperators[cls.bl_idname] = cls
+
+def unregister_class(cls):
+	if (getattr(cls, "bl_idname", None) in _RegisteredOperators):
+		del _RegisteredOperators[cls.bl_idname]
+
+
+### Runs an operator class the way Blender would: invoke/execute, then pumps modal() with TIMER events until it stops
+# Returns the final result set
+def RunOperator(cls, useInvoke=False, maxModalEvents=1000000, **props):
+	op = cls()
+	for (name, value) in props.items():
+		setattr(op, name, value)
+	if (useInvoke and hasattr(op, "invoke")):
+		result = op.invoke(context, types.SimpleNamespace(type="NONE", shift=False, ctrl=False, alt=False))
+	else:
+		result = op.execute(context)
+	wm = context.window_manager
+	events = 0
+	while ("RUNNING_MODAL" in result and op in wm.modal_handlers):
+		events += 1
+		if (events > maxModalEvents):
+			raise RuntimeError("Modal operator did not finish within " + str(maxModalEvents) + " events")
+		result = op.modal(context, types.SimpleNamespace(type="TIMER", value="NOTHING", shift=False, ctrl=False, alt=False))
+		if (not ("RUNNING_MODAL" in result or "PASS_THROUGH" in result)):
+			wm.modal_handlers.remove(op)
+		else:
+			result = {"RUNNING_MODAL"}
+	return result
+
+
+
+#
+#====================================================================================================
+#    Scene setup helpers
+#====================================================================================================
+#
+
+### Resets all fake Blender state and creates an empty scene to work in
+def Reset():
+	global data, context
+	data = BlendData()
+	context = Context()
+	context.scene = data.scenes.new("Scene")
+	ResetOpCallCounts()
+	_module.data = data
+	_module.context = context
+	return context.scene
+
+### Creates a mesh object with a basis shape key and the provided shape keys, links it to the scene, and makes it active
+# Params:
+# - basisCoords: (n, 3) array of vertex positions
+# - shapeKeys: List of (name, (n, 3) array of vertex positions)
+# - vertexGroups: List of (name, list of vert indices, weight)
+def CreateMeshObject(name, basisCoords, shapeKeys=(), vertexGroups=()):
+	mesh = data.meshes.new(name, basisCoords)
+	obj = data.objects.new(name, mesh)
+	context.scene.objects.link(obj)
+	if (len(shapeKeys) > 0):
+		obj.shape_key_add(name="Basis", from_mix=False)
+		for (keyName, coords) in shapeKeys:
+			keyBlock = obj.shape_key_add(name=keyName, from_mix=False)
+			keyBlock.data._co[:] = np.asarray(coords, dtype=np.float32).reshape(-1, 3)
+		obj.active_shape_key_index = 1
+	for (vgName, vertIndices, weight) in vertexGroups:
+		obj.vertex_groups.new(vgName).add(list(vertIndices), weight, "REPLACE")
+	for other in data.objects:
+		other.select = False
+	obj.select = True
+	context.scene.objects.active = obj
+	return obj
+
+### Creates an armature object with the provided bones and links it to the scene, without changing the active object
+# Params:
+# - bones: List of (name, 4x4 rest matrix in armature space, 4x4 pose matrix in armature space)
+# - (optional) matrixWorld: 4x4 world matrix of the armature object
+def CreateArmatureObject(name, bones, matrixWorld=None):
+	armature = Armature(name)
+	obj = data.objects.new(name, armature)
+	obj.type = "ARMATURE"
+	obj.pose = Pose()
+	if (matrixWorld is not None):
+		obj.matrix_world = Matrix(matrixWorld)
+	for (boneName, restMatrix, poseMatrix) in bones:
+		bone = Bone(boneName, restMatrix)
+		armature.bones._items.append(bone)
+		obj.pose.bones._items.append(PoseBone(bone, poseMatrix))
+	context.scene.objects.link(obj)
+	return obj
+
+
+#
+#====================================================================================================
+#    Module installation
+#====================================================================================================
+#
+
+_module = sys.modules[__name__]
+
+### Installs the fake bpy (and mathutils, bgl, blf) into sys.modules so that "import bpy" picks it up
+def Install():
+	Reset()
+	
+	bpyModule = types.ModuleType("bpy")
+	bpyModule.__path__ = []
+	bpyModule.__getattr__ = lambda name: getattr(_module, name) # module-level data/context are reassigned by Reset()
+	
+	propsModule = types.ModuleType("bpy.props")
+	for (kind, fallback) in (("BoolProperty", False), ("IntProperty", 0), ("FloatProperty", 0.0), ("StringProperty", ""), ("EnumProperty", ""), ("FloatVectorProperty", (0.0, 0.0, 0.0)), ("IntVectorProperty", (0, 0, 0)), ("PointerProperty", None), ("CollectionProperty", None)):
+		setattr(propsModule, kind, _MakePropertyFunc(kind, fallback))
+	propsModule.__all__ = [name for name in dir(propsModule) if name.endswith("Property")]
+	
+	typesModule = types.ModuleType("bpy.types")
+	for cls in (bpy_struct, Operator, PropertyGroup, Panel, AddonPreferences, SpaceView3D, Object, Mesh, ShapeKey, Key, Scene):
+		setattr(typesModule, cls.__name__, cls)
+	
+	previewsModule = types.ModuleType("bpy.utils.previews")
+	class _Previews(dict):
+		def load(self, name, path, type):
+			self[name] = types.SimpleNamespace(icon_id=len(self) + 1)
+	previewsModule.new = lambda: _Previews()
+	previewsModule.remove = lambda previews: None
+	
+	utilsModule = types.ModuleType("bpy.utils")
+	utilsModule.__path__ = []
+	utilsModule.previews = previewsModule
+	utilsModule.register_class = register_class
+	utilsModule.unregister_class = unregister_class
+	utilsModule.register_module = lambda module: None
+	utilsModule.unregister_module = lambda module: None
+	
+	handlersModule = types.ModuleType("bpy.app.handlers")
+	handlersModule.persistent = lambda func: func
+	for name in ("load_pre", "load_post", "save_pre", "save_post", "scene_update_pre", "scene_update_post"):
+		setattr(handlersModule, name, [])
+	
+	appModule = types.ModuleType("bpy.app")
+	appModule.__path__ = []
+	appModule.handlers = handlersModule
+	appModule.version = (2, 79, 0)
+	appModule.version_string = "2.79 (sub 0)"
+	appModule.background = True
+	
+	pathModule = types.ModuleType("bpy.path")
+	pathModule.abspath = lambda path: path[2:] if path.startswith("//") else path # there is no blend file, so blend-relative paths are relative to the working directory
+	
+	bpyModule.props = propsModule
+	bpyModule.types = typesModule
+	bpyModule.utils = utilsModule
+	bpyModule.app = appModule
+	bpyModule.path = pathModule
+	bpyModule.ops = ops
+	
+	mathutilsModule = types.ModuleType("mathutils")
+	mathutilsModule.Vector = Vector
+	mathutilsModule.Matrix = Matrix
+	
+	sys.modules["bpy"] = bpyModule
+	sys.modules["bpy.props"] = propsModule
+	sys.modules["bpy.types"] = typesModule
+	sys.modules["bpy.utils"] = utilsModule
+	sys.modules["bpy.utils.previews"] = previewsModule
+	sys.modules["bpy.app"] = appModule
+	sys.modules["bpy.path"] = pathModule
+	sys.modules["bpy.app.handlers"] = handlersModule
+	sys.modules["mathutils"] = mathutilsModule
+	for name in ("bgl", "blf"):
+		sys.modules[name] = types.ModuleType(name)